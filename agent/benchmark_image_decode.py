@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+图片缩小解码基准测试
+对比原有路径（完整解码 -> 摆正方向 -> LANCZOS缩放）与按目标尺寸解码（JPEG draft + reducing_gap）
+的吞吐量和峰值内存（RSS）。每种组合在独立子进程中运行，峰值内存互不影响。
+
+用法:
+    python benchmark_image_decode.py                       # 生成12MP/48MP的JPEG和PNG测试图
+    python benchmark_image_decode.py photo1.jpg photo2.heic --runs 5 --size 1024
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+from tools.lightweight_image_processor import LightweightImageProcessor, EXIF_ORIENTATION_TAG
+
+
+def legacy_downscale(processor: LightweightImageProcessor, path: str, size: Tuple[int, int]) -> Image.Image:
+    """原有路径：完整解码后再缩放"""
+    image = processor.load_image(path)
+    image = processor.auto_orient(image)
+    return processor.resize_image(image, size)
+
+
+def fast_downscale(processor: LightweightImageProcessor, path: str, size: Tuple[int, int]) -> Image.Image:
+    """按目标尺寸解码"""
+    return processor.load_image_for_size(path, size)
+
+
+METHODS = {
+    "legacy": legacy_downscale,
+    "fast": fast_downscale,
+}
+
+
+def _peak_rss_mb() -> float:
+    """进程峰值RSS（MB）"""
+    # Linux下ru_maxrss在execve后保留父进程的峰值，优先读取按地址空间统计的VmHWM
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss在Linux下单位为KB，macOS下为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _measure(method: str, path: str, size: Tuple[int, int], runs: int, results) -> None:
+    """子进程中执行：返回每秒处理张数、峰值RSS增量和输出尺寸"""
+    processor = LightweightImageProcessor()
+    baseline = _peak_rss_mb()
+    started_at = time.perf_counter()
+    output_size = None
+    for _ in range(runs):
+        output_size = METHODS[method](processor, path, size).size
+    elapsed = time.perf_counter() - started_at
+    results.put({
+        "images_per_second": runs / elapsed if elapsed else 0.0,
+        "peak_rss_mb": _peak_rss_mb() - baseline,
+        "output_size": output_size
+    })
+
+
+def run_case(method: str, path: str, size: Tuple[int, int], runs: int) -> Dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(method, path, size, runs, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def make_sample(directory: str, megapixels: float, image_format: str) -> str:
+    """生成带噪点的测试照片；JPEG写入EXIF方向6（需要旋转），覆盖摆正逻辑"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    noise = Image.effect_noise((width, height), 64).convert("L")
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (noise, gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+    extension = "jpg" if image_format == "jpeg" else image_format
+    path = os.path.join(directory, f"sample_{megapixels:g}mp.{extension}")
+    if image_format == "jpeg":
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION_TAG] = 6
+        image.save(path, "JPEG", quality=90, exif=exif)
+    else:
+        image.save(path, image_format.upper())
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片缩小解码基准测试")
+    parser.add_argument("images", nargs="*", help="测试图片路径，不指定时生成测试图")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 48], help="生成测试图的像素数（百万）")
+    parser.add_argument("--formats", nargs="+", default=["jpeg", "png"], help="生成测试图的格式")
+    parser.add_argument("--size", type=int, default=1024, help="目标最大边长")
+    parser.add_argument("--runs", type=int, default=3, help="每种组合的重复次数")
+    args = parser.parse_args()
+
+    size = (args.size, args.size)
+    with tempfile.TemporaryDirectory() as directory:
+        images: List[str] = list(args.images)
+        if not images:
+            print("🧪 生成测试图...")
+            images = [
+                make_sample(directory, megapixels, image_format)
+                for image_format in args.formats for megapixels in args.megapixels
+            ]
+
+        print(f"{'图片':<28}{'方法':<8}{'张/秒':>10}{'峰值RSS(MB)':>14}{'输出尺寸':>14}")
+        for path in images:
+            baseline = None
+            for method in METHODS:
+                result = run_case(method, path, size, args.runs)
+                speedup = ""
+                if baseline is None:
+                    baseline = result["images_per_second"]
+                elif baseline:
+                    speedup = f"  x{result['images_per_second'] / baseline:.1f}"
+                output = "x".join(map(str, result["output_size"]))
+                print(
+                    f"{os.path.basename(path):<28}{method:<8}{result['images_per_second']:>10.2f}"
+                    f"{result['peak_rss_mb']:>14.1f}{output:>14}{speedup}"
+                )
+
+
+if __name__ == "__main__":
+    main()
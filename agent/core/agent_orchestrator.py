@@ -2,13 +2,20 @@
 Agent编排器 - 协调各个工具的调用，实现个人传记生成的完整流程
 """
 
+import os
+import json
+import math
+import time
 import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+import tempfile
+from typing import List, Dict, Any, Optional, Callable, Set
+from dataclasses import dataclass, asdict, field, fields
+from datetime import datetime
 from enum import Enum
 
-from .models import BiographyRequest, BiographyResponse, ProcessingStatus
+from .models import BiographyRequest, BiographyResponse, ProcessingStatus, ImageAnalysisResult
+from .pipeline import Pipeline, PipelineRun, Stage
 from ..tools.image_analyzer import ImageAnalyzer
 from ..tools.text_generator import TextGenerator
 from ..tools.layout_engine import LayoutEngine
@@ -16,6 +23,14 @@ from ..tools.qr_generator import QRGenerator
 from ..tools.pdf_generator import PDFGenerator
 from ..services.ai_service import AIService
 from ..services.file_service import FileService
+from ..services.rate_limiter import set_task_deadline
+from ..services.task_store import TaskStore, InMemoryTaskStore, task_version, draft_version
+from ..services.task_registry import remove_files
+from ..services.job_scheduler import JobScheduler, QueueFullError
+from ..services.job_queue import SQLiteJobQueue
+from ..services.checkpoint_store import CheckpointStore
+from ..services.tracing import get_tracer
+from ..services.metrics import TASKS_IN_FLIGHT, QUEUE_DEPTH, TASK_DURATION, TASKS_FINISHED
 
 
 class TaskStatus(Enum):
@@ -33,6 +48,44 @@ class ProcessingTask:
     message: str
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    draft_content: str = ""  # 流式生成中的传记草稿（完成后只保留预览）
+    created_at: str = ""
+    files: List[str] = field(default_factory=list)  # 上传的文件，任务淘汰时删除
+    stage_timings: Dict[str, float] = field(default_factory=dict)  # 流程阶段 -> 耗时（秒）
+    trace_id: Optional[str] = None  # 链路追踪ID（未启用追踪时为None）
+    user_id: str = ""  # 任务所属用户，按用户列出任务时据此过滤
+    
+    @property
+    def version(self) -> str:
+        """客户端可见状态的指纹，状态、进度、消息或错误变化时改变"""
+        return task_version({
+            "status": self.status.value,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error
+        })
+    
+    @property
+    def draft_version(self) -> str:
+        """状态和草稿的指纹，草稿更新时改变"""
+        return draft_version({
+            "status": self.status.value,
+            "error": self.error,
+            "draft_content": self.draft_content
+        })
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可写入任务存储的字典"""
+        data = asdict(self)
+        data["status"] = self.status.value
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProcessingTask":
+        """从任务存储的字典还原"""
+        values = {f.name: data[f.name] for f in fields(cls) if f.name in data}
+        values["status"] = TaskStatus(values["status"])
+        return cls(**values)
 
 
 class AgentOrchestrator:
@@ -41,14 +94,39 @@ class AgentOrchestrator:
     负责协调各个工具，实现完整的个人传记生成流程
     """
     
+    PREVIEW_CHARS = 500  # 任务完成后 draft_content 保留的预览长度
+    PROGRESS_SAVE_INTERVAL = 1.0  # 进度更新写入任务存储的最小间隔（秒）
+    
     def __init__(
         self,
         ai_service: AIService,
-        file_service: FileService
+        file_service: FileService,
+        max_concurrent_analyses_per_task: int = 3,
+        max_concurrent_analyses: int = 8,
+        task_deadline_seconds: Optional[float] = 600,
+        analysis_batch_size: int = 1,
+        task_store: Optional[TaskStore] = None,
+        task_ttl_seconds: float = 24 * 3600,
+        max_stored_tasks: int = 1000,
+        results_dir: Optional[str] = None,
+        scheduler: Optional[JobScheduler] = None,
+        job_queue: Optional[SQLiteJobQueue] = None,
+        checkpoints: Optional[CheckpointStore] = None
     ):
         self.ai_service = ai_service
         self.file_service = file_service
         
+        # 图片分析并发控制：单任务上限 + 全局上限
+        self.max_concurrent_analyses_per_task = max(1, max_concurrent_analyses_per_task)
+        self.max_concurrent_analyses = max(1, max_concurrent_analyses)
+        self._analysis_semaphore: Optional[asyncio.Semaphore] = None
+        
+        # 大于1时启用批量分析：每次AI请求最多合并这么多张图片
+        self.analysis_batch_size = max(1, analysis_batch_size)
+        
+        # 单个任务内AI调用（含限流等待和429重试）的截止时间
+        self.task_deadline_seconds = task_deadline_seconds
+        
         # 初始化各个工具
         self.image_analyzer = ImageAnalyzer(ai_service)
         self.text_generator = TextGenerator(ai_service)
@@ -56,24 +134,66 @@ class AgentOrchestrator:
         self.qr_generator = QRGenerator()
         self.pdf_generator = PDFGenerator()
         
-        # 任务管理
-        self.tasks: Dict[str, ProcessingTask] = {}
+        # 任务调度：限制同时执行的传记流程数量，超出的任务排队
+        self.scheduler = scheduler or JobScheduler()
+        
+        # 设置 job_queue 时为队列模式：任务写入持久化队列，由独立的工作进程执行，
+        # 进度和结果通过任务存储回传（此时 task_store 必须是多进程共享的存储）
+        self.job_queue = job_queue
+        
+        # 任务管理：任务存储为准，处理中的任务额外保留活动对象以便原地更新进度
+        self.task_store = task_store or InMemoryTaskStore()
+        self._active_tasks: Dict[str, ProcessingTask] = {}
+        
+        # 任务存储写入在线程中执行：同一任务的写入按顺序进行，进度更新节流合并
+        self._save_locks: Dict[str, asyncio.Lock] = {}
+        self._dirty_tasks: Set[str] = set()
+        self._progress_savers: Dict[str, asyncio.Task] = {}
+        
+        # 已结束任务的保留策略：超过TTL或总数超限时淘汰，并删除上传文件、二维码和PDF
+        self.task_ttl_seconds = task_ttl_seconds
+        self.max_stored_tasks = max(1, max_stored_tasks)
+        self._sweeper: Optional[asyncio.Task] = None
+        
+        # 完整结果（传记正文、图片分析、二维码映射）写入磁盘，任务中只保留路径
+        self.results_dir = results_dir or os.getenv(
+            "TASK_RESULTS_DIR",
+            os.path.join(tempfile.gettempdir(), "biography_results")
+        )
+        
+        # 各阶段输出的检查点，失败后从第一个未完成的阶段继续，换模板时复用文本
+        self.checkpoints = checkpoints or CheckpointStore()
+        
+        # 流程阶段依赖图，互不依赖的阶段并发执行
+        self.pipeline = self._build_pipeline()
+        
+        # 导出指标时实时计算执行中的任务数和排队深度
+        TASKS_IN_FLIGHT.set_function(self.in_flight_count)
+        QUEUE_DEPTH.set_function(self.queue_depth)
+        
+        # 传记草稿订阅者：task_id -> 事件队列列表
+        self._draft_subscribers: Dict[str, List[asyncio.Queue]] = {}
         
         # 日志配置
         self.logger = logging.getLogger(__name__)
     
     async def create_biography(
         self, 
-        request: BiographyRequest
+        request: BiographyRequest,
+        priority: int = 0
     ) -> str:
         """
         创建个人传记的主要流程
         
         Args:
             request: 传记生成请求，包含图片文件和用户要求
+            priority: 调度优先级，数值越大越先执行
             
         Returns:
             task_id: 任务ID，用于跟踪处理进度
+            
+        Raises:
+            QueueFullError: 任务队列已满
         """
         task_id = f"biography_{request.user_id}_{asyncio.get_event_loop().time()}"
         
@@ -82,15 +202,225 @@ class AgentOrchestrator:
             task_id=task_id,
             status=TaskStatus.PENDING,
             progress=0.0,
-            message="开始处理个人传记生成请求"
+            message="任务已进入队列，等待处理",
+            created_at=datetime.now().isoformat(),
+            files=list(request.image_files),
+            trace_id=get_tracer().new_trace_id(),
+            user_id=request.user_id
         )
-        self.tasks[task_id] = task
         
-        # 异步执行处理流程
-        asyncio.create_task(self._process_biography(task_id, request))
+        await self._submit_task(task, request, priority)
+        # 保存请求，恢复或重新排版时据此重建流程输入
+        self.checkpoints.save(task_id, "request", self._request_payload(request))
         
         return task_id
     
+    async def _submit_task(self, task: ProcessingTask, request: BiographyRequest, priority: int = 0):
+        """把任务交给调度器或持久化队列，队列已满时抛出 QueueFullError"""
+        task_id = task.task_id
+        
+        if self.job_queue is not None:
+            # 先写任务再入队，保证工作进程领取时任务已存在
+            self.check_admission(request.user_id)
+            await self._save_task(task)
+            self.job_queue.enqueue(task_id, request.user_id, self._request_payload(request), priority)
+            return
+        
+        self._active_tasks[task_id] = task
+        
+        # 交给调度器排队执行，队列已满时直接拒绝
+        try:
+            self.scheduler.submit(
+                task_id,
+                request.user_id,
+                lambda: self._process_biography(task_id, request),
+                priority
+            )
+        except QueueFullError:
+            self._active_tasks.pop(task_id, None)
+            raise
+        await self._save_task(task)
+    
+    async def resume_biography(
+        self,
+        task_id: str,
+        from_stage: Optional[str] = None,
+        template_style: Optional[str] = None,
+        priority: int = 0
+    ) -> Optional[ProcessingTask]:
+        """
+        重新执行已结束的任务，已有检查点的阶段直接复用
+        
+        Args:
+            task_id: 任务ID
+            from_stage: 从该阶段起重新生成（该阶段及之后的检查点作废），
+                        None时只执行未完成的阶段
+            template_style: 更换PDF模板，排版和PDF阶段会重新执行
+            priority: 调度优先级
+            
+        Returns:
+            重新排队的任务，任务不存在时返回None
+            
+        Raises:
+            ValueError: 任务仍在处理中、缺少请求记录或模板不存在
+            QueueFullError: 任务队列已满
+        """
+        task = self.get_task_status(task_id)
+        if task is None:
+            return None
+        if task.status not in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+            raise ValueError("任务仍在处理中，无法重新执行")
+        
+        payload = self.checkpoints.load(task_id, "request")
+        if payload is None:
+            raise ValueError("缺少任务请求记录，无法恢复")
+        
+        stale = set(self.pipeline.downstream(from_stage)) if from_stage else set()
+        if template_style and template_style != payload.get("template_style"):
+            if template_style not in self.pdf_generator.get_available_templates():
+                raise ValueError(f"模板不存在: {template_style}")
+            payload["template_style"] = template_style
+            stale.update(self.pipeline.downstream("layout"))
+        
+        request = BiographyRequest(**payload)
+        self.check_admission(request.user_id)
+        
+        if stale:
+            self._invalidate_stages(task_id, stale)
+            self.checkpoints.save(task_id, "request", payload)
+        
+        task.status = TaskStatus.PENDING
+        task.progress = 0.0
+        task.message = "任务已重新进入队列，等待处理"
+        task.error = None
+        task.result = None
+        task.trace_id = get_tracer().new_trace_id()
+        await self._submit_task(task, request, priority)
+        
+        self.logger.info(
+            f"Resuming task {task_id}, reusing checkpoints: {self.checkpoints.completed_stages(task_id)}"
+        )
+        return task
+    
+    async def rerender_biography(
+        self,
+        task_id: str,
+        template_style: str,
+        priority: int = 0
+    ) -> Optional[ProcessingTask]:
+        """用另一个模板重新排版并生成PDF，复用已生成的图片分析和传记文本"""
+        return await self.resume_biography(
+            task_id,
+            from_stage="layout",
+            template_style=template_style,
+            priority=priority
+        )
+    
+    def _invalidate_stages(self, task_id: str, stages):
+        """作废阶段检查点，并删除这些阶段生成的文件"""
+        files = []
+        if "qr" in stages:
+            files.extend((self.checkpoints.load(task_id, "qr") or {}).values())
+        if "pdf" in stages:
+            files.append(self.checkpoints.load(task_id, "pdf"))
+        remove_files(files)
+        self.checkpoints.clear(task_id, stages)
+    
+    def check_admission(self, user_id: str):
+        """检查是否可以接收新任务，队列已满时抛出 QueueFullError"""
+        if self.job_queue is None:
+            self.scheduler.check_admission(user_id)
+            return
+        
+        # 队列模式沿用调度器的排队上限
+        config = self.scheduler.config
+        queued = self.job_queue.count()
+        retry_after = min(
+            config.max_retry_after_seconds,
+            max(1, math.ceil((queued + 1) / config.max_workers * config.initial_job_seconds))
+        )
+        if queued >= config.max_queue_size:
+            raise QueueFullError("任务队列已满，请稍后重试", retry_after)
+        if self.job_queue.count_for_user(user_id) >= config.max_queued_per_user:
+            raise QueueFullError("您排队中的任务过多，请等待已有任务完成", retry_after)
+    
+    def in_flight_count(self) -> int:
+        """本进程中正在执行的任务数"""
+        return sum(1 for task in list(self._active_tasks.values()) if task.status == TaskStatus.PROCESSING)
+    
+    def queue_depth(self) -> int:
+        """排队等待执行的任务数"""
+        if self.job_queue is not None:
+            return self.job_queue.count()
+        return self.scheduler.queue_size
+    
+    def get_queue_position(self, task_id: str) -> Optional[int]:
+        """任务的排队位置（从1开始），执行中为0，不在队列中返回None"""
+        if self.job_queue is not None:
+            return self.job_queue.position(task_id)
+        return self.scheduler.position(task_id)
+    
+    @staticmethod
+    def _request_payload(request: BiographyRequest) -> Dict[str, Any]:
+        """把传记请求转换为可入队的字典"""
+        return {
+            "user_id": request.user_id,
+            "image_files": list(request.image_files),
+            "user_requirements": request.user_requirements,
+            "template_style": request.template_style,
+            "language": request.language
+        }
+    
+    async def run_queued_job(self, task_id: str, payload: Dict[str, Any]):
+        """在工作进程中执行从队列领取的任务"""
+        data = self.task_store.get(task_id)
+        if data is None:
+            self.logger.warning(f"Queued task {task_id} not found in task store, skipping")
+            return
+        self._active_tasks[task_id] = ProcessingTask.from_dict(data)
+        await self._process_biography(task_id, BiographyRequest(**payload))
+    
+    def _build_pipeline(self) -> Pipeline:
+        """
+        声明传记生成流程的阶段依赖图
+        
+        exif、analysis、qr 只依赖上传的图片，会同时开始执行；
+        文本依赖合并了EXIF信息的图片分析，排版依赖文本和二维码，PDF依赖排版
+        """
+        return Pipeline([
+            Stage(
+                "exif", self._stage_exif, inputs=("image_files",),
+                message="正在读取图片信息...", weight=0.5, checkpoint=False
+            ),
+            Stage(
+                "analysis", self._stage_analysis, inputs=("image_files",),
+                message="正在分析上传的图片...", weight=3.0,
+                decode=lambda data: [ImageAnalysisResult(**item) for item in data]
+            ),
+            Stage(
+                "qr", self._stage_qr, inputs=("image_files",),
+                message="正在生成图片和视频的二维码...", weight=1.0,
+                decode=lambda data: data if all(os.path.exists(path) for path in data.values()) else None
+            ),
+            Stage(
+                "images", self._stage_images, inputs=("analysis", "exif"),
+                weight=0.0, checkpoint=False
+            ),
+            Stage(
+                "text", self._stage_text, inputs=("images", "user_requirements"),
+                message="正在生成个人传记内容...", weight=3.0
+            ),
+            Stage(
+                "layout", self._stage_layout, inputs=("text", "images", "qr", "template_style"),
+                message="正在进行图文排版...", weight=1.5
+            ),
+            Stage(
+                "pdf", self._stage_pdf, inputs=("layout",),
+                message="正在生成PDF故事书...", weight=1.5,
+                decode=lambda path: path if os.path.exists(path) else None
+            ),
+        ])
+    
     async def _process_biography(
         self, 
         task_id: str, 
@@ -98,84 +428,237 @@ class AgentOrchestrator:
     ):
         """
         执行完整的传记生成流程
+        
+        各阶段按依赖图并发执行；每个阶段完成后写入检查点，已有检查点的阶段直接复用，
+        因此任务恢复时从第一个未完成的阶段开始执行
         """
-        task = self.tasks[task_id]
+        task = self._active_tasks[task_id]
+        set_task_deadline(self.task_deadline_seconds)
+        started_at = time.monotonic()
         
-        try:
-            # 步骤1: 图片分析 (0-30%)
-            task.status = TaskStatus.PROCESSING
-            task.message = "正在分析上传的图片..."
-            task.progress = 0.1
-            
-            image_analysis_results = await self._analyze_images(request.image_files)
-            task.progress = 0.3
-            
-            # 步骤2: 生成传记内容 (30-60%)
-            task.message = "正在生成个人传记内容..."
-            
-            biography_content = await self._generate_biography_text(
-                image_analysis_results, 
-                request.user_requirements
-            )
-            task.progress = 0.6
-            
-            # 步骤3: 生成二维码 (60-70%)
-            task.message = "正在生成图片和视频的二维码..."
-            
-            qr_codes = await self._generate_qr_codes(request.image_files)
-            task.progress = 0.7
-            
-            # 步骤4: 图文排版 (70-85%)
-            task.message = "正在进行图文排版..."
+        with get_tracer().span(
+            "biography.task",
+            trace_id=task.trace_id,
+            task_id=task_id,
+            images=len(request.image_files)
+        ) as span:
+            cancelled = False
+            try:
+                task.status = TaskStatus.PROCESSING
+                task.message = "正在分析上传的图片..."
+                task.progress = 0.1
+                task.stage_timings = {}
+                await self._save_task(task)
+                
+                run = self.pipeline.start(
+                    inputs={
+                        "image_files": list(request.image_files),
+                        "user_requirements": request.user_requirements,
+                        "template_style": request.template_style
+                    },
+                    context={"task": task},
+                    checkpoints=self.checkpoints,
+                    checkpoint_key=task_id,
+                    on_update=lambda pipeline_run: self._on_pipeline_update(task, pipeline_run)
+                )
+                try:
+                    outputs = await run.execute()
+                finally:
+                    task.stage_timings = dict(run.timings)
+                    self.logger.info(
+                        f"Pipeline timings for task {task_id}: {run.timings}"
+                        + (f", reused checkpoints: {run.reused}" if run.reused else "")
+                    )
+                
+                biography_content = outputs["text"]
+                qr_codes = outputs["qr"]
+                pdf_path = outputs["pdf"]
+                task.progress = 1.0
+                
+                # 完成任务
+                task.status = TaskStatus.COMPLETED
+                task.message = "个人传记生成完成！"
+                result_path = await asyncio.to_thread(self._spill_result, task_id, {
+                    "pdf_path": pdf_path,
+                    "biography_content": biography_content,
+                    "image_analysis": outputs["images"],
+                    "qr_codes": qr_codes
+                })
+                task.result = {
+                    "pdf_path": pdf_path,
+                    "result_path": result_path,
+                    "artifacts": [pdf_path, *qr_codes.values()]
+                }
+                task.draft_content = biography_content[:self.PREVIEW_CHARS]
+                self._publish_draft_event(task_id, {"type": "completed"})
+                
+            except asyncio.CancelledError:
+                # 被取消（如工作进程失去租约）时不写入终态，避免覆盖接管者的进度
+                cancelled = True
+                raise
+            except Exception as e:
+                task.status = TaskStatus.FAILED
+                task.error = str(e)
+                task.message = f"处理失败: {str(e)}"
+                self.logger.error(f"Biography processing failed for task {task_id}: {e}")
+                span.record_exception(e)
+                self._publish_draft_event(task_id, {"type": "failed", "error": task.error})
             
-            layout_result = await self._create_layout(
-                biography_content,
-                image_analysis_results,
-                qr_codes
+            finally:
+                # 终态写入存储后释放活动对象
+                if cancelled:
+                    self._dirty_tasks.discard(task_id)
+                else:
+                    await self._save_task(task)
+                    TASK_DURATION.observe(time.monotonic() - started_at, status=task.status.value)
+                    TASKS_FINISHED.inc(status=task.status.value)
+                self._active_tasks.pop(task_id, None)
+                self._save_locks.pop(task_id, None)
+    
+    def _on_pipeline_update(self, task: ProcessingTask, run: PipelineRun):
+        """流程阶段开始、结束或上报进度时同步任务状态（进度区间 10%-100%）"""
+        task.progress = round(0.1 + 0.9 * run.progress, 3)
+        task.message = run.current_message or task.message
+        task.stage_timings = dict(run.timings)
+        self._save_progress(task)
+    
+    async def _stage_exif(self, run: PipelineRun, image_files: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await self.image_analyzer.extract_basic_info(image_files)
+    
+    async def _stage_analysis(self, run: PipelineRun, image_files: List[str]) -> List[ImageAnalysisResult]:
+        def on_progress(completed: int, total: int):
+            run.report_progress(
+                "analysis", completed / total, f"正在分析上传的图片 ({completed}/{total})..."
             )
-            task.progress = 0.85
-            
-            # 步骤5: 生成PDF (85-100%)
-            task.message = "正在生成PDF故事书..."
-            
-            pdf_path = await self._generate_pdf(layout_result)
-            task.progress = 1.0
-            
-            # 完成任务
-            task.status = TaskStatus.COMPLETED
-            task.message = "个人传记生成完成！"
-            task.result = {
-                "pdf_path": pdf_path,
-                "biography_content": biography_content,
-                "image_analysis": image_analysis_results,
-                "qr_codes": qr_codes
-            }
-            
-        except Exception as e:
-            task.status = TaskStatus.FAILED
-            task.error = str(e)
-            task.message = f"处理失败: {str(e)}"
-            self.logger.error(f"Biography processing failed for task {task_id}: {e}")
-    
-    async def _analyze_images(self, image_files: List[str]) -> List[Dict[str, Any]]:
-        """分析图片内容"""
-        results = []
-        for image_file in image_files:
-            analysis = await self.image_analyzer.analyze_image(image_file)
-            results.append(analysis)
-        return results
+        return await self._analyze_images(image_files, on_progress)
+    
+    async def _stage_qr(self, run: PipelineRun, image_files: List[str]) -> Dict[str, str]:
+        return await self._generate_qr_codes(image_files)
+    
+    async def _stage_images(
+        self,
+        run: PipelineRun,
+        analysis: List[ImageAnalysisResult],
+        exif: Dict[str, Dict[str, Any]]
+    ) -> List[ImageAnalysisResult]:
+        """把EXIF中的时间和位置合并到AI分析结果"""
+        for result in analysis:
+            self.image_analyzer.apply_basic_info(result, exif.get(result.file_path, {}))
+        return analysis
+    
+    async def _stage_text(
+        self,
+        run: PipelineRun,
+        images: List[ImageAnalysisResult],
+        user_requirements: str
+    ) -> str:
+        task = run.context["task"]
+        biography_content = await self._generate_biography_text(images, user_requirements, task)
+        task.draft_content = biography_content
+        return biography_content
+    
+    async def _stage_layout(
+        self,
+        run: PipelineRun,
+        text: str,
+        images: List[ImageAnalysisResult],
+        qr: Dict[str, str],
+        template_style: str
+    ) -> Dict[str, Any]:
+        return await self._create_layout(text, images, qr, template_style)
+    
+    async def _stage_pdf(self, run: PipelineRun, layout: Dict[str, Any]) -> str:
+        return await self._generate_pdf(layout)
+    
+    async def _analyze_images(
+        self,
+        image_files: List[str],
+        on_progress: Optional[Callable[[int, int], None]] = None
+    ) -> List[ImageAnalysisResult]:
+        """
+        并发分析图片内容
+        
+        并发度同时受单任务上限和全局上限约束；结果保持输入顺序，
+        单张图片（或单批图片）失败只跳过对应图片，全部失败时才抛出异常。
+        analysis_batch_size 大于1时，每批图片合并为一次AI请求。
+        EXIF基础信息由流程中的 exif 阶段并行提取，这里只做AI分析。
+        """
+        if not image_files:
+            return []
+        
+        if self._analysis_semaphore is None:
+            self._analysis_semaphore = asyncio.Semaphore(self.max_concurrent_analyses)
+        global_semaphore = self._analysis_semaphore
+        task_semaphore = asyncio.Semaphore(self.max_concurrent_analyses_per_task)
+        
+        total = len(image_files)
+        results: List[Any] = [None] * total
+        errors: List[Optional[Exception]] = [None] * total
+        completed = 0
+        
+        async def analyze_group(indices: List[int]):
+            nonlocal completed
+            paths = [image_files[i] for i in indices]
+            try:
+                async with task_semaphore:
+                    async with global_semaphore:
+                        if len(paths) == 1:
+                            group_results = [
+                                await self.image_analyzer.analyze_image(paths[0], include_basic_info=False)
+                            ]
+                        else:
+                            group_results = await self.image_analyzer.analyze_images_batch(
+                                paths, self.analysis_batch_size, include_basic_info=False
+                            )
+                for index, result in zip(indices, group_results):
+                    results[index] = result
+            except Exception as e:
+                for index in indices:
+                    errors[index] = e
+                self.logger.warning(f"Image analysis failed for {paths}: {e}")
+            finally:
+                completed += len(indices)
+                if on_progress is not None:
+                    on_progress(completed, total)
+        
+        groups = [
+            list(range(start, min(start + self.analysis_batch_size, total)))
+            for start in range(0, total, self.analysis_batch_size)
+        ]
+        await asyncio.gather(*(analyze_group(group) for group in groups))
+        
+        valid_results = [result for result, error in zip(results, errors) if error is None]
+        if not valid_results:
+            raise Exception(f"所有图片分析均失败: {errors[0]}")
+        
+        return valid_results
     
     async def _generate_biography_text(
         self, 
         image_analyses: List[Dict[str, Any]], 
-        user_requirements: str
+        user_requirements: str,
+        task: Optional[ProcessingTask] = None
     ) -> str:
-        """生成传记文本"""
+        """生成传记文本（流式生成时把草稿发布给订阅者）"""
+        on_chunk = self._make_draft_callback(task) if task else None
         return await self.text_generator.generate_biography(
             image_analyses, 
-            user_requirements
+            user_requirements,
+            on_chunk=on_chunk
         )
     
+    def _make_draft_callback(self, task: ProcessingTask):
+        """创建流式生成回调：更新任务草稿并发布给订阅者"""
+        def on_chunk(chunk: str, draft: str):
+            # 累计文本从头开始说明发生了主备切换，需要让订阅者丢弃旧草稿
+            if task.draft_content and len(draft) == len(chunk):
+                self._publish_draft_event(task.task_id, {"type": "reset"})
+            task.draft_content = draft
+            self._publish_draft_event(task.task_id, {"type": "chunk", "text": chunk})
+            # 节流写入任务存储，任务在队列Worker中执行时API进程据此推送草稿
+            self._save_progress(task)
+        return on_chunk
+    
     async def _generate_qr_codes(
         self, 
         media_files: List[str]
@@ -196,26 +679,168 @@ class AgentOrchestrator:
         self,
         biography_content: str,
         image_analyses: List[Dict[str, Any]],
-        qr_codes: Dict[str, str]
+        qr_codes: Dict[str, str],
+        template_style: str = "classic"
     ) -> Dict[str, Any]:
         """创建图文排版"""
-        return await self.layout_engine.create_layout(
+        layout_result = await self.layout_engine.create_layout(
             biography_content,
             image_analyses,
             qr_codes
         )
+        layout_result["template"] = template_style
+        return layout_result
     
     async def _generate_pdf(self, layout_result: Dict[str, Any]) -> str:
         """生成PDF文件"""
         return await self.pdf_generator.generate_pdf(layout_result)
     
+    def subscribe_draft(self, task_id: str) -> asyncio.Queue:
+        """订阅任务的传记草稿事件（chunk/reset/completed/failed）"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._draft_subscribers.setdefault(task_id, []).append(queue)
+        return queue
+    
+    def unsubscribe_draft(self, task_id: str, queue: asyncio.Queue):
+        """取消订阅传记草稿事件"""
+        subscribers = self._draft_subscribers.get(task_id)
+        if not subscribers:
+            return
+        if queue in subscribers:
+            subscribers.remove(queue)
+        if not subscribers:
+            del self._draft_subscribers[task_id]
+    
+    def _publish_draft_event(self, task_id: str, event: Dict[str, Any]):
+        """向所有订阅者发布草稿事件"""
+        for queue in self._draft_subscribers.get(task_id, []):
+            queue.put_nowait(event)
+    
+    def _spill_result(self, task_id: str, result: Dict[str, Any]) -> str:
+        """把完整结果写入磁盘，返回文件路径"""
+        os.makedirs(self.results_dir, exist_ok=True)
+        path = os.path.join(self.results_dir, f"{task_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+        return path
+    
+    def load_task_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """读取已完成任务的完整结果（传记正文、图片分析、二维码映射）"""
+        task = self.get_task_status(task_id)
+        if task is None or not task.result or not task.result.get("result_path"):
+            return None
+        try:
+            with open(task.result["result_path"], "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def sweep_expired_tasks(self) -> int:
+        """淘汰过期和超出容量的已结束任务，并删除关联文件，返回淘汰数量"""
+        purged = self.task_store.purge(
+            self.task_ttl_seconds,
+            self.max_stored_tasks,
+            statuses=(TaskStatus.COMPLETED.value, TaskStatus.FAILED.value)
+        )
+        for data in purged:
+            result = data.get("result") or {}
+            remove_files(data.get("files", []) + result.get("artifacts", []) + [result.get("result_path")])
+            self.checkpoints.clear(data["task_id"])
+        if purged:
+            self.logger.info(f"Evicted {len(purged)} expired tasks")
+        return len(purged)
+    
+    async def _sweep_loop(self, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.sweep_expired_tasks)
+            except Exception as e:
+                self.logger.warning(f"Task sweep failed: {e}")
+    
+    def start_sweeper(self, interval_seconds: float = 300):
+        """在当前事件循环中启动过期任务清理"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval_seconds))
+    
+    async def stop_sweeper(self):
+        """停止过期任务清理"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+    
+    async def _save_task(self, task: ProcessingTask):
+        """
+        把任务当前状态写入任务存储，失败时只记录日志不中断处理流程
+        
+        写入在线程中执行，不阻塞事件循环；同一任务的写入按顺序进行，后写入的总是较新的状态
+        """
+        self._dirty_tasks.discard(task.task_id)
+        lock = self._save_locks.setdefault(task.task_id, asyncio.Lock())
+        async with lock:
+            data = task.to_dict()
+            try:
+                await asyncio.to_thread(self.task_store.put, task.task_id, data)
+            except Exception as e:
+                self.logger.warning(f"Failed to persist task {task.task_id}: {e}")
+    
+    def _save_progress(self, task: ProcessingTask):
+        """节流写入进度：首次立即写入，之后每 PROGRESS_SAVE_INTERVAL 秒最多写入一次最新状态"""
+        self._dirty_tasks.add(task.task_id)
+        if task.task_id not in self._progress_savers:
+            self._progress_savers[task.task_id] = asyncio.create_task(self._progress_saver(task))
+    
+    async def _progress_saver(self, task: ProcessingTask):
+        try:
+            while task.task_id in self._dirty_tasks:
+                await self._save_task(task)
+                await asyncio.sleep(self.PROGRESS_SAVE_INTERVAL)
+        finally:
+            self._progress_savers.pop(task.task_id, None)
+    
     def get_task_status(self, task_id: str) -> Optional[ProcessingTask]:
-        """获取任务状态"""
-        return self.tasks.get(task_id)
+        """获取任务状态（优先返回本进程中处理中的活动对象）"""
+        task = self._active_tasks.get(task_id)
+        if task is not None:
+            return task
+        data = self.task_store.get(task_id)
+        return ProcessingTask.from_dict(data) if data else None
+    
+    async def wait_for_task_change(
+        self,
+        task_id: str,
+        version: Optional[str],
+        timeout: float
+    ) -> Optional[ProcessingTask]:
+        """
+        等待任务状态相对 version 发生变化（由任务存储的写入通知驱动），
+        超时返回当前状态
+        """
+        data = await self.task_store.wait_for_change(task_id, version, timeout)
+        return self.get_task_status(task_id) if data else None
+    
+    async def wait_for_draft_change(
+        self,
+        task_id: str,
+        version: Optional[str],
+        timeout: float
+    ) -> Optional[ProcessingTask]:
+        """
+        等待任务的草稿或状态相对 version（ProcessingTask.draft_version）发生变化，
+        超时返回当前状态；用于任务在其他进程执行、收不到草稿事件时推送草稿
+        """
+        data = await self.task_store.wait_for_change(task_id, version, timeout, fingerprint=draft_version)
+        return ProcessingTask.from_dict(data) if data else None
     
-    def get_all_tasks(self, user_id: str) -> List[ProcessingTask]:
-        """获取用户的所有任务"""
+    def get_all_tasks(self, user_id: str, limit: int = 100) -> List[ProcessingTask]:
+        """获取用户的所有任务（按任务中保存的用户ID过滤）"""
         return [
-            task for task in self.tasks.values() 
-            if task.task_id.startswith(f"biography_{user_id}_")
+            self._active_tasks.get(data["task_id"]) or ProcessingTask.from_dict(data)
+            for data in self.task_store.list(user_id=user_id, limit=limit)
         ] 
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+传记任务工作进程
+从持久化任务队列领取任务，在独立进程中执行完整的传记生成流程，
+进度和结果写入共享的任务存储，API进程与工作进程可以分别扩容
+
+用法（在项目根目录）:
+    python -m agent.core.job_worker --processes 2 --concurrency 2 --metrics-port 9100
+
+指定 --metrics-port 时每个工作进程在 端口+序号 上提供Prometheus指标（/metrics）
+"""
+
+import os
+import uuid
+import signal
+import asyncio
+import logging
+import argparse
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Set
+
+from .agent_orchestrator import AgentOrchestrator, TaskStatus
+from ..services.ai_service import AIService
+from ..services.file_service import FileService
+from ..services.job_queue import SQLiteJobQueue
+from ..services.task_store import SQLiteTaskStore, create_task_store
+from ..services.tracing import get_tracer
+from ..services.image_executor import get_image_executor
+from ..services.metrics import REGISTRY, CONTENT_TYPE_LATEST
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    """单个工作进程内的任务循环"""
+
+    def __init__(
+        self,
+        orchestrator: AgentOrchestrator,
+        job_queue: SQLiteJobQueue,
+        concurrency: int = 2,
+        lease_seconds: float = 120,
+        poll_interval: float = 1.0,
+        worker_id: Optional[str] = None
+    ):
+        self.orchestrator = orchestrator
+        self.job_queue = job_queue
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._running: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    def stop(self):
+        """停止领取新任务，已领取的任务执行完后退出"""
+        self._stopping = True
+
+    async def run(self):
+        """领取并执行任务，直到 stop() 被调用"""
+        logger.info(f"👷 工作进程 {self.worker_id} 启动，并发 {self.concurrency}")
+        while not self._stopping:
+            if len(self._running) >= self.concurrency:
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            job = await asyncio.to_thread(self.job_queue.claim, self.worker_id, self.lease_seconds)
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+        if self._running:
+            await asyncio.wait(self._running)
+        logger.info(f"👷 工作进程 {self.worker_id} 已退出")
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id = job["job_id"]
+        if job["attempts"] > self.job_queue.max_attempts:
+            # 多次领取都没有完成（工作进程反复崩溃），不再重试
+            self.job_queue.fail(job_id, self.worker_id, "超过最大尝试次数")
+            await asyncio.to_thread(
+                self.orchestrator.task_store.update,
+                job_id,
+                status=TaskStatus.FAILED.value,
+                error="任务执行多次中断，已放弃",
+                message="处理失败: 任务执行多次中断"
+            )
+            return
+
+        job_run = asyncio.create_task(self.orchestrator.run_queued_job(job_id, job["payload"]))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, job_run))
+        try:
+            await job_run
+        except asyncio.CancelledError:
+            if not self._lease_lost(heartbeat):
+                raise
+            # 任务已由接管的工作进程负责，不再标记完成或失败
+            logger.warning(f"任务 {job_id} 已停止执行，由接管的工作进程继续")
+        except Exception as e:
+            logger.error(f"任务 {job_id} 执行异常: {e}")
+            if not self._lease_lost(heartbeat):
+                self.job_queue.fail(job_id, self.worker_id, str(e))
+        else:
+            if not self._lease_lost(heartbeat):
+                self.job_queue.complete(job_id, self.worker_id)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str, job_run: asyncio.Task) -> bool:
+        """定期续租，防止执行中的任务被其他工作进程重新领取；租约丢失时取消任务并返回True"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(
+                self.job_queue.heartbeat, job_id, self.worker_id, self.lease_seconds
+            ):
+                logger.warning(f"任务 {job_id} 的租约已被其他工作进程接管，停止执行")
+                job_run.cancel()
+                return True
+
+    @staticmethod
+    def _lease_lost(heartbeat: asyncio.Task) -> bool:
+        return heartbeat.done() and not heartbeat.cancelled() and heartbeat.exception() is None and heartbeat.result()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """在后台线程中提供本进程的 /metrics"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"📈 指标服务监听端口 {port}")
+    return server
+
+
+async def _run_worker(concurrency: int):
+    task_store = create_task_store()
+    if not isinstance(task_store, SQLiteTaskStore):
+        logger.warning("⚠️ 工作进程未使用SQLite任务存储，API进程将看不到任务进度")
+
+    ai_service = AIService()
+    orchestrator = AgentOrchestrator(ai_service, FileService(), task_store=task_store)
+    worker = JobWorker(orchestrator, SQLiteJobQueue(), concurrency=concurrency)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        await ai_service.close()
+        get_tracer().shutdown()
+        get_image_executor().shutdown()
+
+
+def run_worker_process(concurrency: int, metrics_port: Optional[int] = None):
+    """工作进程入口"""
+    logging.basicConfig(level=logging.INFO)
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    asyncio.run(_run_worker(concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传记任务工作进程")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "1")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "2")))
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("WORKER_METRICS_PORT", "0")))
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker_process(args.concurrency, args.metrics_port)
+        return
+
+    processes = [
+        multiprocessing.Process(
+            target=run_worker_process,
+            args=(args.concurrency, args.metrics_port + index if args.metrics_port else None)
+        )
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
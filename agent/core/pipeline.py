@@ -0,0 +1,223 @@
+"""
+流程编排引擎 - 以有向无环图声明传记生成的各个阶段
+
+每个阶段声明输入（上游阶段名或外部输入名），输出以阶段名命名；
+执行时所有输入就绪的阶段立即并发启动，互不依赖的阶段（如二维码、EXIF 与图片分析）重叠执行。
+配置了检查点存储时，已有有效检查点的阶段直接复用输出。
+"""
+
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from ..services.checkpoint_store import CheckpointStore
+from ..services.tracing import get_tracer
+from ..services.metrics import STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """流程阶段"""
+    name: str
+    run: Callable[..., Awaitable[Any]]  # run(pipeline_run, **inputs) -> 阶段输出
+    inputs: Tuple[str, ...] = ()
+    message: str = ""  # 阶段执行中展示给用户的进度消息
+    weight: float = 1.0  # 在总进度中的占比
+    checkpoint: bool = True  # 是否写入检查点
+    decode: Optional[Callable[[Any], Any]] = None  # 检查点数据还原为阶段输出，返回None表示已失效
+
+
+class Pipeline:
+    """由阶段组成的有向无环图"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"重复的流程阶段: {stage.name}")
+            self.stages[stage.name] = stage
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        """按依赖关系排序，存在环时抛出 ValueError"""
+        order: List[str] = []
+        visiting: Set[str] = set()
+
+        def visit(name: str):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"流程阶段存在循环依赖: {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].inputs:
+                if dependency in self.stages:
+                    visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    @property
+    def external_inputs(self) -> Set[str]:
+        """需要在执行时提供的外部输入"""
+        return {
+            name for stage in self.stages.values() for name in stage.inputs
+            if name not in self.stages
+        }
+
+    def downstream(self, name: str) -> List[str]:
+        """指定阶段及所有直接或间接依赖它的阶段（按执行顺序）"""
+        if name not in self.stages:
+            raise ValueError(f"未知的流程阶段: {name}，可选: {', '.join(self.order)}")
+        affected = {name}
+        for stage_name in self.order:
+            if any(dependency in affected for dependency in self.stages[stage_name].inputs):
+                affected.add(stage_name)
+        return [stage_name for stage_name in self.order if stage_name in affected]
+
+    def start(
+        self,
+        inputs: Dict[str, Any],
+        context: Optional[Dict[str, Any]] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+        checkpoint_key: Optional[str] = None,
+        on_update: Optional[Callable[["PipelineRun"], None]] = None
+    ) -> "PipelineRun":
+        """创建一次执行，调用 await run.execute() 开始"""
+        missing = self.external_inputs - set(inputs)
+        if missing:
+            raise ValueError(f"缺少流程输入: {', '.join(sorted(missing))}")
+        return PipelineRun(self, inputs, context or {}, checkpoints, checkpoint_key, on_update)
+
+
+class PipelineRun:
+    """流程的一次执行，记录各阶段的输出、进度和耗时"""
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        inputs: Dict[str, Any],
+        context: Dict[str, Any],
+        checkpoints: Optional[CheckpointStore],
+        checkpoint_key: Optional[str],
+        on_update: Optional[Callable[["PipelineRun"], None]]
+    ):
+        self.pipeline = pipeline
+        self.values: Dict[str, Any] = dict(inputs)
+        self.context = context
+        self.checkpoints = checkpoints
+        self.checkpoint_key = checkpoint_key
+        self.on_update = on_update
+
+        self.running: Set[str] = set()
+        self.fractions: Dict[str, float] = {}
+        self.messages: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}  # 阶段 -> 耗时（秒）
+        self.reused: List[str] = []  # 复用检查点的阶段
+
+    @property
+    def progress(self) -> float:
+        """按阶段权重加权的完成比例（0-1）"""
+        stages = self.pipeline.stages.values()
+        total = sum(stage.weight for stage in stages) or 1.0
+        return sum(stage.weight * self.fractions.get(stage.name, 0.0) for stage in stages) / total
+
+    @property
+    def current_message(self) -> Optional[str]:
+        """执行中权重最大的阶段的进度消息"""
+        if not self.running:
+            return None
+        name = max(self.running, key=lambda stage_name: self.pipeline.stages[stage_name].weight)
+        return self.messages.get(name) or self.pipeline.stages[name].message or None
+
+    def report_progress(self, stage: str, fraction: float, message: Optional[str] = None):
+        """阶段内部的进度上报"""
+        self.fractions[stage] = min(1.0, max(0.0, fraction))
+        if message:
+            self.messages[stage] = message
+        self._notify()
+
+    def _notify(self):
+        if self.on_update is None:
+            return
+        try:
+            self.on_update(self)
+        except Exception as e:
+            logger.warning(f"流程进度回调失败: {e}")
+
+    def _load_checkpoint(self, stage: Stage) -> Optional[Any]:
+        if not (stage.checkpoint and self.checkpoints and self.checkpoint_key):
+            return None
+        data = self.checkpoints.load(self.checkpoint_key, stage.name)
+        if data is None:
+            return None
+        try:
+            return stage.decode(data) if stage.decode else data
+        except Exception as e:
+            logger.warning(f"检查点无效 {self.checkpoint_key}/{stage.name}: {e}")
+            return None
+
+    async def _save_checkpoint(self, stage: Stage, value: Any):
+        if not (stage.checkpoint and self.checkpoints and self.checkpoint_key):
+            return
+        try:
+            await asyncio.to_thread(self.checkpoints.save, self.checkpoint_key, stage.name, value)
+        except Exception as e:
+            # 检查点写入失败只影响恢复，不中断当前流程
+            logger.warning(f"检查点写入失败 {self.checkpoint_key}/{stage.name}: {e}")
+
+    async def _run_stage(self, stage: Stage) -> Any:
+        started_at = time.monotonic()
+        self.running.add(stage.name)
+        self._notify()
+        try:
+            with get_tracer().span(f"stage.{stage.name}", stage=stage.name) as span:
+                value = self._load_checkpoint(stage)
+                span.set_attribute("checkpoint.reused", value is not None)
+                if value is not None:
+                    self.reused.append(stage.name)
+                else:
+                    value = await stage.run(self, **{name: self.values[name] for name in stage.inputs})
+                    STAGE_DURATION.observe(time.monotonic() - started_at, stage=stage.name)
+                    await self._save_checkpoint(stage, value)
+                return value
+        finally:
+            self.running.discard(stage.name)
+            self.timings[stage.name] = round(time.monotonic() - started_at, 3)
+
+    async def execute(self) -> Dict[str, Any]:
+        """
+        执行流程，返回所有阶段的输出
+
+        任一阶段失败时取消仍在执行的阶段并抛出该阶段的异常
+        """
+        pending = list(self.pipeline.order)
+        running: Dict[asyncio.Task, Stage] = {}
+
+        try:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.pipeline.stages[name]
+                    if all(dependency in self.values for dependency in stage.inputs):
+                        pending.remove(name)
+                        running[asyncio.create_task(self._run_stage(stage))] = stage
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    stage = running.pop(finished)
+                    self.values[stage.name] = finished.result()
+                    self.fractions[stage.name] = 1.0
+                    self._notify()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return self.values
@@ -14,6 +14,8 @@ import sys
 import os
 from typing import Dict, Any, List
 
+from services.task_registry import TaskRegistry
+
 # Supabase配置
 SUPABASE_URL = "https://your-project-id.supabase.co"
 SUPABASE_ANON_KEY = "your-supabase-anon-key-here"
@@ -437,8 +439,30 @@ async def test_supabase():
         }
 
 # 添加传记生成相关的API端点
-tasks_storage = {}
-uploaded_files_storage = {}  # 存储上传的文件信息
+uploaded_files_storage = {}  # 存储上传的文件信息（随任务一起淘汰）
+
+def _release_task_files(task_id: str, task: Dict[str, Any]):
+    """任务淘汰时同步释放上传文件信息"""
+    uploaded_files_storage.pop(task_id, None)
+
+# 任务结束1小时后淘汰，并删除对应的上传文件
+tasks_storage = TaskRegistry(
+    ttl_seconds=float(os.getenv("TASK_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("TASK_MAX_ENTRIES", "500")),
+    file_fields=("uploaded_files",),
+    on_evict=_release_task_files,
+    name="dashboard_tasks"
+)
+
+@app.on_event("startup")
+async def start_task_sweeper():
+    """启动过期任务清理"""
+    tasks_storage.start_sweeper()
+
+@app.on_event("shutdown")
+async def stop_task_sweeper():
+    """停止过期任务清理"""
+    await tasks_storage.stop_sweeper()
 
 @app.post("/api/biography/create")
 async def create_biography(
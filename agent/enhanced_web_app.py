@@ -57,6 +57,8 @@ except ImportError as e:
     print(f"❌ 简化PDF生成器不可用: {e}")
     SIMPLE_PDF_AVAILABLE = False
 
+from services.task_registry import TaskRegistry
+
 # 导入AI服务
 try:
     from services.ai_service import ai_service, analyze_image, generate_biography
@@ -96,7 +98,13 @@ class AIModelConfig(BaseModel):
 
 # 全局变量
 app = FastAPI(title="Biography AI Agent", description="个人传记生成智能助手", version="2.0.0")
-tasks = {}  # 存储任务状态
+# 存储任务状态：任务结束1小时后淘汰，并删除上传的图片和生成的PDF
+tasks = TaskRegistry(
+    ttl_seconds=float(os.getenv("TASK_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("TASK_MAX_ENTRIES", "500")),
+    file_fields=("files", "pdf_path"),
+    name="web_app_tasks"
+)
 
 def generate_basic_biography_content(user_requirements: str, image_descriptions: list, image_count: int, language: str = "zh-CN") -> str:
     """生成基础传记内容 - 即使AI服务不可用也能生成丰富内容"""
@@ -210,6 +218,16 @@ OUTPUT_DIR = Path("output")
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+@app.on_event("startup")
+async def start_task_sweeper():
+    """启动过期任务清理"""
+    tasks.start_sweeper()
+
+@app.on_event("shutdown")
+async def stop_task_sweeper():
+    """停止过期任务清理"""
+    await tasks.stop_sweeper()
+
 @app.get("/api/health")
 async def health_check():
     """健康检查端点"""
@@ -6,14 +6,50 @@ AI服务模块 - 支持豆包(Doubao)模型集成
 
 import os
 import json
+import base64
 import asyncio
 import aiohttp
-from typing import Dict, List, Any, Optional, Union
+import inspect
+from typing import Dict, List, Any, Optional, Set, Union, Tuple
 from abc import ABC, abstractmethod
 from datetime import datetime
 import logging
 from dataclasses import dataclass
 import re
+import time
+import hashlib
+
+from .analysis_cache import AnalysisCache
+from .circuit_breaker import CircuitBreaker, CircuitBreakerConfig, CircuitState
+from .single_flight import SingleFlight, ChunkCallback
+from ..core.models import ImageAnalysisResult
+from ..tools.lightweight_image_processor import LightweightImageProcessor
+from ..tools.image_ingest import AI_DERIVATIVE_SIZE, find_derivative, find_derivative_for_size
+from .prompt_budget import PromptBudget, estimate_tokens, fit_prompt_sections, rank_analyses
+from .tracing import get_tracer, current_span
+from .metrics import (
+    UPSTREAM_DURATION, ANALYSIS_CACHE, FALLBACKS, RATE_LIMITED, RETRIES, TOKENS, LIMITER_QUEUE_DEPTH,
+    HTTP_CONNECTIONS, HTTP_POOL_WAIT, HTTP_IN_FLIGHT, HTTP_REUSE_RATIO, HTTP_POOL_SATURATION
+)
+from .rate_limiter import (
+    AdaptiveRateLimiter, RateLimiterConfig, RateLimitError, DeadlineExceededError, parse_retry_after
+)
+
+# 传记图片分析的结构化输出字段说明
+BIOGRAPHY_ANALYSIS_FIELDS = """- description: 图片内容的详细描述（人物、场景、活动、情绪）
+- key_elements: 关键元素列表
+- people: 人物列表，每项为 {"description": "...", "emotion": "..."}
+- objects: 物体列表，每项为 {"name": "..."}
+- scene: 场景对象 {"location": "...", "setting": "...", "time_of_day": "..."}
+- emotions: 情感标签列表
+- confidence: 0到1之间的分析置信度"""
+
+BIOGRAPHY_ANALYSIS_PROMPT = f"""请分析这张图片，用于撰写个人传记。只返回一个JSON对象，包含以下字段：
+{BIOGRAPHY_ANALYSIS_FIELDS}"""
+
+BATCH_ANALYSIS_PROMPT = """下面按顺序给出了{count}张图片，请逐张分析，用于撰写个人传记。
+只返回一个长度为{count}的JSON数组，第i个元素对应第i张图片，每个元素是包含以下字段的JSON对象：
+""" + BIOGRAPHY_ANALYSIS_FIELDS
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -29,21 +65,115 @@ class AIModelConfig:
     max_tokens: int = 4000
     temperature: float = 0.7
 
+@dataclass
+class ConnectionPoolConfig:
+    """HTTP连接池配置"""
+    limit: int = 100  # 连接池总连接数上限
+    limit_per_host: int = 20  # 单个主机的连接数上限
+    keepalive_timeout: float = 60.0  # 空闲连接保活时间（秒）
+    ttl_dns_cache: int = 300  # DNS缓存时间（秒）
+
+
+@dataclass
+class HedgeConfig:
+    """对冲请求配置：主方案迟迟未返回时同时请求备用方案，取先返回的结果"""
+    enabled: bool = False
+    operations: tuple = ("analyze_image",)  # 启用对冲的操作
+    latency_percentile: float = 95.0  # 主方案等待超过近期该分位延迟后发起对冲
+    min_samples: int = 5  # 样本不足时使用默认等待时间
+    default_delay_seconds: float = 20.0
+    budget_ratio: float = 0.1  # 对冲请求数占符合条件请求数的上限（最大为1，即最多翻倍）
+
+
+class _HedgeExhausted(Exception):
+    """对冲请求中主备方案均已失败"""
+
+
+class ConnectionPoolMetrics:
+    """连接池指标 - 通过aiohttp的TraceConfig统计连接复用和排队情况，同时写入指标注册表"""
+    
+    def __init__(self):
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.requests_queued = 0  # 因连接池满而排队的请求总数
+        self.queue_wait_seconds = 0.0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+    
+    def create_trace_config(self) -> aiohttp.TraceConfig:
+        """创建用于采集指标的TraceConfig"""
+        trace_config = aiohttp.TraceConfig()
+        
+        async def on_request_start(session, ctx, params):
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        
+        async def on_request_done(session, ctx, params):
+            self.in_flight = max(0, self.in_flight - 1)
+        
+        async def on_queued_start(session, ctx, params):
+            ctx.queued_at = time.monotonic()
+            self.requests_queued += 1
+        
+        async def on_queued_end(session, ctx, params):
+            queued_at = getattr(ctx, "queued_at", None)
+            if queued_at is not None:
+                wait = time.monotonic() - queued_at
+                self.queue_wait_seconds += wait
+                HTTP_POOL_WAIT.observe(wait)
+        
+        async def on_connection_create_end(session, ctx, params):
+            self.connections_created += 1
+            HTTP_CONNECTIONS.inc(kind="created")
+        
+        async def on_connection_reuseconn(session, ctx, params):
+            self.connections_reused += 1
+            HTTP_CONNECTIONS.inc(kind="reused")
+        
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_done)
+        trace_config.on_request_exception.append(on_request_done)
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+    
+    def snapshot(self, pool_config: ConnectionPoolConfig) -> Dict[str, Any]:
+        """导出当前指标"""
+        total_connections = self.connections_created + self.connections_reused
+        return {
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": round(self.connections_reused / total_connections, 3) if total_connections else 0.0,
+            "requests_queued": self.requests_queued,
+            "queue_wait_seconds": round(self.queue_wait_seconds, 3),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturation": round(self.in_flight / pool_config.limit, 3) if pool_config.limit else 0.0,
+            "limit": pool_config.limit,
+            "limit_per_host": pool_config.limit_per_host
+        }
+
+
 class BaseAIProvider(ABC):
     """AI服务提供商基类"""
     
-    def __init__(self, config: AIModelConfig):
+    def __init__(self, config: AIModelConfig, session: Optional[aiohttp.ClientSession] = None):
         self.config = config
-        self.session = None
+        self.session = session
+        # 外部传入的共享会话由其所有者负责关闭
+        self._owns_session = session is None
     
     async def __aenter__(self):
-        # 配置SSL设置，跳过证书验证（仅用于测试）
-        connector = aiohttp.TCPConnector(ssl=False)
-        self.session = aiohttp.ClientSession(connector=connector)
+        if self.session is None:
+            # 配置SSL设置，跳过证书验证（仅用于测试）
+            connector = aiohttp.TCPConnector(ssl=False)
+            self.session = aiohttp.ClientSession(connector=connector)
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        if self.session and self._owns_session:
             await self.session.close()
     
     @abstractmethod
@@ -64,13 +194,49 @@ class BaseAIProvider(ABC):
 class DoubaoProvider(BaseAIProvider):
     """豆包AI服务提供商"""
     
-    def __init__(self, config: AIModelConfig, is_backup: bool = False):
-        super().__init__(config)
+    # 各操作使用的模型：(主方案模型, 备用方案模型)
+    OPERATION_MODELS = {
+        "analyze_image": ("doubao-vision-pro-32k-241028", "doubao-1-5-thinking-vision-pro-250428"),
+        "analyze_images": ("doubao-vision-pro-32k-241028", "doubao-1-5-thinking-vision-pro-250428"),
+        "generate_text": ("doubao-seed-1-6-250615", "doubao-seed-1-6-thinking-250615"),
+        "optimize_text": ("doubao-seed-1-6-250615", "doubao-seed-1-6-thinking-250615")
+    }
+    
+    @classmethod
+    def model_for(cls, operation: str, is_backup: bool = False) -> str:
+        """获取操作对应的模型ID"""
+        if operation not in cls.OPERATION_MODELS:
+            raise ValueError(f"不支持的操作: {operation}")
+        primary_model, backup_model = cls.OPERATION_MODELS[operation]
+        return backup_model if is_backup else primary_model
+    
+    def __init__(
+        self,
+        config: AIModelConfig,
+        is_backup: bool = False,
+        session: Optional[aiohttp.ClientSession] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None
+    ):
+        super().__init__(config, session)
+        self.rate_limiter = rate_limiter
         self.is_backup = is_backup
         self.provider_name = "豆包备用方案" if is_backup else "豆包主方案"
+        # 最近一次请求实际发出的时间（限流器放行之后），用于计算上游延迟
+        self.sent_at: Optional[float] = None
     
-    async def _make_request(self, messages: List[Dict], model_override: str = None) -> str:
-        """发送API请求"""
+    async def _make_request(
+        self,
+        messages: List[Dict],
+        model_override: str = None,
+        on_chunk: Optional[ChunkCallback] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """
+        发送API请求
+        
+        传入 on_chunk 时使用SSE流式模式，每收到一段增量文本就回调一次，
+        最终仍返回完整文本
+        """
         if not self.session:
             raise RuntimeError("Session not initialized. Use async context manager.")
         
@@ -82,10 +248,64 @@ class DoubaoProvider(BaseAIProvider):
         data = {
             "model": model_override or self.config.model_id,
             "messages": messages,
-            "max_tokens": self.config.max_tokens,
+            "max_tokens": max_tokens or self.config.max_tokens,
             "temperature": self.config.temperature
         }
+        if on_chunk is not None:
+            data["stream"] = True
+            # 流式响应最后一个事件携带token用量
+            data["stream_options"] = {"include_usage": True}
         
+        estimated_tokens = self._estimate_tokens(messages, data["max_tokens"])
+        span = current_span()
+        span.set_attributes({"ai.model": data["model"], "ai.tokens.estimated": estimated_tokens, "ai.retries": 0})
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(estimated_tokens)
+            self.sent_at = time.monotonic()
+            try:
+                content = await self._send_request(headers, data, estimated_tokens, on_chunk)
+            except RateLimitError as e:
+                if not self.rate_limiter:
+                    raise
+                self.rate_limiter.on_rate_limited(e.retry_after)
+                if attempt >= self.rate_limiter.config.max_retries:
+                    raise
+                await self.rate_limiter.sleep_before_retry(attempt, e.retry_after)
+                RETRIES.inc(model=data["model"])
+                attempt += 1
+                span.set_attribute("ai.retries", attempt)
+                logger.info(f"[{self.provider_name}] 429限流后第{attempt}次重试")
+                continue
+            
+            if self.rate_limiter:
+                self.rate_limiter.on_success()
+            return content
+    
+    def _estimate_tokens(self, messages: List[Dict], max_tokens: int) -> int:
+        """粗略估算请求的token消耗（输入文本 + 图片 + 预期输出）"""
+        input_tokens = 0
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                input_tokens += estimate_tokens(content)
+                continue
+            for part in content or []:
+                if part.get("type") == "text":
+                    input_tokens += estimate_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    input_tokens += 1000
+        return input_tokens + min(max_tokens, 1500)
+    
+    async def _send_request(
+        self,
+        headers: Dict[str, str],
+        data: Dict[str, Any],
+        estimated_tokens: int,
+        on_chunk: Optional[ChunkCallback]
+    ) -> str:
+        """发送一次请求，429时抛出 RateLimitError"""
         try:
             logger.info(f"[{self.provider_name}] 发送请求到: {self.config.base_url}")
             logger.debug(f"[{self.provider_name}] 请求数据: {json.dumps(data, ensure_ascii=False, indent=2)}")
@@ -98,10 +318,23 @@ class DoubaoProvider(BaseAIProvider):
             ) as response:
                 
                 if response.status == 200:
-                    result = await response.json()
-                    content = result["choices"][0]["message"]["content"]
+                    if on_chunk is not None:
+                        content, usage = await self._read_stream(response, on_chunk)
+                    else:
+                        result = await response.json()
+                        content = result["choices"][0]["message"]["content"]
+                        usage = result.get("usage") or {}
+                    self._record_usage(data["model"], usage, estimated_tokens)
                     logger.info(f"[{self.provider_name}] 请求成功")
                     return content
+                elif response.status == 429:
+                    error_text = await response.text()
+                    RATE_LIMITED.inc(model=data["model"])
+                    logger.warning(f"[{self.provider_name}] API限流 429: {error_text}")
+                    raise RateLimitError(
+                        f"API请求失败: 429 - {error_text}",
+                        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
                 else:
                     error_text = await response.text()
                     logger.error(f"[{self.provider_name}] API错误 {response.status}: {error_text}")
@@ -111,10 +344,65 @@ class DoubaoProvider(BaseAIProvider):
             logger.error(f"[{self.provider_name}] 请求异常: {str(e)}")
             raise
     
+    def _record_usage(self, model: str, usage: Dict[str, Any], estimated_tokens: int):
+        """把上游报告的token用量写入追踪、指标和限流器"""
+        if not usage:
+            return
+        current_span().set_attributes({
+            "ai.tokens.prompt": usage.get("prompt_tokens"),
+            "ai.tokens.completion": usage.get("completion_tokens"),
+            "ai.tokens.total": usage.get("total_tokens")
+        })
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                TOKENS.inc(usage[f"{kind}_tokens"], model=model, kind=kind)
+        if self.rate_limiter and usage.get("total_tokens"):
+            self.rate_limiter.record_usage(estimated_tokens, usage["total_tokens"])
+    
+    async def _read_stream(
+        self,
+        response: aiohttp.ClientResponse,
+        on_chunk: ChunkCallback
+    ) -> Tuple[str, Dict[str, Any]]:
+        """解析SSE流式响应，逐段回调增量文本，返回完整文本和token用量"""
+        content = ""
+        usage: Dict[str, Any] = {}
+        
+        async for raw_line in response.content:
+            line = raw_line.decode("utf-8", errors="ignore").strip()
+            if not line.startswith("data:"):
+                continue
+            
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            
+            try:
+                event = json.loads(payload)
+            except json.JSONDecodeError:
+                logger.debug(f"[{self.provider_name}] 跳过无法解析的流式数据: {payload[:100]}")
+                continue
+            
+            usage = event.get("usage") or usage
+            choices = event.get("choices") or []
+            if not choices:
+                continue
+            chunk = (choices[0].get("delta") or {}).get("content") or ""
+            if not chunk:
+                continue
+            
+            # 维护累计文本，避免每段增量都重新拼接全部片段
+            content += chunk
+            callback_result = on_chunk(chunk, content)
+            if inspect.isawaitable(callback_result):
+                await callback_result
+        
+        return content, usage
+    
     async def analyze_image(self, image_url: str, prompt: str) -> str:
         """分析图片内容"""
         # 根据是否为备用方案选择不同的模型
-        model = "doubao-1-5-thinking-vision-pro-250428" if self.is_backup else "doubao-vision-pro-32k-241028"
+        model = self.model_for("analyze_image", self.is_backup)
         
         messages = [{
             "role": "user",
@@ -134,10 +422,36 @@ class DoubaoProvider(BaseAIProvider):
         
         return await self._make_request(messages, model)
     
-    async def generate_text(self, prompt: str, context: str = "") -> str:
-        """生成文本内容"""
+    async def analyze_images(self, image_urls: List[str], prompt: str) -> str:
+        """在一条多模态消息中分析多张图片"""
+        model = self.model_for("analyze_images", self.is_backup)
+        
+        content = [{"type": "text", "text": prompt}]
+        for image_url in image_urls:
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": image_url
+                }
+            })
+        
+        messages = [{
+            "role": "user",
+            "content": content
+        }]
+        
+        return await self._make_request(messages, model)
+    
+    async def generate_text(
+        self,
+        prompt: str,
+        context: str = "",
+        on_chunk: Optional[ChunkCallback] = None,
+        max_tokens: Optional[int] = None
+    ) -> str:
+        """生成文本内容（传入 on_chunk 时流式输出，max_tokens 覆盖默认输出上限）"""
         # 根据是否为备用方案选择不同的模型
-        model = "doubao-seed-1-6-thinking-250615" if self.is_backup else "doubao-seed-1-6-250615"
+        model = self.model_for("generate_text", self.is_backup)
         
         full_prompt = f"{context}\n\n{prompt}" if context else prompt
         
@@ -151,12 +465,12 @@ class DoubaoProvider(BaseAIProvider):
             ]
         }]
         
-        return await self._make_request(messages, model)
+        return await self._make_request(messages, model, on_chunk=on_chunk, max_tokens=max_tokens)
     
     async def optimize_text(self, text: str, style: str = "professional") -> str:
         """优化文本内容"""
         # 备用方案使用thinking模型进行文本优化
-        model = "doubao-seed-1-6-thinking-250615" if self.is_backup else "doubao-seed-1-6-250615"
+        model = self.model_for("optimize_text", self.is_backup)
         
         style_prompts = {
             "professional": "请将以下文本优化为专业、正式的表达方式",
@@ -182,7 +496,15 @@ class DoubaoProvider(BaseAIProvider):
 class AIService:
     """AI服务管理器 - 支持主备方案自动切换"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        pool_config: Optional[ConnectionPoolConfig] = None,
+        analysis_cache: Optional[AnalysisCache] = None,
+        breaker_config: Optional[CircuitBreakerConfig] = None,
+        hedge_config: Optional[HedgeConfig] = None,
+        rate_limiter_config: Optional[RateLimiterConfig] = None,
+        prompt_budget: Optional[PromptBudget] = None
+    ):
         # 主方案配置
         self.primary_config = AIModelConfig(
             name="豆包主方案",
@@ -203,69 +525,452 @@ class AIService:
             temperature=0.7
         )
         
-        self.failure_count = 0
-        self.max_failures = 3  # 最大失败次数，超过后切换到备用方案
-        self.using_backup = False
+        # 按模型熔断：主方案模型熔断期间直接走备用方案，冷却后半开探测自动恢复
+        self.breaker_config = breaker_config or CircuitBreakerConfig()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        
+        # 对冲请求（默认关闭）
+        self.hedge_config = hedge_config or HedgeConfig()
+        self.hedge_stats = {"eligible": 0, "sent": 0, "backup_wins": 0, "primary_wins": 0, "skipped_by_budget": 0}
+        
+        # 合并相同的并发请求（客户端重试产生的重复任务）
+        self.single_flight = SingleFlight()
+        
+        # 所有AI调用共享的自适应限流器
+        self.rate_limiter = AdaptiveRateLimiter(rate_limiter_config)
+        LIMITER_QUEUE_DEPTH.set_function(lambda: self.rate_limiter.queue_depth)
+        
+        # 传记生成提示词的token预算，以及最近一次请求的提示词规模
+        self.prompt_budget = prompt_budget or PromptBudget()
+        self.last_prompt_report: Optional[Dict[str, Any]] = None
+        
+        # 进程级共享连接池，所有主备方案请求复用同一个ClientSession
+        self.pool_config = pool_config or ConnectionPoolConfig()
+        self.pool_metrics = ConnectionPoolMetrics()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing_sessions: Set[asyncio.Future] = set()
+        HTTP_IN_FLIGHT.set_function(lambda: self.pool_metrics.in_flight)
+        HTTP_REUSE_RATIO.set_function(lambda: self.pool_metrics.snapshot(self.pool_config)["reuse_ratio"])
+        HTTP_POOL_SATURATION.set_function(lambda: self.pool_metrics.snapshot(self.pool_config)["saturation"])
+        
+        # 视觉分析结果缓存，重新生成传记时跳过重复的图片分析
+        self.analysis_cache = analysis_cache or AnalysisCache()
     
-    async def _execute_with_fallback(self, operation: str, *args, **kwargs):
-        """执行操作，支持自动故障转移"""
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话，首次使用或事件循环变化时创建"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._close_stale_session()
+            connector = aiohttp.TCPConnector(
+                ssl=False,
+                limit=self.pool_config.limit,
+                limit_per_host=self.pool_config.limit_per_host,
+                keepalive_timeout=self.pool_config.keepalive_timeout,
+                ttl_dns_cache=self.pool_config.ttl_dns_cache,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[self.pool_metrics.create_trace_config()]
+            )
+            self._session_loop = loop
+            logger.info(
+                f"🔌 已创建共享HTTP连接池 (limit={self.pool_config.limit}, "
+                f"limit_per_host={self.pool_config.limit_per_host})"
+            )
+        return self._session
+    
+    def _close_stale_session(self):
+        """关闭绑定在旧事件循环上的会话，避免泄漏其连接器和套接字"""
+        session, loop = self._session, self._session_loop
+        self._session = None
+        self._session_loop = None
+        if session is None or session.closed:
+            return
+        logger.warning("⚠️ 事件循环已变化，关闭旧的共享HTTP连接池")
+        if loop is not None and loop.is_running():
+            # 旧事件循环仍在其他线程中运行：在该循环上关闭
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # 旧事件循环已停止：连接器在关闭开始时同步关闭全部连接，
+        # 之后等待旧循环上的关闭回调会失败，忽略即可
+        self._closing_sessions.add(asyncio.ensure_future(self._close_quietly(session)))
+        self._closing_sessions = {task for task in self._closing_sessions if not task.done()}
+    
+    @staticmethod
+    async def _close_quietly(session: aiohttp.ClientSession):
+        try:
+            await session.close()
+        except Exception as e:
+            logger.debug(f"关闭旧HTTP连接池时出现异常: {e}")
+    
+    async def close(self):
+        """关闭共享连接池（应用关闭时调用）"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info("🔌 共享HTTP连接池已关闭")
+        self._session = None
+        self._session_loop = None
+    
+    def _get_breaker(self, model_id: str) -> CircuitBreaker:
+        """获取模型对应的熔断器"""
+        if model_id not in self.breakers:
+            self.breakers[model_id] = CircuitBreaker(model_id, self.breaker_config)
+        return self.breakers[model_id]
+    
+    @property
+    def using_backup(self) -> bool:
+        """是否有主方案模型处于熔断（非关闭）状态"""
+        primary_models = {models[0] for models in DoubaoProvider.OPERATION_MODELS.values()}
+        return any(
+            self.breakers[model].state != CircuitState.CLOSED
+            for model in primary_models if model in self.breakers
+        )
+    
+    async def _call_provider(self, config: AIModelConfig, is_backup: bool, operation: str, *args, **kwargs):
+        """
+        调用指定方案执行操作，并把结果计入对应模型的熔断器
         
-        # 首先尝试主方案（除非已经切换到备用方案）
-        if not self.using_backup:
-            try:
-                async with DoubaoProvider(self.primary_config, is_backup=False) as provider:
+        延迟从限流器放行、请求实际发出时开始计算；限流等待超过截止时间和429重试用尽
+        属于本地配额不足，只释放熔断器的探测名额，不计为失败
+        """
+        model_id = DoubaoProvider.model_for(operation, is_backup)
+        breaker = self._get_breaker(model_id)
+        start = time.monotonic()
+        span = get_tracer().span(
+            f"ai.{operation}",
+            **{"ai.operation": operation, "ai.model": model_id, "ai.backup": is_backup}
+        )
+        provider = DoubaoProvider(
+            config,
+            is_backup=is_backup,
+            session=self._get_session(),
+            rate_limiter=self.rate_limiter
+        )
+        try:
+            with span:
+                async with provider:
                     if operation == "analyze_image":
                         result = await provider.analyze_image(*args, **kwargs)
+                    elif operation == "analyze_images":
+                        result = await provider.analyze_images(*args, **kwargs)
                     elif operation == "generate_text":
                         result = await provider.generate_text(*args, **kwargs)
                     elif operation == "optimize_text":
                         result = await provider.optimize_text(*args, **kwargs)
                     else:
                         raise ValueError(f"不支持的操作: {operation}")
-                    
-                    # 成功时重置失败计数
-                    self.failure_count = 0
-                    logger.info(f"✅ 主方案成功执行 {operation}")
-                    return result
-                    
-            except Exception as e:
-                self.failure_count += 1
-                logger.warning(f"⚠️ 主方案失败 ({self.failure_count}/{self.max_failures}): {str(e)}")
-                
-                # 如果失败次数超过阈值，切换到备用方案
-                if self.failure_count >= self.max_failures:
-                    self.using_backup = True
-                    logger.warning(f"🔄 切换到备用方案")
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            self._observe_upstream(operation, model_id, "cancelled", provider.sent_at or start)
+            raise
+        except (RateLimitError, DeadlineExceededError) as e:
+            breaker.record_cancelled()
+            outcome = "rate_limited" if isinstance(e, RateLimitError) else "deadline_exceeded"
+            self._observe_upstream(operation, model_id, outcome, provider.sent_at or start)
+            raise
+        except Exception:
+            sent_at = provider.sent_at or start
+            breaker.record_failure(time.monotonic() - sent_at)
+            self._observe_upstream(operation, model_id, "error", sent_at)
+            raise
         
-        # 使用备用方案
+        sent_at = provider.sent_at or start
+        breaker.record_success(time.monotonic() - sent_at)
+        self._observe_upstream(operation, model_id, "success", sent_at)
+        return result
+    
+    @staticmethod
+    def _observe_upstream(operation: str, model_id: str, outcome: str, start: float):
+        UPSTREAM_DURATION.observe(time.monotonic() - start, operation=operation, model=model_id, outcome=outcome)
+    
+    def _hedge_delay(self, breaker: CircuitBreaker) -> float:
+        """根据主方案近期延迟计算发起对冲前的等待时间"""
+        if breaker.success_count() < self.hedge_config.min_samples:
+            return self.hedge_config.default_delay_seconds
+        return breaker.latency_percentile(self.hedge_config.latency_percentile)
+    
+    def _hedge_budget_available(self) -> bool:
+        """对冲预算是否充足，保证对冲请求数不超过符合条件请求数的 budget_ratio 倍"""
+        ratio = min(max(self.hedge_config.budget_ratio, 0.0), 1.0)
+        return self.hedge_stats["sent"] + 1 <= ratio * self.hedge_stats["eligible"]
+    
+    async def _execute_hedged(self, operation: str, breaker: CircuitBreaker, *args, **kwargs):
+        """
+        执行带对冲的主方案请求，返回结果和是否由备用方案返回
+        
+        主方案在等待时间内未返回且预算充足时，同时请求备用方案，
+        采用先成功返回的结果并取消另一个请求
+        """
+        self.hedge_stats["eligible"] += 1
+        primary = asyncio.ensure_future(
+            self._call_provider(self.primary_config, False, operation, *args, **kwargs)
+        )
+        pending = {primary}
         try:
-            async with DoubaoProvider(self.backup_config, is_backup=True) as provider:
-                if operation == "analyze_image":
-                    result = await provider.analyze_image(*args, **kwargs)
-                elif operation == "generate_text":
-                    result = await provider.generate_text(*args, **kwargs)
-                elif operation == "optimize_text":
-                    result = await provider.optimize_text(*args, **kwargs)
+            done, _ = await asyncio.wait(pending, timeout=self._hedge_delay(breaker))
+            if done:
+                return primary.result(), False
+            
+            if not self._hedge_budget_available():
+                self.hedge_stats["skipped_by_budget"] += 1
+                return await primary, False
+            
+            self.hedge_stats["sent"] += 1
+            FALLBACKS.inc(operation=operation, reason="hedge")
+            logger.info(f"🪁 主方案 {operation} 响应较慢，发起备用方案对冲请求")
+            backup = asyncio.ensure_future(
+                self._call_provider(self.backup_config, True, operation, *args, **kwargs)
+            )
+            pending = {primary, backup}
+            errors = []
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    if finished.exception() is None:
+                        self.hedge_stats["backup_wins" if finished is backup else "primary_wins"] += 1
+                        return finished.result(), finished is backup
+                    errors.append(finished.exception())
+            
+            raise _HedgeExhausted(f"主方案错误: {errors[0]}, 备用方案错误: {errors[-1]}")
+        finally:
+            for unfinished in pending:
+                unfinished.cancel()
+    
+    @staticmethod
+    def _request_key(operation: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+        """根据操作和请求参数生成归一化的请求键"""
+        payload = json.dumps(
+            {"operation": operation, "args": list(args), "kwargs": kwargs},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def _execute_with_fallback(self, operation: str, *args, **kwargs):
+        """执行操作，相同的并发请求只向上游发送一次"""
+        result, _ = await self._execute_with_model(operation, *args, **kwargs)
+        return result
+    
+    async def _execute_with_model(self, operation: str, *args, **kwargs) -> Tuple[Any, str]:
+        """执行操作，返回结果和实际返回结果的模型ID"""
+        on_chunk = kwargs.pop("on_chunk", None)
+        # 请求键不包含回调，但流式与非流式请求的上游调用方式不同，分开合并
+        key = self._request_key(operation, args, {**kwargs, "stream": on_chunk is not None})
+        if on_chunk is None:
+            return await self.single_flight.do(
+                key,
+                lambda: self._run_with_fallback(operation, *args, **kwargs)
+            )
+        
+        # 流式请求由第一个调用方发起，每段增量文本分发给所有等待者各自的回调
+        return await self.single_flight.do_stream(
+            key,
+            lambda fanout: self._run_with_fallback(operation, *args, on_chunk=fanout, **kwargs),
+            on_chunk
+        )
+    
+    async def _run_with_fallback(self, operation: str, *args, **kwargs) -> Tuple[Any, str]:
+        """执行操作，支持基于熔断器的自动故障转移和可选的对冲请求，返回结果和实际返回结果的模型ID"""
+        primary_error = None
+        primary_breaker = self._get_breaker(DoubaoProvider.model_for(operation))
+        hedging = self.hedge_config.enabled and operation in self.hedge_config.operations
+        
+        # 主方案熔断器放行时先尝试主方案（半开状态下该请求即为探测请求）
+        if primary_breaker.allow_request():
+            try:
+                if hedging:
+                    result, is_backup = await self._execute_hedged(operation, primary_breaker, *args, **kwargs)
                 else:
-                    raise ValueError(f"不支持的操作: {operation}")
-                
-                logger.info(f"✅ 备用方案成功执行 {operation}")
-                return result
-                
+                    result, is_backup = await self._call_provider(
+                        self.primary_config, False, operation, *args, **kwargs
+                    ), False
+                logger.info(f"✅ 成功执行 {operation}")
+                return result, DoubaoProvider.model_for(operation, is_backup)
+            except _HedgeExhausted as e:
+                logger.error(f"❌ 对冲请求主备方案都失败了: {str(e)}")
+                raise Exception(f"主备方案都失败了。{str(e)}")
+            except Exception as e:
+                primary_error = e
+                logger.warning(f"⚠️ 主方案失败 ({primary_breaker.state.value}): {str(e)}")
+        else:
+            logger.info(f"⏭️ 主方案模型 {primary_breaker.name} 熔断中，直接使用备用方案")
+        
+        FALLBACKS.inc(operation=operation, reason="circuit_open" if primary_error is None else "primary_error")
+        
+        # 使用备用方案（兜底，不受熔断器拦截）
+        try:
+            result = await self._call_provider(self.backup_config, True, operation, *args, **kwargs)
+            logger.info(f"✅ 备用方案成功执行 {operation}")
+            return result, DoubaoProvider.model_for(operation, True)
         except Exception as e:
             logger.error(f"❌ 备用方案也失败了: {str(e)}")
-            raise Exception(f"主备方案都失败了。主方案错误次数: {self.failure_count}, 备用方案错误: {str(e)}")
+            raise Exception(f"主备方案都失败了。主方案错误: {primary_error or '熔断中'}, 备用方案错误: {str(e)}")
     
-    async def analyze_image(self, image_url: str, prompt: str = "请详细描述这张图片的内容，包括人物、场景、活动、情绪等细节") -> str:
-        """分析图片内容"""
-        return await self._execute_with_fallback("analyze_image", image_url, prompt)
+    async def analyze_image(
+        self,
+        image_url: str,
+        prompt: str = "请详细描述这张图片的内容，包括人物、场景、活动、情绪等细节",
+        use_cache: bool = True
+    ) -> str:
+        """
+        分析图片内容（按图片内容、提示词和实际返回结果的模型缓存结果）
+        
+        先查主方案模型的缓存；主方案熔断期间请求会由备用方案处理，此时也复用备用方案模型的缓存
+        """
+        if not use_cache:
+            return await self._execute_with_fallback("analyze_image", image_url, prompt)
+        
+        with get_tracer().span("ai.cached_analysis") as span:
+            image_bytes = await asyncio.to_thread(AnalysisCache.normalize_image, image_url)
+            models = [DoubaoProvider.model_for("analyze_image")]
+            if self._get_breaker(models[0]).state != CircuitState.CLOSED:
+                models.append(DoubaoProvider.model_for("analyze_image", True))
+            
+            for model_id in models:
+                cache_key = AnalysisCache.make_key(image_bytes, prompt, model_id)
+                cached = await self.analysis_cache.get(cache_key)
+                if cached is not None:
+                    break
+            span.set_attribute("ai.cache_hit", cached is not None)
+            ANALYSIS_CACHE.inc(result="hit" if cached is not None else "miss")
+            if cached is not None:
+                logger.info(f"💾 图片分析命中缓存 {cache_key[:12]} ({model_id})")
+                return cached
+            
+            result, model_id = await self._execute_with_model("analyze_image", image_url, prompt)
+            await self.analysis_cache.set(AnalysisCache.make_key(image_bytes, prompt, model_id), result)
+            return result
     
-    async def generate_text(self, prompt: str, context: str = "") -> str:
-        """生成文本内容（通用方法）"""
-        return await self._execute_with_fallback("generate_text", prompt, context)
+    @staticmethod
+    def _extract_json(text: str, opening: str, closing: str) -> Any:
+        """从模型输出中提取JSON（兼容```json代码块和前后说明文字）"""
+        start = text.find(opening)
+        end = text.rfind(closing)
+        if start == -1 or end <= start:
+            raise ValueError("模型输出中未找到JSON")
+        return json.loads(text[start:end + 1])
+    
+    @staticmethod
+    def _analysis_from_dict(file_path: str, data: Dict[str, Any]) -> ImageAnalysisResult:
+        """将模型返回的JSON对象转换为ImageAnalysisResult"""
+        def as_list(value) -> list:
+            if value is None:
+                return []
+            return value if isinstance(value, list) else [value]
+        
+        people = [p if isinstance(p, dict) else {"description": str(p)} for p in as_list(data.get("people"))]
+        objects = [o if isinstance(o, dict) else {"name": str(o)} for o in as_list(data.get("objects"))]
+        scene = data.get("scene")
+        
+        try:
+            confidence = float(data.get("confidence", 0.8))
+        except (TypeError, ValueError):
+            confidence = 0.8
+        
+        return ImageAnalysisResult(
+            file_path=file_path,
+            description=str(data.get("description", "")),
+            key_elements=[str(e) for e in as_list(data.get("key_elements"))],
+            people=people,
+            objects=objects,
+            scene=scene if isinstance(scene, dict) else {"setting": str(scene or "")},
+            emotions=[str(e) for e in as_list(data.get("emotions"))],
+            confidence=confidence
+        )
+    
+    @staticmethod
+    def _encode_image(image_path: str, max_size: tuple) -> str:
+        """缩小图片并编码为data URL（优先使用上传时生成的衍生图）"""
+        if tuple(max_size) == AI_DERIVATIVE_SIZE:
+            derivative = find_derivative(image_path, "ai")
+            if derivative is not None:
+                # AI分析衍生图已是摆正、缩放好的JPEG，直接编码文件内容
+                with open(derivative, "rb") as f:
+                    return f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode('utf-8')}"
+        
+        processor = LightweightImageProcessor()
+        image = processor.load_image_for_size(find_derivative_for_size(image_path, max_size) or image_path, max_size)
+        if image is None:
+            raise ValueError(f"无法加载图像: {image_path}")
+        return f"data:image/jpeg;base64,{processor.to_base64(image, 'JPEG', 85)}"
+    
+    async def analyze_image_for_biography(self, image_path: str) -> ImageAnalysisResult:
+        """分析单张图片并返回结构化结果"""
+        image_url = await asyncio.to_thread(self._encode_image, image_path, AI_DERIVATIVE_SIZE)
+        result = await self.analyze_image(image_url, BIOGRAPHY_ANALYSIS_PROMPT)
+        
+        try:
+            data = self._extract_json(result, "{", "}")
+        except ValueError:
+            # 模型未按要求返回JSON时，把原始文本作为描述
+            data = {"description": result, "confidence": 0.5}
+        return self._analysis_from_dict(image_path, data)
+    
+    async def analyze_images_batch(
+        self,
+        image_paths: List[str],
+        max_batch_size: int = 4,
+        max_size: tuple = (768, 768)
+    ) -> List[ImageAnalysisResult]:
+        """
+        批量分析图片：每批最多 max_batch_size 张缩小后的图片合并为一次多模态请求
+        
+        某一批的返回结果无法解析或数量不符时，该批回退为逐张分析
+        """
+        results: List[ImageAnalysisResult] = []
+        batch_size = max(1, max_batch_size)
+        
+        for start in range(0, len(image_paths), batch_size):
+            batch = image_paths[start:start + batch_size]
+            if len(batch) == 1:
+                results.append(await self.analyze_image_for_biography(batch[0]))
+                continue
+            
+            try:
+                image_urls = await asyncio.gather(*(
+                    asyncio.to_thread(self._encode_image, path, max_size) for path in batch
+                ))
+                prompt = BATCH_ANALYSIS_PROMPT.replace("{count}", str(len(batch)))
+                result = await self._execute_with_fallback("analyze_images", list(image_urls), prompt)
+                
+                items = self._extract_json(result, "[", "]")
+                if not isinstance(items, list) or len(items) != len(batch):
+                    raise ValueError(f"返回了 {len(items) if isinstance(items, list) else 0} 条分析，期望 {len(batch)} 条")
+                
+                results.extend(
+                    self._analysis_from_dict(path, item if isinstance(item, dict) else {"description": str(item)})
+                    for path, item in zip(batch, items)
+                )
+                logger.info(f"🧩 批量分析 {len(batch)} 张图片成功")
+            except Exception as e:
+                logger.warning(f"⚠️ 批量分析失败，回退为逐张分析: {str(e)}")
+                results.extend(await asyncio.gather(*(
+                    self.analyze_image_for_biography(path) for path in batch
+                )))
+        
+        return results
     
-    async def generate_biography_text(self, image_analyses: List[str], user_requirements: str = "", style: str = "warm") -> str:
-        """生成传记文本"""
+    async def generate_text(
+        self,
+        prompt: str,
+        context: str = "",
+        on_chunk: Optional[ChunkCallback] = None
+    ) -> str:
+        """生成文本内容（通用方法，传入 on_chunk 时流式输出）"""
+        return await self._execute_with_fallback("generate_text", prompt, context, on_chunk=on_chunk)
+    
+    async def generate_biography_text(
+        self,
+        image_analyses: List[str],
+        user_requirements: str = "",
+        style: str = "warm",
+        on_chunk: Optional[ChunkCallback] = None,
+        priorities: Optional[List[float]] = None
+    ) -> str:
+        """生成传记文本（传入 on_chunk 时流式输出草稿，priorities 为图片分析超出预算时的保留优先级）"""
         
         # 添加调试日志
         print(f"🤖 AI服务收到传记生成请求:")
@@ -281,15 +986,20 @@ class AIService:
         if "Early Years" in user_requirements or "School Days" in user_requirements:
             print("⚠️ 需求中包含通用章节，这不应该出现")
         
+        # 按token预算裁剪用户需求和图片分析（用户需求优先，图片分析按相关度和人物保留）
+        fitted = fit_prompt_sections(user_requirements, image_analyses, self.prompt_budget, priorities)
+        prompt_requirements = fitted["user_requirements"]
+        prompt_analyses = fitted["image_analyses"]
+        
         # 超强化提示词 - 使用更严格的指令
         prompt = f"""
 🚨 CRITICAL INSTRUCTION: You MUST strictly follow these rules. Violation of ANY rule means COMPLETE FAILURE 🚨
 
 用户的真实信息：
-{user_requirements if user_requirements else "请写一篇个人传记"}
+{prompt_requirements if prompt_requirements else "请写一篇个人传记"}
 
 图片参考信息：
-{chr(10).join([f"{i+1}. {analysis}" for i, analysis in enumerate(image_analyses)])}
+{chr(10).join([f"{i+1}. {analysis}" for i, analysis in enumerate(prompt_analyses)])}
 
 ❌❌❌ ABSOLUTELY FORBIDDEN CONTENT (INSTANT FAILURE IF USED) ❌❌❌
 - "Early Years" / "童年时光" / "早年时期" / "幼年时代"  
@@ -331,9 +1041,23 @@ SUCCESS = 100% personalized content based ONLY on user's real information.
 现在请严格按照上述要求创作传记：
         """
         
-        print(f"📏 最终提示词长度: {len(prompt)} 字符")
+        report = fitted["report"]
+        report["prompt_tokens"] = estimate_tokens(prompt)
+        self.last_prompt_report = report
+        model = DoubaoProvider.model_for("generate_text")
+        TOKENS.inc(report["prompt_tokens"], model=model, kind="prompt_budget")
+        TOKENS.inc(report["output_tokens"], model=model, kind="output_budget")
+        logger.info(
+            f"📐 提示词预算: 提示词 {len(prompt)} 字符, 约 {report['prompt_tokens']} tokens; "
+            f"用户需求 {report['requirements_tokens']}/{report['requirements_tokens_original']} tokens; "
+            f"图片分析保留 {report['analyses_kept']}/{report['analyses_total']} 条, "
+            f"{report['analyses_tokens']}/{report['analyses_tokens_original']} tokens (预算 {report['analyses_budget']}); "
+            f"输出上限 {report['output_tokens']} tokens"
+        )
         
-        result = await self._execute_with_fallback("generate_text", prompt)
+        result = await self._execute_with_fallback(
+            "generate_text", prompt, on_chunk=on_chunk, max_tokens=self.prompt_budget.output_tokens
+        )
         
         # 检查生成结果质量
         print(f"📖 生成结果长度: {len(result)} 字符")
@@ -362,6 +1086,25 @@ SUCCESS = 100% personalized content based ONLY on user's real information.
         
         return result
     
+    async def generate_biography_content(
+        self,
+        image_analyses: List[Any],
+        user_requirements: str = "",
+        style: str = "warm",
+        on_chunk: Optional[ChunkCallback] = None
+    ) -> str:
+        """根据图片分析结果（ImageAnalysisResult或文本）生成传记文本"""
+        descriptions = [
+            getattr(analysis, "description", None) or str(analysis)
+            for analysis in image_analyses
+        ]
+        # 结构化结果中识别出人物的图片优先保留
+        people_counts = [len(getattr(analysis, "people", None) or []) for analysis in image_analyses]
+        priorities = rank_analyses(user_requirements, descriptions, people_counts)
+        return await self.generate_biography_text(
+            descriptions, user_requirements, style, on_chunk=on_chunk, priorities=priorities
+        )
+    
     async def optimize_text(self, text: str, style: str = "professional") -> str:
         """优化文本内容"""
         return await self._execute_with_fallback("optimize_text", text, style)
@@ -452,17 +1195,24 @@ SUCCESS = 100% personalized content based ONLY on user's real information.
         """获取AI服务状态"""
         return {
             "using_backup": self.using_backup,
-            "failure_count": self.failure_count,
-            "max_failures": self.max_failures,
+            "circuit_breakers": {
+                model_id: breaker.snapshot() for model_id, breaker in self.breakers.items()
+            },
+            "hedging": {"enabled": self.hedge_config.enabled, **self.hedge_stats},
+            "single_flight": self.single_flight.stats(),
+            "rate_limiter": self.rate_limiter.stats(),
+            "last_prompt": self.last_prompt_report,
             "primary_model": self.primary_config.model_id,
             "backup_model": self.backup_config.model_id,
-            "current_provider": "豆包备用方案" if self.using_backup else "豆包主方案"
+            "current_provider": "豆包备用方案" if self.using_backup else "豆包主方案",
+            "connection_pool": self.pool_metrics.snapshot(self.pool_config),
+            "analysis_cache": self.analysis_cache.stats()
         }
     
     def reset_to_primary(self):
-        """重置为主方案"""
-        self.using_backup = False
-        self.failure_count = 0
+        """重置为主方案（熔断器会自动恢复，此方法用于手动强制恢复）"""
+        for breaker in self.breakers.values():
+            breaker.reset()
         logger.info("🔄 已重置为主方案")
 
 # 全局AI服务实例
@@ -0,0 +1,232 @@
+"""
+图片分析缓存
+按图片内容哈希、提示词和模型ID对视觉分析结果做内容寻址缓存，
+包含内存LRU层和磁盘层，支持TTL过期、磁盘容量上限和命中率统计。
+磁盘层在首次写入时及之后每写入 purge_every 条在后台清理一次
+"""
+
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """视觉分析结果缓存（内存LRU + 磁盘）"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_memory_entries: int = 256,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_disk_bytes: Optional[int] = None,
+        purge_every: int = 200
+    ):
+        self.cache_dir = cache_dir or os.getenv(
+            "ANALYSIS_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "biography_analysis_cache")
+        )
+        self.max_memory_entries = max(1, max_memory_entries)
+        self.ttl_seconds = ttl_seconds
+        # 磁盘层容量上限（ANALYSIS_CACHE_MAX_MB，默认256MB），超出时删除最早写入的条目
+        self.max_disk_bytes = max_disk_bytes if max_disk_bytes is not None else int(
+            os.getenv("ANALYSIS_CACHE_MAX_MB", "256")
+        ) * 1024 * 1024
+        self.purge_every = max(1, purge_every)
+
+        # key -> (写入时间, 分析结果)
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        # 首次写入即触发一次清理，清掉上次运行遗留的过期条目
+        self._writes_since_purge = self.purge_every
+        self._purge_task: Optional[asyncio.Future] = None
+
+    @staticmethod
+    def normalize_image(image_ref: str) -> bytes:
+        """
+        将图片引用归一化为用于哈希的字节
+
+        data URL 和裸 base64 解码为原始图片字节，本地文件读取文件内容，
+        远程URL直接使用URL本身
+        """
+        if image_ref.startswith("data:"):
+            return base64.b64decode(image_ref.split(",", 1)[1])
+        if image_ref.startswith(("http://", "https://")):
+            return image_ref.encode("utf-8")
+        if os.path.isfile(image_ref):
+            with open(image_ref, "rb") as f:
+                return f.read()
+        try:
+            return base64.b64decode(image_ref, validate=True)
+        except Exception:
+            return image_ref.encode("utf-8")
+
+    @staticmethod
+    def make_key(image_bytes: bytes, prompt: str, model_id: str) -> str:
+        """根据图片内容、提示词和模型ID生成缓存键"""
+        digest = hashlib.sha256()
+        digest.update(hashlib.sha256(image_bytes).digest())
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(model_id.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _remember(self, key: str, stored_at: float, value: str):
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            stored_at = float(entry["stored_at"])
+            if self._is_expired(stored_at):
+                os.remove(path)
+                return None
+            return stored_at, entry["value"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取分析缓存失败 {path}: {e}")
+            return None
+
+    def _write_disk(self, key: str, stored_at: float, value: str):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": stored_at, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"写入分析缓存失败 {path}: {e}")
+
+    async def get(self, key: str) -> Optional[str]:
+        """查询缓存，先查内存再查磁盘"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if not self._is_expired(stored_at):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            del self._memory[key]
+
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is not None:
+            stored_at, value = entry
+            self._remember(key, stored_at, value)
+            self.disk_hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        """写入缓存（内存和磁盘）"""
+        stored_at = time.time()
+        self._remember(key, stored_at, value)
+        await asyncio.to_thread(self._write_disk, key, stored_at, value)
+        self._schedule_purge()
+
+    def _schedule_purge(self):
+        """累计写入达到 purge_every 条时在后台线程清理磁盘层（同一时间只有一个清理任务）"""
+        self._writes_since_purge += 1
+        if self._writes_since_purge < self.purge_every:
+            return
+        if self._purge_task is not None and not self._purge_task.done():
+            return
+        self._writes_since_purge = 0
+        self._purge_task = asyncio.ensure_future(asyncio.to_thread(self.purge_expired))
+        self._purge_task.add_done_callback(self._on_purge_done)
+
+    @staticmethod
+    def _on_purge_done(task: asyncio.Future):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"清理分析缓存失败: {task.exception()}")
+        elif task.result():
+            logger.info(f"🧹 已清理 {task.result()} 条分析缓存")
+
+    def purge_expired(self) -> int:
+        """清理过期的磁盘缓存，磁盘层超过容量上限时再删除最早写入的条目，返回删除的条目数"""
+        removed = 0
+        for key in [k for k, (stored_at, _) in self._memory.items() if self._is_expired(stored_at)]:
+            del self._memory[key]
+
+        if not os.path.isdir(self.cache_dir):
+            return removed
+
+        # (写入时间, 文件大小, 路径)
+        entries: List[Tuple[float, int, str]] = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith(".json"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        stored_at = float(json.load(f)["stored_at"])
+                    if self._is_expired(stored_at):
+                        os.remove(path)
+                        removed += 1
+                    else:
+                        entries.append((stored_at, os.path.getsize(path), path))
+                except Exception:
+                    continue
+
+        total_bytes = sum(size for _, size, _ in entries)
+        if self.max_disk_bytes > 0 and total_bytes > self.max_disk_bytes:
+            for _, size, path in sorted(entries):
+                if total_bytes <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total_bytes -= size
+                removed += 1
+                self.disk_evictions += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            "max_disk_bytes": self.max_disk_bytes
+        }
@@ -0,0 +1,88 @@
+"""
+阶段检查点存储
+传记流程每个阶段（图片分析、文本、二维码、排版、PDF等）完成后把输出写入磁盘，
+任务失败后可以从第一个未完成的阶段继续，换模板重新排版时复用已生成的文本
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+from dataclasses import asdict, is_dataclass
+from typing import Any, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value: Any) -> Any:
+    """序列化dataclass等非JSON类型"""
+    if is_dataclass(value):
+        return asdict(value)
+    return str(value)
+
+
+class CheckpointStore:
+    """
+    基于文件的检查点存储
+
+    每个任务一个目录，每个阶段一个JSON文件：{base_dir}/{task_id}/{stage}.json，
+    写入先落到临时文件再原子替换，进程崩溃不会留下半个检查点
+    """
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or os.getenv(
+            "CHECKPOINT_DIR",
+            os.path.join(tempfile.gettempdir(), "biography_checkpoints")
+        )
+
+    def _task_dir(self, task_id: str) -> str:
+        return os.path.join(self.base_dir, task_id)
+
+    def _path(self, task_id: str, stage: str) -> str:
+        return os.path.join(self._task_dir(task_id), f"{stage}.json")
+
+    def save(self, task_id: str, stage: str, data: Any):
+        """写入阶段检查点"""
+        os.makedirs(self._task_dir(task_id), exist_ok=True)
+        path = self._path(task_id, stage)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=_json_default)
+        os.replace(tmp_path, path)
+
+    def load(self, task_id: str, stage: str) -> Optional[Any]:
+        """读取阶段检查点，不存在或已损坏时返回None"""
+        try:
+            with open(self._path(task_id, stage), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"检查点读取失败 {task_id}/{stage}: {e}")
+            return None
+
+    def has(self, task_id: str, stage: str) -> bool:
+        return os.path.exists(self._path(task_id, stage))
+
+    def completed_stages(self, task_id: str) -> List[str]:
+        """已有检查点的流程阶段（不含请求记录）"""
+        try:
+            names = os.listdir(self._task_dir(task_id))
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name[:-len(".json")] for name in names
+            if name.endswith(".json") and name != "request.json"
+        )
+
+    def clear(self, task_id: str, stages: Optional[Iterable[str]] = None):
+        """删除指定阶段的检查点；stages为None时删除任务的全部检查点"""
+        if stages is None:
+            shutil.rmtree(self._task_dir(task_id), ignore_errors=True)
+            return
+        for stage in stages:
+            try:
+                os.remove(self._path(task_id, stage))
+            except FileNotFoundError:
+                continue
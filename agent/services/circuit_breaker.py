@@ -0,0 +1,167 @@
+"""
+熔断器
+按模型统计滚动窗口内的错误率和延迟，异常时熔断并在冷却后通过半开探测自动恢复
+"""
+
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Deque, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"  # 正常放行
+    OPEN = "open"  # 熔断，拒绝请求
+    HALF_OPEN = "half_open"  # 半开，放行少量探测请求
+
+
+@dataclass
+class CircuitBreakerConfig:
+    """熔断器配置"""
+    window_seconds: float = 60.0  # 滚动统计窗口
+    min_calls: int = 3  # 窗口内至少多少次调用才评估熔断
+    failure_rate_threshold: float = 0.5  # 错误率达到该值时熔断
+    slow_call_seconds: float = 45.0  # 超过该耗时视为慢调用
+    slow_call_rate_threshold: float = 0.8  # 慢调用比例达到该值时熔断
+    open_seconds: float = 30.0  # 熔断后多久进入半开状态
+    half_open_max_calls: int = 1  # 半开状态同时允许的探测请求数
+    half_open_success_threshold: int = 2  # 半开状态连续成功多少次后恢复
+
+
+class CircuitBreaker:
+    """单个模型的熔断器"""
+
+    def __init__(self, name: str, config: CircuitBreakerConfig = None):
+        self.name = name
+        self.config = config or CircuitBreakerConfig()
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+
+        # (时间戳, 是否成功, 耗时)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self.transitions: Deque[Dict[str, Any]] = deque(maxlen=20)
+
+    def _transition(self, new_state: CircuitState, reason: str):
+        if new_state == self.state:
+            return
+        self.transitions.append({
+            "from": self.state.value,
+            "to": new_state.value,
+            "reason": reason,
+            "at": time.time()
+        })
+        logger.warning(f"🔌 熔断器[{self.name}] {self.state.value} -> {new_state.value}: {reason}")
+        self.state = new_state
+
+        if new_state == CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+        elif new_state == CircuitState.HALF_OPEN:
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+        elif new_state == CircuitState.CLOSED:
+            self._calls.clear()
+
+    def _trim(self, now: float):
+        cutoff = now - self.config.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def allow_request(self) -> bool:
+        """是否放行请求；放行后必须调用 record_success/record_failure/record_cancelled 之一"""
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.config.open_seconds:
+                return False
+            self._transition(CircuitState.HALF_OPEN, "冷却结束，开始探测")
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self._half_open_in_flight >= self.config.half_open_max_calls:
+                return False
+            self._half_open_in_flight += 1
+
+        return True
+
+    def record_success(self, latency: float):
+        """记录一次成功调用"""
+        if self.state == CircuitState.HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            self._half_open_successes += 1
+            if self._half_open_successes >= self.config.half_open_success_threshold:
+                self._transition(CircuitState.CLOSED, "探测请求成功，恢复正常")
+            return
+
+        self._record(True, latency)
+
+    def record_failure(self, latency: float):
+        """记录一次失败调用"""
+        if self.state == CircuitState.HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+            self._transition(CircuitState.OPEN, "探测请求失败")
+            return
+
+        self._record(False, latency)
+
+    def record_cancelled(self):
+        """请求被取消时释放探测名额，不计入统计"""
+        if self.state == CircuitState.HALF_OPEN:
+            self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def _record(self, success: bool, latency: float):
+        now = time.monotonic()
+        self._calls.append((now, success, latency))
+        self._trim(now)
+
+        if self.state != CircuitState.CLOSED or len(self._calls) < self.config.min_calls:
+            return
+
+        failure_rate, slow_rate = self._rates()
+        if failure_rate >= self.config.failure_rate_threshold:
+            self._transition(CircuitState.OPEN, f"错误率 {failure_rate:.0%}")
+        elif slow_rate >= self.config.slow_call_rate_threshold:
+            self._transition(CircuitState.OPEN, f"慢调用比例 {slow_rate:.0%}")
+
+    def _rates(self) -> Tuple[float, float]:
+        total = len(self._calls)
+        if not total:
+            return 0.0, 0.0
+        failures = sum(1 for _, success, _ in self._calls if not success)
+        slow = sum(1 for _, _, latency in self._calls if latency >= self.config.slow_call_seconds)
+        return failures / total, slow / total
+
+    def success_count(self) -> int:
+        """窗口内成功调用次数"""
+        self._trim(time.monotonic())
+        return sum(1 for _, success, _ in self._calls if success)
+
+    def latency_percentile(self, percentile: float) -> float:
+        """窗口内成功调用的延迟分位数（秒），无数据时返回0"""
+        self._trim(time.monotonic())
+        latencies: List[float] = sorted(latency for _, success, latency in self._calls if success)
+        if not latencies:
+            return 0.0
+        index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def reset(self):
+        """手动恢复为关闭状态"""
+        self._transition(CircuitState.CLOSED, "手动重置")
+        self._calls.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出熔断器状态"""
+        self._trim(time.monotonic())
+        failure_rate, slow_rate = self._rates()
+        return {
+            "state": self.state.value,
+            "window_calls": len(self._calls),
+            "failure_rate": round(failure_rate, 3),
+            "slow_call_rate": round(slow_rate, 3),
+            "latency_p50": round(self.latency_percentile(50), 3),
+            "latency_p95": round(self.latency_percentile(95), 3),
+            "transitions": list(self.transitions)
+        }
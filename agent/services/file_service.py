@@ -7,16 +7,47 @@ import os
 import uuid
 import shutil
 import asyncio
+import hashlib
+from dataclasses import dataclass
 from typing import Optional, List
+import aiofiles
 from fastapi import UploadFile
 from pathlib import Path
 
+from .image_executor import get_image_executor
+from ..tools.image_ingest import ImageIngestor, ImageDerivatives, derivatives_dir, find_derivative_for_size
+
+# 上传文件按固定大小分块写入磁盘，单个上传占用的内存与文件大小无关
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小限制"""
+    
+    def __init__(self, filename: str, max_bytes: int):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        super().__init__(f"文件 {filename} 超过大小限制 {max_bytes / (1024 * 1024):.0f}MB")
+
+
+@dataclass
+class StoredUpload:
+    """已保存的上传文件"""
+    path: str
+    size: int  # 字节数
+    sha256: str  # 写入过程中计算的内容摘要
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+
 
 class FileService:
     """文件服务"""
     
-    def __init__(self, base_dir: str = "uploads"):
+    def __init__(self, base_dir: str = "uploads", max_upload_bytes: int = MAX_UPLOAD_BYTES):
         self.base_dir = base_dir
+        self.max_upload_bytes = max_upload_bytes
+        self.image_ingestor = ImageIngestor()
         self.uploads_dir = os.path.join(base_dir, "images")
         self.media_dir = os.path.join(base_dir, "media")
         self.temp_dir = os.path.join(base_dir, "temp")
@@ -34,6 +65,64 @@ class FileService:
         for directory in directories:
             os.makedirs(directory, exist_ok=True)
     
+    async def save_upload(
+        self,
+        file: UploadFile,
+        directory: Optional[str] = None,
+        max_bytes: Optional[int] = None
+    ) -> StoredUpload:
+        """
+        以流式分块方式保存上传的文件
+        
+        每次读取 UPLOAD_CHUNK_SIZE 字节并通过异步文件写入，不阻塞事件循环；
+        大小限制和sha256摘要在写入过程中计算。先写入临时文件，完成后原子替换为目标文件，
+        超过大小限制或写入失败时删除已写入的部分。
+        
+        Args:
+            file: 上传的文件对象
+            directory: 保存目录（默认为上传图片目录）
+            max_bytes: 大小上限（默认为 max_upload_bytes）
+            
+        Returns:
+            StoredUpload: 保存后的文件路径、大小和摘要
+            
+        Raises:
+            UploadTooLargeError: 文件超过大小限制
+        """
+        max_bytes = self.max_upload_bytes if max_bytes is None else max_bytes
+        file_extension = os.path.splitext(file.filename or "")[1]
+        file_path = os.path.join(directory or self.uploads_dir, f"{uuid.uuid4()}{file_extension}")
+        partial_path = f"{file_path}.part"
+        
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(partial_path, "wb") as buffer:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise UploadTooLargeError(file.filename or "", max_bytes)
+                    digest.update(chunk)
+                    await buffer.write(chunk)
+            os.replace(partial_path, file_path)
+        except BaseException:
+            try:
+                os.remove(partial_path)
+            except FileNotFoundError:
+                pass
+            raise
+        
+        return StoredUpload(
+            path=file_path,
+            size=size,
+            sha256=digest.hexdigest(),
+            filename=file.filename,
+            content_type=file.content_type
+        )
+    
     async def save_uploaded_file(self, file: UploadFile) -> str:
         """
         保存上传的文件
@@ -43,23 +132,36 @@ class FileService:
             
         Returns:
             str: 保存后的文件路径
+            
+        Raises:
+            UploadTooLargeError: 文件超过大小限制
         """
         try:
-            # 生成唯一文件名
-            file_extension = os.path.splitext(file.filename)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(self.uploads_dir, unique_filename)
-            
-            # 保存文件
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-            
-            return file_path
+            stored = await self.save_upload(file)
+            return stored.path
             
+        except UploadTooLargeError:
+            raise
         except Exception as e:
             raise Exception(f"保存文件失败: {str(e)}")
     
+    async def create_derivatives(self, file_path: str, sha256: Optional[str] = None) -> Optional[ImageDerivatives]:
+        """
+        为上传的图片生成衍生图（AI分析、打印、缩略图、封面），在图片处理进程池中执行
+        
+        Args:
+            file_path: 原图路径
+            sha256: 上传时计算的内容摘要
+            
+        Returns:
+            Optional[ImageDerivatives]: 衍生图集合，无法解码时返回None（下游回退到原图）
+        """
+        try:
+            return await get_image_executor().run(self.image_ingestor.ingest, file_path, sha256)
+        except Exception as e:
+            print(f"生成衍生图失败 {file_path}: {e}")
+            return None
+    
     async def save_multiple_files(self, files: List[UploadFile]) -> List[str]:
         """
         批量保存上传的文件
@@ -257,7 +359,9 @@ class FileService:
                 name, ext = os.path.splitext(input_path)
                 output_path = f"{name}_compressed{ext}"
             
-            with Image.open(input_path) as img:
+            # 优先从足够大的衍生图压缩，避免重新解码原图
+            source_path = find_derivative_for_size(input_path, max_size) or input_path
+            with Image.open(source_path) as img:
                 # 转换为RGB模式（如果需要）
                 if img.mode in ("RGBA", "P"):
                     img = img.convert("RGB")
@@ -286,6 +390,7 @@ class FileService:
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
+                shutil.rmtree(derivatives_dir(file_path), ignore_errors=True)
                 return True
             return False
         except Exception as e:
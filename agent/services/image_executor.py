@@ -0,0 +1,160 @@
+"""
+图片处理执行器
+CPU密集的PIL/OpenCV处理（颜色聚类、人脸检测、增强、批量压缩）放到进程池执行，
+不阻塞事件循环，多张图片的任务可以用满多个CPU核心。
+
+任务以模块级函数加参数的形式提交（可pickle）；需要传递内存中的像素数据时，
+通过共享内存（SharedPixels）交给子进程，不经过pickle复制。
+IMAGE_WORKERS=0 时在线程中执行（如不支持多进程的Serverless环境）。
+"""
+
+import os
+import asyncio
+import logging
+import functools
+import multiprocessing
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 可以按原始字节直接还原的色彩模式，其它模式先转换为RGB
+SHAREABLE_MODES = {"L", "RGB", "RGBA", "CMYK"}
+
+
+@dataclass(frozen=True)
+class SharedPixels:
+    """共享内存中的像素缓冲区句柄，可pickle后传给子进程"""
+    name: str
+    mode: str
+    size: Tuple[int, int]
+    nbytes: int  # 像素数据长度（共享内存可能按页对齐分配得更大）
+
+    @contextmanager
+    def attach(self) -> Iterator[shared_memory.SharedMemory]:
+        """在当前进程中打开共享内存（不负责释放）"""
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            yield shm
+        finally:
+            shm.close()
+
+    def read(self) -> Image.Image:
+        """复制出一张独立的图像"""
+        with self.attach() as shm:
+            return Image.frombytes(self.mode, self.size, bytes(shm.buf[:self.nbytes]))
+
+    def write(self, image: Image.Image):
+        """把同尺寸、同模式的图像写回缓冲区"""
+        if image.mode != self.mode or image.size != self.size:
+            raise ValueError(f"图像 {image.mode} {image.size} 与缓冲区 {self.mode} {self.size} 不一致")
+        with self.attach() as shm:
+            shm.buf[:self.nbytes] = image.tobytes()
+
+
+@contextmanager
+def share_image(image: Image.Image) -> Iterator[SharedPixels]:
+    """
+    把图像像素放入共享内存，退出时释放
+
+    子进程可以通过返回的句柄读取像素或就地写回处理结果
+    """
+    if image.mode not in SHAREABLE_MODES:
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    data = image.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        yield SharedPixels(shm.name, image.mode, image.size, len(data))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def default_workers() -> int:
+    """IMAGE_WORKERS 环境变量，默认不超过4个进程"""
+    value = os.getenv("IMAGE_WORKERS")
+    if value is not None:
+        return max(0, int(value))
+    return min(4, os.cpu_count() or 1)
+
+
+class ImageExecutor:
+    """
+    图片处理执行器
+
+    进程池在首次提交任务时创建（spawn方式启动，与事件循环和线程无关）；
+    子进程异常退出导致进程池损坏时，下一次提交会重建进程池
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = default_workers() if max_workers is None else max_workers
+        self._pool: Optional[Executor] = None
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.max_workers > 0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.uses_processes:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"🧮 图片处理进程池已启动，进程数 {self.max_workers}")
+            else:
+                self._pool = ThreadPoolExecutor(thread_name_prefix="image-worker")
+        return self._pool
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        执行一个任务
+
+        Args:
+            func: 模块级函数（进程模式下需要可pickle）
+            *args, **kwargs: 任务参数（进程模式下需要可pickle，像素数据用 SharedPixels 传递）
+        """
+        loop = asyncio.get_running_loop()
+        job = functools.partial(func, *args, **kwargs)
+        try:
+            return await loop.run_in_executor(self._get_pool(), job)
+        except BrokenProcessPool:
+            logger.error("❌ 图片处理进程异常退出，重建进程池")
+            self._pool = None
+            raise
+
+    async def map(self, func: Callable[..., Any], items: Sequence[Any], *args: Any, **kwargs: Any) -> List[Any]:
+        """对每一项并发执行 func(item, *args, **kwargs)，返回与输入顺序一致的结果（异常作为结果返回）"""
+        return await asyncio.gather(
+            *(self.run(func, item, *args, **kwargs) for item in items),
+            return_exceptions=True
+        )
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+_executor: Optional[ImageExecutor] = None
+
+
+def get_image_executor() -> ImageExecutor:
+    """进程级共享的图片处理执行器"""
+    global _executor
+    if _executor is None:
+        _executor = ImageExecutor()
+    return _executor
+
+
+def set_image_executor(executor: ImageExecutor):
+    """替换进程级共享的图片处理执行器"""
+    global _executor
+    _executor = executor
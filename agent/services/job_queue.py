@@ -0,0 +1,192 @@
+"""
+持久化任务队列
+基于SQLite的本地任务队列，API进程入队，独立的工作进程领取执行；
+领取采用租约机制，工作进程崩溃后租约过期的任务会被重新领取
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteJobQueue:
+    """SQLite任务队列（WAL模式，支持多进程并发领取）"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_attempts: int = 3,
+        busy_timeout_ms: int = 5000
+    ):
+        self.path = path or os.getenv(
+            "JOB_QUEUE_PATH",
+            os.path.join(tempfile.gettempdir(), "biography_jobs.db")
+        )
+        self.max_attempts = max(1, max_attempts)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                lease_until REAL,
+                worker_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_dispatch ON jobs(status, priority DESC, enqueued_at)"
+        )
+
+    def enqueue(self, job_id: str, user_id: str, payload: Dict[str, Any], priority: int = 0):
+        """入队"""
+        self._connection().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, user_id, priority, payload, status, enqueued_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?)",
+            (job_id, user_id, priority, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        领取下一个任务：排队中的任务，或租约已过期的执行中任务（原工作进程已退出）
+
+        Returns:
+            包含 job_id、user_id、payload、attempts 的字典，没有可领取的任务时返回None
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """
+                SELECT job_id, user_id, payload, attempts FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)
+                ORDER BY priority DESC, enqueued_at
+                LIMIT 1
+                """,
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            job_id, user_id, payload, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = 'running', lease_until = ?, worker_id = ?, attempts = ? "
+                "WHERE job_id = ?",
+                (now + lease_seconds, worker_id, attempts + 1, job_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if attempts > 0:
+            logger.warning(f"♻️ 重新领取租约过期的任务 {job_id} (第 {attempts + 1} 次)")
+        return {
+            "job_id": job_id,
+            "user_id": user_id,
+            "payload": json.loads(payload),
+            "attempts": attempts + 1
+        }
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """续租，返回False表示任务已被其他工作进程接管"""
+        cursor = self._connection().execute(
+            "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+            (time.time() + lease_seconds, job_id, worker_id)
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: str, worker_id: str):
+        """标记任务完成（完成的任务从队列中删除，结果在任务存储中）"""
+        self._connection().execute(
+            "DELETE FROM jobs WHERE job_id = ? AND worker_id = ?", (job_id, worker_id)
+        )
+
+    def fail(self, job_id: str, worker_id: str, error: str):
+        """标记任务失败；未超过最大尝试次数时重新排队"""
+        conn = self._connection()
+        row = conn.execute("SELECT attempts FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return
+        status = "queued" if row[0] < self.max_attempts else "failed"
+        conn.execute(
+            "UPDATE jobs SET status = ?, lease_until = NULL, worker_id = NULL, error = ? "
+            "WHERE job_id = ? AND worker_id = ?",
+            (status, error[:500], job_id, worker_id)
+        )
+
+    def position(self, job_id: str) -> Optional[int]:
+        """排队位置（从1开始），执行中为0，不在队列中返回None"""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT status, priority, enqueued_at FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None or row[0] == "failed":
+            return None
+        status, priority, enqueued_at = row
+        if status == "running":
+            return 0
+        ahead = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+            "(priority > ? OR (priority = ? AND enqueued_at < ?))",
+            (priority, priority, enqueued_at)
+        ).fetchone()[0]
+        return ahead + 1
+
+    def count(self, status: str = "queued") -> int:
+        """指定状态的任务数"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)
+        ).fetchone()[0]
+
+    def count_for_user(self, user_id: str) -> int:
+        """用户排队中的任务数"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND user_id = ?", (user_id,)
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计"""
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall()
+        counts = dict(rows)
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "failed": counts.get("failed", 0)
+        }
@@ -0,0 +1,236 @@
+"""
+任务调度器
+有界的工作并发 + 按优先级排队的准入队列，同一优先级内按用户轮转保证公平，
+队列已满时拒绝新任务并给出建议的重试时间
+"""
+
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """准入队列已满"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class SchedulerConfig:
+    """调度器配置"""
+    max_workers: int = 4  # 同时执行的任务数
+    max_queue_size: int = 50  # 排队任务总数上限
+    max_queued_per_user: int = 5  # 单个用户排队任务上限
+    initial_job_seconds: float = 60.0  # 估算等待时间用的初始平均任务耗时
+    max_retry_after_seconds: int = 300
+
+
+@dataclass
+class _Job:
+    job_id: str
+    user_id: str
+    priority: int
+    factory: Callable[[], Awaitable[Any]]
+    enqueued_at: float
+
+
+class JobScheduler:
+    """
+    任务调度器
+
+    优先级高的任务先执行；同一优先级内各用户轮流出队，
+    避免单个用户的大量任务占满工作并发
+    """
+
+    def __init__(
+        self,
+        config: SchedulerConfig = None,
+        on_positions_changed: Optional[Callable[[Dict[str, int]], None]] = None
+    ):
+        """
+        Args:
+            config: 调度器配置
+            on_positions_changed: 排队位置变化时的回调，参数为 {任务ID: 排队位置}，
+                                  包含所有排队中的任务和刚开始执行的任务（位置为0）
+        """
+        self.config = config or SchedulerConfig()
+        self.on_positions_changed = on_positions_changed
+        # 优先级 -> (用户 -> 该用户的排队任务)，用户按轮转顺序排列
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Job]]"] = {}
+        self._queued_ids: Dict[str, _Job] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._avg_job_seconds = self.config.initial_job_seconds
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.peak_queue_size = 0
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._queued_ids)
+
+    def retry_after(self) -> int:
+        """按当前排队长度和平均任务耗时估算的重试等待秒数"""
+        rounds = (self.queue_size + 1) / self.config.max_workers
+        return min(self.config.max_retry_after_seconds, max(1, math.ceil(rounds * self._avg_job_seconds)))
+
+    def check_admission(self, user_id: str):
+        """
+        检查是否可以接收该用户的新任务（提交前可先调用，避免无谓地处理上传文件）
+
+        Raises:
+            QueueFullError: 队列已满或该用户排队任务过多
+        """
+        if self.queue_size >= self.config.max_queue_size:
+            self.rejected += 1
+            raise QueueFullError("任务队列已满，请稍后重试", self.retry_after())
+        user_queued = sum(len(users.get(user_id, ())) for users in self._queues.values())
+        if user_queued >= self.config.max_queued_per_user:
+            self.rejected += 1
+            raise QueueFullError("您排队中的任务过多，请等待已有任务完成", self.retry_after())
+
+    def submit(
+        self,
+        job_id: str,
+        user_id: str,
+        factory: Callable[[], Awaitable[Any]],
+        priority: int = 0
+    ) -> int:
+        """
+        提交任务
+
+        Args:
+            job_id: 任务ID
+            user_id: 用户ID，用于公平调度
+            factory: 执行任务的协程工厂
+            priority: 优先级，数值越大越先执行
+
+        Returns:
+            排队位置（0表示已开始执行）
+
+        Raises:
+            QueueFullError: 队列已满或该用户排队任务过多
+        """
+        self.check_admission(user_id)
+
+        job = _Job(job_id, user_id, priority, factory, time.monotonic())
+        self._queues.setdefault(priority, OrderedDict()).setdefault(user_id, deque()).append(job)
+        self._queued_ids[job_id] = job
+        self.submitted += 1
+        self.peak_queue_size = max(self.peak_queue_size, self.queue_size)
+
+        self._publish_positions(self._dispatch())
+        return self.position(job_id) or 0
+
+    def _pop_next(self) -> Optional[_Job]:
+        """取出下一个任务：最高优先级中排在最前的用户，出队后该用户移到末尾"""
+        for priority in sorted(self._queues, reverse=True):
+            users = self._queues[priority]
+            user_id, jobs = next(iter(users.items()))
+            job = jobs.popleft()
+            if jobs:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            if not users:
+                del self._queues[priority]
+            del self._queued_ids[job.job_id]
+            return job
+        return None
+
+    def _dispatch(self) -> List[str]:
+        """在工作并发允许的范围内启动排队任务，返回本次启动的任务ID"""
+        started = []
+        while len(self._running) < self.config.max_workers:
+            job = self._pop_next()
+            if job is None:
+                return started
+            started.append(job.job_id)
+            wait_seconds = time.monotonic() - job.enqueued_at
+            logger.info(f"▶️ 开始执行任务 {job.job_id} (排队 {wait_seconds:.1f}s)")
+            task = asyncio.ensure_future(self._run(job))
+            self._running[job.job_id] = task
+        return started
+
+    async def _run(self, job: _Job):
+        started_at = time.monotonic()
+        try:
+            await job.factory()
+        except Exception as e:
+            logger.error(f"任务 {job.job_id} 执行失败: {e}")
+        finally:
+            duration = time.monotonic() - started_at
+            # 指数移动平均的任务耗时，用于估算重试时间
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * duration
+            self._running.pop(job.job_id, None)
+            self.completed += 1
+            self._publish_positions(self._dispatch())
+
+    def _publish_positions(self, started: List[str]):
+        """把排队中任务的最新位置和刚开始执行的任务通知给回调"""
+        if self.on_positions_changed is None:
+            return
+        positions = {job_id: index + 1 for index, job_id in enumerate(self._dispatch_order())}
+        positions.update({job_id: 0 for job_id in started})
+        if not positions:
+            return
+        try:
+            self.on_positions_changed(positions)
+        except Exception as e:
+            logger.warning(f"排队位置回调失败: {e}")
+
+    def _dispatch_order(self) -> List[str]:
+        """按调度规则推演的排队任务出队顺序"""
+        order = []
+        for priority in sorted(self._queues, reverse=True):
+            pending = [list(jobs) for jobs in self._queues[priority].values()]
+            round_index = 0
+            while any(round_index < len(jobs) for jobs in pending):
+                order.extend(jobs[round_index].job_id for jobs in pending if round_index < len(jobs))
+                round_index += 1
+        return order
+
+    def position(self, job_id: str) -> Optional[int]:
+        """排队位置（从1开始），执行中返回0，未知任务返回None"""
+        if job_id in self._running:
+            return 0
+        if job_id not in self._queued_ids:
+            return None
+        return self._dispatch_order().index(job_id) + 1
+
+    def cancel(self, job_id: str) -> bool:
+        """取消排队中的任务"""
+        job = self._queued_ids.pop(job_id, None)
+        if job is None:
+            return False
+        users = self._queues[job.priority]
+        users[job.user_id].remove(job)
+        if not users[job.user_id]:
+            del users[job.user_id]
+        if not users:
+            del self._queues[job.priority]
+        self._publish_positions([])
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """调度器统计"""
+        return {
+            "running": len(self._running),
+            "queued": self.queue_size,
+            "max_workers": self.config.max_workers,
+            "max_queue_size": self.config.max_queue_size,
+            "peak_queue_size": self.peak_queue_size,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "avg_job_seconds": round(self._avg_job_seconds, 1)
+        }
@@ -0,0 +1,308 @@
+"""
+运行指标
+进程内的指标注册表（计数器、仪表、直方图），按Prometheus文本格式导出，
+也可以转换为JSON摘要供统计接口使用；不依赖 prometheus_client
+"""
+
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认的耗时分桶（秒），覆盖从缓存命中到整段传记生成
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """指标基类：按标签值分组保存样本"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        """(样本名后缀, 标签值, 数值) 列表"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+        for suffix, label_values, value in self.samples():
+            names = self.labelnames
+            if suffix == "_bucket":
+                # 分桶样本的最后一个标签值是 le
+                names = self.labelnames + ("le",)
+            lines.append(f"{self.name}{suffix}{_format_labels(names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        with self._lock:
+            return [("_total", key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表；设置了取值函数时在导出时实时计算"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._function: Optional[Callable[[], Any]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Optional[Callable[[], Any]]):
+        """
+        设置取值函数：无标签时返回数值，有标签时返回 {标签值元组: 数值}
+        """
+        self._function = function
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception as e:
+                logger.warning(f"指标 {self.name} 取值失败: {e}")
+                return []
+            if isinstance(result, dict):
+                return [("", tuple(map(str, key)), float(value)) for key, value in sorted(result.items())]
+            return [("", (), float(result))]
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # 标签值 -> [各分桶计数..., 总和, 样本数]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块的耗时"""
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started_at, **labels)
+
+    def summary(self, **labels) -> Dict[str, float]:
+        """样本数、总和与平均值"""
+        state = self._values.get(self._key(labels))
+        if not state or not state[-1]:
+            return {"count": 0, "sum": 0.0, "avg": 0.0}
+        return {"count": int(state[-1]), "sum": round(state[-2], 3), "avg": round(state[-2] / state[-1], 3)}
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, state):
+                    samples.append(("_bucket", key + (_format_value(bound),), count))
+                samples.append(("_sum", key, state[-2]))
+                samples.append(("_count", key, state[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON摘要：计数器和仪表给出各标签的数值，直方图给出样本数、总和与平均值"""
+        result: Dict[str, Any] = {}
+        for name, metric in list(self._metrics.items()):
+            if isinstance(metric, Histogram):
+                result[name] = {
+                    ",".join(key) or "all": metric.summary(**dict(zip(metric.labelnames, key)))
+                    for key in list(metric._values)
+                }
+            else:
+                result[name] = {
+                    ",".join(key) or "all": value for _, key, value in metric.samples()
+                }
+        return result
+
+
+# 进程级共享的注册表
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "biography_stage_duration_seconds", "传记流程各阶段耗时（不含复用检查点的阶段）", ("stage",)
+)
+TASK_DURATION = REGISTRY.histogram(
+    "biography_task_duration_seconds", "传记任务从开始执行到结束的耗时", ("status",)
+)
+TASKS_FINISHED = REGISTRY.counter(
+    "biography_tasks", "已结束的传记任务数", ("status",)
+)
+TASKS_IN_FLIGHT = REGISTRY.gauge(
+    "biography_tasks_in_flight", "本进程中正在执行的传记任务数"
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "biography_queue_depth", "排队等待执行的传记任务数"
+)
+UPSTREAM_DURATION = REGISTRY.histogram(
+    "ai_upstream_request_duration_seconds", "上游AI调用耗时（从限流器放行、请求发出时开始计）", ("operation", "model", "outcome")
+)
+ANALYSIS_CACHE = REGISTRY.counter(
+    "ai_analysis_cache_requests", "图片分析缓存查询次数", ("result",)
+)
+FALLBACKS = REGISTRY.counter(
+    "ai_fallbacks", "改用备用方案执行的次数", ("operation", "reason")
+)
+RATE_LIMITED = REGISTRY.counter(
+    "ai_rate_limited_responses", "上游返回429的次数", ("model",)
+)
+RETRIES = REGISTRY.counter(
+    "ai_rate_limited_retries", "429限流后等待并重试的次数", ("model",)
+)
+LIMITER_QUEUE_DEPTH = REGISTRY.gauge(
+    "biography_ai_limiter_queue_depth", "等待限流器放行的AI调用数"
+)
+HTTP_CONNECTIONS = REGISTRY.counter(
+    "ai_http_connections", "上游HTTP请求获取连接的次数（新建或复用空闲连接）", ("kind",)
+)
+HTTP_POOL_WAIT = REGISTRY.histogram(
+    "ai_http_pool_acquire_wait_seconds", "连接池已满时请求等待空闲连接的耗时",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "ai_http_requests_in_flight", "进行中的上游HTTP请求数"
+)
+HTTP_REUSE_RATIO = REGISTRY.gauge(
+    "ai_http_connection_reuse_ratio", "上游HTTP请求复用空闲连接的比例"
+)
+HTTP_POOL_SATURATION = REGISTRY.gauge(
+    "ai_http_pool_saturation", "进行中的上游HTTP请求数占连接池上限的比例"
+)
+TOKENS = REGISTRY.counter(
+    "ai_tokens", "上游报告的token消耗（prompt/completion）与传记生成的提示词/输出预算（prompt_budget/output_budget）",
+    ("model", "kind")
+)
@@ -0,0 +1,205 @@
+"""
+提示词预算
+按token预算裁剪用户需求和图片分析，控制传记生成请求的输入和输出规模。
+用户需求优先占用预算；图片分析超出预算时，优先保留与用户需求相关、包含人物的分析
+"""
+
+import re
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+# 中日韩字符（含全角标点）大致各占1个token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+TRUNCATION_MARKER = "……（内容过长，已省略部分）……"
+
+# 用于相关度计算的检索词：连续的中日韩字符切成二元组，其余取长度不小于2的字母数字串
+_CJK_RUN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9]{2,}")
+
+# 包含人物（人脸）的图片分析在排序中的加分，相关度取值为0-1
+PEOPLE_PRIORITY_BONUS = 0.5
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数
+
+    与BPE分词器的经验比例一致：中日韩字符约1个token，
+    其余字符约4个字符1个token
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_tail_ratio: float = 0.2) -> str:
+    """
+    将文本裁剪到token预算内，保留开头和结尾（结尾占 keep_tail_ratio）
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    available = max_tokens - estimate_tokens(TRUNCATION_MARKER)
+    if available <= 0:
+        return _prefix_within(text, max_tokens)
+
+    tail_tokens = int(available * keep_tail_ratio)
+    head = _prefix_within(text, available - tail_tokens)
+    tail = _suffix_within(text[len(head):], tail_tokens)
+    return f"{head}{TRUNCATION_MARKER}{tail}"
+
+
+def _prefix_within(text: str, max_tokens: int) -> str:
+    """二分查找不超过预算的最长前缀"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+def _suffix_within(text: str, max_tokens: int) -> str:
+    """二分查找不超过预算的最长后缀"""
+    if max_tokens <= 0:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[len(text) - mid:]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[len(text) - low:] if low else ""
+
+
+def _terms(text: str) -> set:
+    """提取文本中的检索词"""
+    terms = {word.lower() for word in _WORD_PATTERN.findall(text)}
+    for run in _CJK_RUN_PATTERN.findall(text):
+        terms.update(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return terms
+
+
+def rank_analyses(
+    user_requirements: str,
+    image_analyses: Sequence[str],
+    people_counts: Optional[Sequence[int]] = None
+) -> List[float]:
+    """
+    计算图片分析的保留优先级
+
+    优先级 = 与用户需求的相关度（用户需求检索词在分析中出现的比例）
+    + 包含人物时的加分；people_counts 为每张图片识别出的人物数，
+    缺省时不加分
+    """
+    requirement_terms = _terms(user_requirements or "")
+    priorities = []
+    for i, analysis in enumerate(image_analyses):
+        relevance = 0.0
+        if requirement_terms:
+            relevance = len(requirement_terms & _terms(analysis)) / len(requirement_terms)
+        if people_counts is not None and people_counts[i] > 0:
+            relevance += PEOPLE_PRIORITY_BONUS
+        priorities.append(relevance)
+    return priorities
+
+
+@dataclass
+class PromptBudget:
+    """传记生成请求的token预算"""
+    requirements_tokens: int = 1500  # 用户需求
+    analyses_tokens: int = 1200  # 全部图片分析
+    min_analysis_tokens: int = 60  # 单条图片分析最少保留的token数
+    output_tokens: int = 2000  # 生成输出上限（max_tokens）
+
+
+def allocate_budget(
+    sizes: Sequence[int],
+    budget: int,
+    min_share: int,
+    priorities: Optional[Sequence[float]] = None
+) -> List[int]:
+    """
+    在多条内容之间分配token预算
+
+    先按优先级保留能满足最低份额的条目，再用注水法平均分配：
+    短于平均份额的条目全额保留，剩余预算继续分给较长的条目。
+    返回每条内容的预算，0表示该条被舍弃。
+    """
+    count = len(sizes)
+    if count == 0:
+        return []
+    if sum(sizes) <= budget:
+        return list(sizes)
+
+    order = sorted(range(count), key=lambda i: -(priorities[i] if priorities else -i))
+    max_items = max(1, budget // max(1, min_share))
+    kept = sorted(order[:max_items])
+
+    allocation = [0] * count
+    remaining_budget = budget
+    remaining = sorted(kept, key=lambda i: sizes[i])
+    while remaining:
+        share = remaining_budget // len(remaining)
+        index = remaining[0]
+        if sizes[index] <= share:
+            allocation[index] = sizes[index]
+            remaining_budget -= sizes[index]
+            remaining.pop(0)
+        else:
+            for index in remaining:
+                allocation[index] = share
+            break
+    return allocation
+
+
+def fit_prompt_sections(
+    user_requirements: str,
+    image_analyses: Sequence[str],
+    budget: PromptBudget,
+    priorities: Optional[Sequence[float]] = None
+) -> Dict[str, Any]:
+    """
+    按预算裁剪用户需求和图片分析
+
+    用户需求优先：先在需求预算内裁剪用户需求，需求用不完的预算再分给图片分析；
+    图片分析条数超出预算时按 priorities 保留（缺省时按 rank_analyses 的文本相关度）
+
+    Returns:
+        包含裁剪后的 user_requirements、image_analyses 以及各部分token统计的字典
+    """
+    requirements = truncate_to_tokens(user_requirements, budget.requirements_tokens)
+    analyses_budget = budget.analyses_tokens + budget.requirements_tokens - estimate_tokens(requirements)
+
+    if priorities is None:
+        priorities = rank_analyses(user_requirements, image_analyses)
+    sizes = [estimate_tokens(analysis) for analysis in image_analyses]
+    allocation = allocate_budget(sizes, analyses_budget, budget.min_analysis_tokens, priorities)
+    analyses = [
+        truncate_to_tokens(analysis, tokens, keep_tail_ratio=0.0)
+        for analysis, tokens in zip(image_analyses, allocation) if tokens > 0
+    ]
+
+    return {
+        "user_requirements": requirements,
+        "image_analyses": analyses,
+        "report": {
+            "requirements_tokens": estimate_tokens(requirements),
+            "requirements_tokens_original": estimate_tokens(user_requirements),
+            "analyses_tokens": sum(estimate_tokens(a) for a in analyses),
+            "analyses_tokens_original": sum(sizes),
+            "analyses_kept": len(analyses),
+            "analyses_total": len(image_analyses),
+            "analyses_budget": analyses_budget,
+            "output_tokens": budget.output_tokens
+        }
+    }
@@ -0,0 +1,223 @@
+"""
+自适应限流器
+所有AI调用共享的令牌桶（每分钟请求数 + 每分钟token数），
+遇到429时降低速率、成功时逐步恢复，并提供带抖动的指数退避和任务级截止时间
+"""
+
+import time
+import random
+import asyncio
+import logging
+import contextvars
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 当前任务的截止时间（time.monotonic()），由编排器按任务设置，子协程自动继承
+_task_deadline: contextvars.ContextVar = contextvars.ContextVar("ai_task_deadline", default=None)
+
+
+@contextmanager
+def task_deadline(seconds: Optional[float]):
+    """在当前上下文中设置AI调用的截止时间"""
+    token = _task_deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _task_deadline.reset(token)
+
+
+def set_task_deadline(seconds: Optional[float]):
+    """为当前asyncio任务设置截止时间（任务拥有独立的上下文副本，无需恢复）"""
+    _task_deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def current_deadline() -> Optional[float]:
+    """获取当前上下文的截止时间"""
+    return _task_deadline.get()
+
+
+class RateLimitError(Exception):
+    """上游返回429"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """等待限流或重试会超过任务截止时间"""
+
+
+@dataclass
+class RateLimiterConfig:
+    """限流器配置"""
+    requests_per_minute: float = 60.0
+    tokens_per_minute: float = 120000.0
+    burst_seconds: float = 10.0  # 令牌桶容量相当于多少秒的配额
+    min_rate_fraction: float = 0.1  # 降速后的最低速率（占配置速率的比例）
+    decrease_factor: float = 0.5  # 遇到429时速率乘以该系数
+    increase_fraction: float = 0.05  # 每次成功恢复配置速率的该比例
+    max_retries: int = 4
+    backoff_base_seconds: float = 1.0
+    backoff_max_seconds: float = 30.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期两种形式），返回需要等待的秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at is None or retry_at.tzinfo is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class _TokenBucket:
+    """按每分钟速率补充的令牌桶"""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.max_per_minute = per_minute
+        self.per_minute = per_minute
+        self.burst_seconds = burst_seconds
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.per_minute / 60.0 * self.burst_seconds)
+
+    def refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.per_minute / 60.0)
+
+    def wait_time(self, amount: float) -> float:
+        """补充到指定数量需要等待的秒数"""
+        deficit = amount - self.tokens
+        return 0.0 if deficit <= 0 else deficit / (self.per_minute / 60.0)
+
+
+class AdaptiveRateLimiter:
+    """AIMD自适应限流器"""
+
+    def __init__(self, config: RateLimiterConfig = None):
+        self.config = config or RateLimiterConfig()
+        self._requests = _TokenBucket(self.config.requests_per_minute, self.config.burst_seconds)
+        self._tokens = _TokenBucket(self.config.tokens_per_minute, self.config.burst_seconds)
+        self._lock: Optional[asyncio.Lock] = None
+        self._blocked_until = 0.0
+
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self.rate_limited_count = 0
+        self.retry_count = 0
+        self.deadline_exceeded_count = 0
+
+    async def acquire(self, tokens: int = 1, deadline: Optional[float] = None):
+        """
+        按先后顺序等待请求和token配额
+
+        Args:
+            tokens: 本次请求预计消耗的token数
+            deadline: 截止时间（time.monotonic()），默认取当前任务的截止时间
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        deadline = deadline if deadline is not None else current_deadline()
+
+        self.queue_depth += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    self._requests.refill(now)
+                    self._tokens.refill(now)
+                    needed_tokens = min(float(tokens), self._tokens.capacity)
+
+                    wait = max(
+                        self._blocked_until - now,
+                        self._requests.wait_time(1.0),
+                        self._tokens.wait_time(needed_tokens)
+                    )
+                    if wait <= 0:
+                        self._requests.tokens -= 1.0
+                        self._tokens.tokens -= needed_tokens
+                        return
+
+                    if deadline is not None and now + wait > deadline:
+                        self.deadline_exceeded_count += 1
+                        raise DeadlineExceededError(f"等待限流配额需要 {wait:.1f}s，超过任务截止时间")
+                    await asyncio.sleep(wait)
+        finally:
+            self.queue_depth -= 1
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """用实际消耗的token数修正预估值（不足时形成欠额）"""
+        self._tokens.tokens -= actual_tokens - estimated_tokens
+
+    def on_success(self):
+        """成功时线性恢复速率"""
+        for bucket in (self._requests, self._tokens):
+            step = bucket.max_per_minute * self.config.increase_fraction
+            bucket.per_minute = min(bucket.max_per_minute, bucket.per_minute + step)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """遇到429时按比例降速，并在Retry-After期间暂停发放配额"""
+        self.rate_limited_count += 1
+        for bucket in (self._requests, self._tokens):
+            floor = bucket.max_per_minute * self.config.min_rate_fraction
+            bucket.per_minute = max(floor, bucket.per_minute * self.config.decrease_factor)
+            bucket.tokens = min(bucket.tokens, bucket.capacity)
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        logger.warning(
+            f"🚦 触发上游限流，速率降至 {self._requests.per_minute:.0f} RPM / "
+            f"{self._tokens.per_minute:.0f} TPM"
+        )
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第attempt次重试前的等待时间：优先使用Retry-After，否则为带完全抖动的指数退避"""
+        if retry_after is not None:
+            return retry_after
+        ceiling = min(self.config.backoff_max_seconds, self.config.backoff_base_seconds * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def sleep_before_retry(
+        self,
+        attempt: int,
+        retry_after: Optional[float] = None,
+        deadline: Optional[float] = None
+    ):
+        """重试前等待，等待会超过截止时间（默认取当前任务的截止时间）时直接失败"""
+        delay = self.backoff_delay(attempt, retry_after)
+        deadline = deadline if deadline is not None else current_deadline()
+        if deadline is not None and time.monotonic() + delay > deadline:
+            self.deadline_exceeded_count += 1
+            raise DeadlineExceededError(f"重试需要等待 {delay:.1f}s，超过任务截止时间")
+        self.retry_count += 1
+        await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """限流器指标"""
+        return {
+            "queue_depth": self.queue_depth,
+            "peak_queue_depth": self.peak_queue_depth,
+            "requests_per_minute": round(self._requests.per_minute, 1),
+            "tokens_per_minute": round(self._tokens.per_minute, 1),
+            "rate_limited_count": self.rate_limited_count,
+            "retry_count": self.retry_count,
+            "deadline_exceeded_count": self.deadline_exceeded_count,
+            "blocked_seconds": round(max(0.0, self._blocked_until - time.monotonic()), 1)
+        }
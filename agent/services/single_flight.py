@@ -0,0 +1,141 @@
+"""
+请求合并（single-flight）
+相同键的并发调用共享同一个上游请求和结果，最后一个等待者离开时取消上游请求。
+流式调用同样可以合并：上游的每段增量文本分发给所有等待者各自的回调
+"""
+
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 流式输出回调：(本次增量文本, 当前累计文本)，可以是普通函数或协程函数
+ChunkCallback = Callable[[str, str], Any]
+
+
+class _ChunkFanout:
+    """把一个流式上游调用的增量文本分发给所有等待者的回调"""
+
+    def __init__(self):
+        self._callbacks: List[ChunkCallback] = []
+        self._joined: List[ChunkCallback] = []  # 尚未收到过文本的回调
+
+    def subscribe(self, callback: ChunkCallback):
+        self._joined.append(callback)
+
+    def unsubscribe(self, callback: ChunkCallback):
+        for callbacks in (self._callbacks, self._joined):
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    async def __call__(self, chunk: str, draft: str):
+        # 中途加入的等待者第一次收到的是到目前为止的全部累计文本
+        joined, self._joined = self._joined, []
+        self._callbacks.extend(joined)
+        for callback in list(self._callbacks):
+            if callback not in self._callbacks:
+                continue  # 等待者已在分发过程中离开
+            try:
+                result = callback(draft if callback in joined else chunk, draft)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                # 单个等待者的回调出错不影响共享的上游请求和其他等待者
+                logger.warning(f"流式回调失败，停止向该等待者分发: {e}")
+                self.unsubscribe(callback)
+
+
+class _InFlightCall:
+    """进行中的上游调用"""
+
+    def __init__(self, task: asyncio.Future, fanout: Optional[_ChunkFanout] = None):
+        self.task = task
+        self.fanout = fanout
+        self.waiters = 0
+
+
+class SingleFlight:
+    """按键合并并发的相同调用"""
+
+    def __init__(self):
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.started = 0  # 实际发起的上游调用数
+        self.shared = 0  # 复用进行中调用的次数
+        self.cancelled = 0  # 因无人等待而取消的上游调用数
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行调用，相同键已有进行中的调用时直接等待其结果
+
+        Args:
+            key: 归一化后的请求键
+            fn: 发起上游调用的协程工厂，只会在没有进行中的调用时执行
+        """
+        return await self._wait(key, self._join(key, fn))
+
+    async def do_stream(
+        self,
+        key: str,
+        fn: Callable[[ChunkCallback], Awaitable[Any]],
+        on_chunk: ChunkCallback
+    ) -> Any:
+        """
+        执行流式调用，相同键已有进行中的流式调用时共享其增量文本和结果
+
+        Args:
+            key: 归一化后的请求键（不包含回调，流式与非流式调用应使用不同的键）
+            fn: 发起上游调用的协程工厂，参数为分发增量文本的回调
+            on_chunk: 当前调用方的回调，中途加入时先收到已生成的累计文本
+        """
+        fanout = _ChunkFanout()
+        call = self._join(key, lambda: fn(fanout), fanout)
+        call.fanout.subscribe(on_chunk)
+        try:
+            return await self._wait(key, call)
+        finally:
+            call.fanout.unsubscribe(on_chunk)
+
+    def _join(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        fanout: Optional[_ChunkFanout] = None
+    ) -> _InFlightCall:
+        """返回相同键进行中的调用，没有时发起新的调用"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _InFlightCall(asyncio.ensure_future(fn()), fanout)
+            self._calls[key] = call
+            self.started += 1
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.shared += 1
+            logger.info(f"🔗 合并相同的进行中请求 {key[:12]} (等待者 {call.waiters + 1})")
+        return call
+
+    async def _wait(self, key: str, call: _InFlightCall) -> Any:
+        call.waiters += 1
+        try:
+            # shield 保证单个等待者被取消时不会取消共享的上游请求
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+                self.cancelled += 1
+
+    def _forget(self, key: str, call: _InFlightCall):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """请求合并统计"""
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "shared": self.shared,
+            "cancelled": self.cancelled
+        }
@@ -0,0 +1,174 @@
+"""
+有界任务注册表
+按TTL和最大条目数淘汰已结束的任务，并在淘汰时清理关联的文件
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, MutableMapping, Optional
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def remove_files(paths: Iterable[Any]) -> int:
+    """删除文件（忽略不存在的文件），返回删除的数量"""
+    removed = 0
+    for path in paths:
+        if not path:
+            continue
+        try:
+            os.remove(str(path))
+            removed += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning(f"删除文件失败 {path}: {e}")
+    return removed
+
+
+class TaskRegistry(MutableMapping):
+    """
+    以字典方式使用的任务注册表
+
+    已结束（completed/failed）的任务在 ttl_seconds 后淘汰，总数超过 max_entries 时
+    优先淘汰最早结束的任务；长时间未结束的任务在 stale_seconds 后也会被淘汰。
+    任务字典中 file_fields 指定的字段（路径或路径列表）对应的文件会在淘汰时删除。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+        stale_seconds: float = 6 * 3600,
+        file_fields: Iterable[str] = (),
+        on_evict: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        name: str = "tasks"
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.stale_seconds = stale_seconds
+        self.file_fields = tuple(file_fields)
+        self.on_evict = on_evict
+        self.name = name
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._created_at: Dict[str, float] = {}
+        self._finished_at: Dict[str, float] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+        self.evictions = 0
+        self.files_removed = 0
+
+    def __getitem__(self, task_id: str) -> Dict[str, Any]:
+        return self._entries[task_id]
+
+    def __setitem__(self, task_id: str, task: Dict[str, Any]):
+        if task_id not in self._entries:
+            self._created_at[task_id] = time.monotonic()
+        self._entries[task_id] = task
+        self._finished_at.pop(task_id, None)
+        if len(self._entries) > self.max_entries:
+            self.sweep()
+
+    def __delitem__(self, task_id: str):
+        del self._entries[task_id]
+        self._created_at.pop(task_id, None)
+        self._finished_at.pop(task_id, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _is_finished(self, task: Dict[str, Any]) -> bool:
+        return task.get("status") in TERMINAL_STATUSES
+
+    def _task_files(self, task: Dict[str, Any]) -> List[Any]:
+        files = []
+        for field_name in self.file_fields:
+            value = task.get(field_name)
+            if isinstance(value, (list, tuple)):
+                for item in value:
+                    files.append(item.get("path") if isinstance(item, dict) else item)
+            elif value:
+                files.append(value)
+        return files
+
+    def evict(self, task_id: str):
+        """淘汰任务并清理关联文件"""
+        task = self._entries.get(task_id)
+        if task is None:
+            return
+        del self[task_id]
+        self.evictions += 1
+        self.files_removed += remove_files(self._task_files(task))
+        if self.on_evict:
+            try:
+                self.on_evict(task_id, task)
+            except Exception as e:
+                logger.warning(f"[{self.name}] 淘汰回调失败 {task_id}: {e}")
+
+    def sweep(self) -> int:
+        """淘汰过期任务和超出容量的任务，返回淘汰数量"""
+        now = time.monotonic()
+        expired = []
+        for task_id, task in self._entries.items():
+            if self._is_finished(task):
+                finished_at = self._finished_at.setdefault(task_id, now)
+                if now - finished_at >= self.ttl_seconds:
+                    expired.append(task_id)
+            elif now - self._created_at.get(task_id, now) >= self.stale_seconds:
+                expired.append(task_id)
+
+        overflow = len(self._entries) - len(expired) - self.max_entries
+        if overflow > 0:
+            # 容量超限时按结束时间从早到晚淘汰，处理中的任务不受影响
+            finished = sorted(
+                (task_id for task_id in self._finished_at if task_id not in expired),
+                key=lambda task_id: self._finished_at[task_id]
+            )
+            expired.extend(finished[:overflow])
+
+        for task_id in expired:
+            self.evict(task_id)
+        if expired:
+            logger.info(f"🧹 [{self.name}] 淘汰 {len(expired)} 个任务，剩余 {len(self._entries)} 个")
+        return len(expired)
+
+    async def _sweep_loop(self, interval_seconds: float):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"[{self.name}] 清理任务失败: {e}")
+
+    def start_sweeper(self, interval_seconds: float = 60):
+        """在当前事件循环中启动后台清理"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval_seconds))
+
+    async def stop_sweeper(self):
+        """停止后台清理"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def stats(self) -> Dict[str, Any]:
+        """注册表统计"""
+        return {
+            "entries": len(self._entries),
+            "finished": len(self._finished_at),
+            "evictions": self.evictions,
+            "files_removed": self.files_removed
+        }
@@ -0,0 +1,723 @@
+"""
+任务存储
+提供统一的任务读写接口：SQLite（WAL模式，同一台机器上多进程共享）、
+Redis REST接口（Upstash / Vercel KV，跨机器和Serverless函数共享）和内存三种实现
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import logging
+import tempfile
+import threading
+import urllib.request
+from dataclasses import asdict, is_dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _json_default(value: Any) -> Any:
+    """序列化dataclass、枚举和时间等非JSON类型"""
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+def task_version(task: Optional[Dict[str, Any]]) -> str:
+    """任务对客户端可见状态（状态、进度、消息、错误、排队位置）的指纹，用于判断是否发生变化"""
+    if task is None:
+        return ""
+    visible = [task.get("status"), task.get("progress"), task.get("message"), task.get("error")]
+    if task.get("queue_position") is not None:
+        visible.append(task["queue_position"])
+    return hashlib.sha1(_dumps(visible).encode("utf-8")).hexdigest()[:12]
+
+
+def draft_version(task: Optional[Dict[str, Any]]) -> str:
+    """任务状态和传记草稿的指纹，用于跨进程推送草稿时判断草稿是否更新"""
+    if task is None:
+        return ""
+    visible = [task.get("status"), task.get("error"), task.get("draft_content") or ""]
+    return hashlib.sha1(_dumps(visible).encode("utf-8")).hexdigest()[:12]
+
+
+class TaskStore:
+    """
+    任务存储接口，任务以 task_id -> 字典 的形式保存
+
+    写入时通知本进程内等待该任务变化的协程；其他进程的写入通过定期轮询发现
+    """
+
+    def __init__(self):
+        # task_id -> [(事件循环, 事件)]
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._waiters_lock = threading.Lock()
+
+    def _notify(self, task_id: str):
+        """唤醒等待该任务变化的协程（可以在任意线程调用）"""
+        with self._waiters_lock:
+            waiters = self._waiters.pop(task_id, [])
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                continue
+
+    async def wait_for_change(
+        self,
+        task_id: str,
+        version: Optional[str],
+        timeout: float,
+        poll_interval: float = 1.0,
+        fingerprint: Callable[[Optional[Dict[str, Any]]], str] = task_version
+    ) -> Optional[Dict[str, Any]]:
+        """
+        等待任务的可见状态相对 version 发生变化（version 由 fingerprint 计算，默认 task_version）
+
+        本进程内的写入会立即唤醒等待者；其他进程的写入最多延迟 poll_interval 秒发现。
+        返回变化后的任务，超时返回当前任务，任务不存在时返回None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # 先登记再读取，避免读取和登记之间的写入被漏掉
+            entry = (loop, asyncio.Event())
+            with self._waiters_lock:
+                self._waiters.setdefault(task_id, []).append(entry)
+            try:
+                # 读取可能是网络请求（Redis存储），在线程中执行，不阻塞事件循环
+                task = await asyncio.to_thread(self.get, task_id)
+                remaining = deadline - loop.time()
+                if task is None or fingerprint(task) != version or remaining <= 0:
+                    return task
+                try:
+                    await asyncio.wait_for(entry[1].wait(), min(remaining, poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._waiters_lock:
+                    waiters = self._waiters.get(task_id)
+                    if waiters and entry in waiters:
+                        waiters.remove(entry)
+                        if not waiters:
+                            del self._waiters[task_id]
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务，不存在时返回None"""
+        raise NotImplementedError
+
+    def put(self, task_id: str, data: Dict[str, Any]):
+        """写入（覆盖）任务"""
+        raise NotImplementedError
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """合并更新任务字段，返回更新后的任务；任务不存在时返回None"""
+        raise NotImplementedError
+
+    def delete(self, task_id: str) -> bool:
+        """删除任务"""
+        raise NotImplementedError
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        prefix: Optional[str] = None,
+        limit: int = 100,
+        user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """按创建时间倒序列出任务（每项包含 task_id 字段），user_id 按任务的 user_id 字段过滤"""
+        raise NotImplementedError
+
+    def count(self, status: Optional[str] = None) -> int:
+        """任务数量"""
+        raise NotImplementedError
+
+    def purge(
+        self,
+        ttl_seconds: float,
+        max_entries: Optional[int] = None,
+        statuses: Tuple[str, ...] = TERMINAL_STATUSES
+    ) -> List[Dict[str, Any]]:
+        """
+        删除指定状态下超过TTL未更新的任务；总数超过 max_entries 时
+        再按更新时间从早到晚删除这些状态的任务。返回被删除的任务
+        """
+        raise NotImplementedError
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+
+class InMemoryTaskStore(TaskStore):
+    """内存任务存储（单进程，主要用于测试和本地开发）"""
+
+    def __init__(self):
+        super().__init__()
+        self._tasks: Dict[str, str] = {}
+        self._updated_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._tasks.get(task_id)
+        return json.loads(raw) if raw is not None else None
+
+    def put(self, task_id: str, data: Dict[str, Any]):
+        # 与SQLite实现一致，保存序列化后的副本，避免调用方修改影响存储内容
+        with self._lock:
+            self._tasks[task_id] = _dumps(data)
+            self._updated_at[task_id] = time.time()
+        self._notify(task_id)
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            raw = self._tasks.get(task_id)
+            if raw is None:
+                return None
+            data = json.loads(raw)
+            data.update(fields)
+            self._tasks[task_id] = _dumps(data)
+            self._updated_at[task_id] = time.time()
+            updated = json.loads(self._tasks[task_id])
+        self._notify(task_id)
+        return updated
+
+    def delete(self, task_id: str) -> bool:
+        with self._lock:
+            self._updated_at.pop(task_id, None)
+            deleted = self._tasks.pop(task_id, None) is not None
+        self._notify(task_id)
+        return deleted
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        prefix: Optional[str] = None,
+        limit: int = 100,
+        user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        items = []
+        for task_id, raw in list(self._tasks.items()):
+            if prefix and not task_id.startswith(prefix):
+                continue
+            data = json.loads(raw)
+            if status and data.get("status") != status:
+                continue
+            if user_id is not None and data.get("user_id") != user_id:
+                continue
+            items.append(dict(data, task_id=task_id))
+        items.sort(key=lambda item: str(item.get("created_at") or ""), reverse=True)
+        return items[:limit]
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            return len(self._tasks)
+        return sum(1 for raw in list(self._tasks.values()) if json.loads(raw).get("status") == status)
+
+    def purge(
+        self,
+        ttl_seconds: float,
+        max_entries: Optional[int] = None,
+        statuses: Tuple[str, ...] = TERMINAL_STATUSES
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            cutoff = time.time() - ttl_seconds
+            candidates = sorted(
+                (task_id for task_id, raw in self._tasks.items() if json.loads(raw).get("status") in statuses),
+                key=lambda task_id: self._updated_at[task_id]
+            )
+            purge_ids = [task_id for task_id in candidates if self._updated_at[task_id] < cutoff]
+            if max_entries is not None:
+                overflow = len(self._tasks) - len(purge_ids) - max_entries
+                if overflow > 0:
+                    purge_ids.extend([task_id for task_id in candidates if task_id not in purge_ids][:overflow])
+
+            purged = []
+            for task_id in purge_ids:
+                self._updated_at.pop(task_id, None)
+                purged.append(dict(json.loads(self._tasks.pop(task_id)), task_id=task_id))
+        for task_id in purge_ids:
+            self._notify(task_id)
+        return purged
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    SQLite任务存储
+
+    WAL模式下读写互不阻塞，多个进程可以共享同一个数据库文件；
+    task_id 为主键，status、user_id 和 created_at 建有索引
+    """
+
+    def __init__(self, path: Optional[str] = None, busy_timeout_ms: int = 5000):
+        super().__init__()
+        self.path = path or os.getenv(
+            "TASK_STORE_PATH",
+            os.path.join(tempfile.gettempdir(), "biography_tasks.db")
+        )
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT,
+                user_id TEXT,
+                created_at TEXT,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )
+            """
+        )
+        # 旧版本创建的数据库没有 user_id 列
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        if "user_id" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN user_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_id ON tasks(user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at)")
+
+    @staticmethod
+    def _row_values(task_id: str, data: Dict[str, Any]):
+        created_at = data.get("created_at")
+        if created_at is not None and not isinstance(created_at, str):
+            created_at = _json_default(created_at)
+        return (
+            task_id,
+            data.get("status"),
+            data.get("user_id"),
+            created_at,
+            time.time(),
+            _dumps(data)
+        )
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT data FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, task_id: str, data: Dict[str, Any]):
+        self._connection().execute(
+            """
+            INSERT INTO tasks (task_id, status, user_id, created_at, updated_at, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET
+                status = excluded.status,
+                user_id = excluded.user_id,
+                created_at = excluded.created_at,
+                updated_at = excluded.updated_at,
+                data = excluded.data
+            """,
+            self._row_values(task_id, data)
+        )
+        self._notify(task_id)
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        conn = self._connection()
+        # BEGIN IMMEDIATE 提前拿写锁，避免多进程并发更新时互相覆盖
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            data = json.loads(row[0])
+            data.update(fields)
+            values = self._row_values(task_id, data)
+            conn.execute(
+                "UPDATE tasks SET status = ?, user_id = ?, created_at = ?, updated_at = ?, data = ? "
+                "WHERE task_id = ?",
+                values[1:] + (task_id,)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._notify(task_id)
+        return json.loads(values[5])
+
+    def delete(self, task_id: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        self._notify(task_id)
+        return cursor.rowcount > 0
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        prefix: Optional[str] = None,
+        limit: int = 100,
+        user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if prefix:
+            # 用范围条件代替LIKE，可以走主键索引
+            clauses.append("task_id >= ? AND task_id < ?")
+            params.extend([prefix, prefix + "\U0010ffff"])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT task_id, data FROM tasks {where} ORDER BY created_at DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        return [dict(json.loads(data), task_id=task_id) for task_id, data in rows]
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            row = self._connection().execute("SELECT COUNT(*) FROM tasks").fetchone()
+        else:
+            row = self._connection().execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = ?", (status,)
+            ).fetchone()
+        return row[0]
+
+    def purge(
+        self,
+        ttl_seconds: float,
+        max_entries: Optional[int] = None,
+        statuses: Tuple[str, ...] = TERMINAL_STATUSES
+    ) -> List[Dict[str, Any]]:
+        conn = self._connection()
+        placeholders = ", ".join("?" for _ in statuses)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT task_id, data FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+                tuple(statuses) + (time.time() - ttl_seconds,)
+            ).fetchall()
+            if max_entries is not None:
+                total = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+                overflow = total - len(rows) - max_entries
+                if overflow > 0:
+                    expired_ids = {task_id for task_id, _ in rows}
+                    oldest = conn.execute(
+                        f"SELECT task_id, data FROM tasks WHERE status IN ({placeholders}) "
+                        f"ORDER BY updated_at LIMIT ?",
+                        tuple(statuses) + (overflow + len(rows),)
+                    ).fetchall()
+                    rows.extend([row for row in oldest if row[0] not in expired_ids][:overflow])
+            conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(task_id,) for task_id, _ in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for task_id, _ in rows:
+            self._notify(task_id)
+        return [dict(json.loads(data), task_id=task_id) for task_id, data in rows]
+
+
+# 按任务更新字段：任务不存在时不写入，返回更新后的全部字段
+# 以下脚本同时维护按状态分组的任务ID集合（键为 状态集合前缀 + JSON编码的状态），
+# 状态统计直接读取集合大小，不需要逐个读取任务
+
+# 覆盖写入任务。KEYS: 任务哈希、创建时间有序集合、更新时间有序集合；
+# ARGV: 任务ID、创建时间、更新时间、状态集合前缀、字段和值...
+_REDIS_PUT_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], 'status')
+if old then
+    redis.call('SREM', ARGV[4] .. old, ARGV[1])
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 5))
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+local new = redis.call('HGET', KEYS[1], 'status')
+if new then
+    redis.call('SADD', ARGV[4] .. new, ARGV[1])
+end
+return 1
+"""
+
+# 更新任务字段：任务不存在时不写入，返回更新后的全部字段。
+# KEYS: 任务哈希、更新时间有序集合；ARGV: 更新时间、任务ID、状态集合前缀、字段和值...
+_REDIS_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local old = redis.call('HGET', KEYS[1], 'status')
+redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[2])
+local new = redis.call('HGET', KEYS[1], 'status')
+if old ~= new then
+    if old then
+        redis.call('SREM', ARGV[3] .. old, ARGV[2])
+    end
+    if new then
+        redis.call('SADD', ARGV[3] .. new, ARGV[2])
+    end
+end
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# 删除任务，返回删除的键数。KEYS: 任务哈希、创建时间有序集合、更新时间有序集合；
+# ARGV: 任务ID、状态集合前缀
+_REDIS_DELETE_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], 'status')
+if old then
+    redis.call('SREM', ARGV[2] .. old, ARGV[1])
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return redis.call('DEL', KEYS[1])
+"""
+
+
+def redis_rest_configured() -> bool:
+    """是否配置了Redis REST接口（Vercel KV 或 Upstash 的环境变量）"""
+    return bool(
+        (os.getenv("KV_REST_API_URL") and os.getenv("KV_REST_API_TOKEN"))
+        or (os.getenv("UPSTASH_REDIS_REST_URL") and os.getenv("UPSTASH_REDIS_REST_TOKEN"))
+    )
+
+
+class RedisRESTTaskStore(TaskStore):
+    """
+    基于Redis REST接口（Upstash / Vercel KV）的任务存储
+
+    Vercel各函数（以及同一函数的不同实例）之间不共享 /tmp，SQLite数据库只对写入它的实例可见；
+    使用Redis后创建、状态查询、下载和统计函数读写同一份任务数据。
+    每个任务保存为一个哈希（字段值为JSON），另有按创建时间和更新时间排序的任务ID有序集合，
+    以及按状态分组的任务ID集合。其他实例的写入通过 wait_for_change 的定期轮询发现
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        token: Optional[str] = None,
+        namespace: Optional[str] = None,
+        timeout: float = 5.0
+    ):
+        super().__init__()
+        self.url = (url or os.getenv("KV_REST_API_URL") or os.getenv("UPSTASH_REDIS_REST_URL") or "").rstrip("/")
+        self.token = token or os.getenv("KV_REST_API_TOKEN") or os.getenv("UPSTASH_REDIS_REST_TOKEN")
+        if not self.url or not self.token:
+            raise ValueError("未配置Redis REST接口地址或令牌")
+        self.namespace = namespace or os.getenv("TASK_STORE_NAMESPACE", "biography")
+        self.timeout = timeout
+
+    def _post(self, path: str, body: Any) -> Any:
+        request = urllib.request.Request(
+            f"{self.url}{path}",
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    @staticmethod
+    def _result(reply: Dict[str, Any]) -> Any:
+        if reply.get("error"):
+            raise RuntimeError(f"Redis命令执行失败: {reply['error']}")
+        return reply.get("result")
+
+    def _command(self, *args: Any) -> Any:
+        return self._result(self._post("", [str(arg) for arg in args]))
+
+    def _pipeline(self, commands: List[List[Any]]) -> List[Any]:
+        """批量执行命令（一次HTTP请求）"""
+        if not commands:
+            return []
+        replies = self._post("/pipeline", [[str(arg) for arg in command] for command in commands])
+        return [self._result(reply) for reply in replies]
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.namespace}:task:{task_id}"
+
+    @property
+    def _created_key(self) -> str:
+        return f"{self.namespace}:created"
+
+    @property
+    def _updated_key(self) -> str:
+        return f"{self.namespace}:updated"
+
+    @property
+    def _status_prefix(self) -> str:
+        return f"{self.namespace}:status:"
+
+    def _status_key(self, status: str) -> str:
+        return f"{self._status_prefix}{_dumps(status)}"
+
+    @staticmethod
+    def _decode(flat: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        """HGETALL 返回的 [字段, 值, ...] 还原为任务字典"""
+        if not flat:
+            return None
+        return {flat[i]: json.loads(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+    @staticmethod
+    def _encode_fields(data: Dict[str, Any]) -> List[str]:
+        return [item for name, value in data.items() for item in (name, _dumps(value))]
+
+    @staticmethod
+    def _created_score(data: Dict[str, Any]) -> float:
+        created_at = data.get("created_at")
+        if isinstance(created_at, datetime):
+            return created_at.timestamp()
+        try:
+            return datetime.fromisoformat(str(created_at)).timestamp()
+        except ValueError:
+            return time.time()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._decode(self._command("HGETALL", self._key(task_id)))
+
+    def put(self, task_id: str, data: Dict[str, Any]):
+        self._command(
+            "EVAL", _REDIS_PUT_SCRIPT, 3, self._key(task_id), self._created_key, self._updated_key,
+            task_id, self._created_score(data), time.time(), self._status_prefix, *self._encode_fields(data)
+        )
+        self._notify(task_id)
+
+    def update(self, task_id: str, **fields) -> Optional[Dict[str, Any]]:
+        if not fields:
+            return self.get(task_id)
+        # 用脚本在Redis中原子地判断任务是否存在并更新字段，并发更新不同字段互不覆盖
+        flat = self._command(
+            "EVAL", _REDIS_UPDATE_SCRIPT, 2, self._key(task_id), self._updated_key,
+            time.time(), task_id, self._status_prefix, *self._encode_fields(fields)
+        )
+        if flat is None:
+            return None
+        self._notify(task_id)
+        return self._decode(flat)
+
+    def delete(self, task_id: str) -> bool:
+        deleted = self._command(
+            "EVAL", _REDIS_DELETE_SCRIPT, 3, self._key(task_id), self._created_key, self._updated_key,
+            task_id, self._status_prefix
+        )
+        self._notify(task_id)
+        return bool(deleted)
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        prefix: Optional[str] = None,
+        limit: int = 100,
+        user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        page_size = max(limit, 100)
+        start = 0
+        while len(items) < limit:
+            task_ids = self._command("ZREVRANGE", self._created_key, start, start + page_size - 1) or []
+            if prefix:
+                task_ids = [task_id for task_id in task_ids if task_id.startswith(prefix)]
+            rows = self._pipeline([["HGETALL", self._key(task_id)] for task_id in task_ids])
+            for task_id, flat in zip(task_ids, rows):
+                data = self._decode(flat)
+                if data is None or (status and data.get("status") != status):
+                    continue
+                if user_id is not None and data.get("user_id") != user_id:
+                    continue
+                items.append(dict(data, task_id=task_id))
+            if len(rows) < page_size and not prefix:
+                break
+            start += page_size
+            if start >= (self._command("ZCARD", self._created_key) or 0):
+                break
+        return items[:limit]
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status is None:
+            return int(self._command("ZCARD", self._created_key) or 0)
+        return int(self._command("SCARD", self._status_key(status)) or 0)
+
+    def purge(
+        self,
+        ttl_seconds: float,
+        max_entries: Optional[int] = None,
+        statuses: Tuple[str, ...] = TERMINAL_STATUSES
+    ) -> List[Dict[str, Any]]:
+        flat = self._command("ZRANGE", self._updated_key, 0, -1, "WITHSCORES") or []
+        entries = [(flat[i], float(flat[i + 1])) for i in range(0, len(flat), 2)]
+        members = self._pipeline([["SMEMBERS", self._status_key(status)] for status in statuses])
+        purgeable = {task_id for ids in members for task_id in ids or []}
+        # 按更新时间从早到晚排列的可淘汰任务
+        candidates = [(task_id, updated_at) for task_id, updated_at in entries if task_id in purgeable]
+
+        cutoff = time.time() - ttl_seconds
+        purge_ids = [task_id for task_id, updated_at in candidates if updated_at < cutoff]
+        if max_entries is not None:
+            overflow = len(entries) - len(purge_ids) - max_entries
+            if overflow > 0:
+                expired = set(purge_ids)
+                purge_ids.extend([task_id for task_id, _ in candidates if task_id not in expired][:overflow])
+        if not purge_ids:
+            return []
+
+        rows = self._pipeline([["HGETALL", self._key(task_id)] for task_id in purge_ids])
+        self._pipeline([
+            ["EVAL", _REDIS_DELETE_SCRIPT, 3, self._key(task_id), self._created_key, self._updated_key,
+             task_id, self._status_prefix]
+            for task_id in purge_ids
+        ])
+        for task_id in purge_ids:
+            self._notify(task_id)
+        return [dict(self._decode(flat) or {}, task_id=task_id) for task_id, flat in zip(purge_ids, rows)]
+
+
+def create_task_store(backend: Optional[str] = None) -> TaskStore:
+    """
+    根据配置创建任务存储
+
+    Args:
+        backend: "redis"、"sqlite" 或 "memory"，默认读取环境变量 TASK_STORE；
+                 未设置时配置了Redis REST接口（KV_REST_API_URL/KV_REST_API_TOKEN 或
+                 UPSTASH_REDIS_REST_URL/UPSTASH_REDIS_REST_TOKEN）则使用Redis，否则使用SQLite
+    """
+    backend = (backend or os.getenv("TASK_STORE") or ("redis" if redis_rest_configured() else "sqlite")).lower()
+    if backend == "memory":
+        return InMemoryTaskStore()
+    if backend == "redis":
+        return RedisRESTTaskStore()
+    if os.getenv("VERCEL"):
+        # Vercel函数实例之间不共享 /tmp，状态查询和下载可能读不到其他实例创建的任务
+        logger.warning("⚠️ Vercel环境下使用SQLite任务存储，任务只对创建它的函数实例可见，请配置Vercel KV")
+    try:
+        return SQLiteTaskStore()
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ SQLite任务存储初始化失败，改用内存存储: {e}")
+        return InMemoryTaskStore()
@@ -0,0 +1,363 @@
+"""
+链路追踪
+为流程阶段和上游AI调用记录耗时span，字段与OpenTelemetry保持一致，
+可导出到本地JSONL文件或OTLP/HTTP采集端；未启用时所有span都是共享的空操作对象
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import logging
+import tempfile
+import threading
+import contextvars
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空操作span"""
+
+    trace_id = None
+    span_id = None
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """一次计时操作，作为上下文管理器使用时自动成为当前span并在退出时导出"""
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any]
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        self.tracer._export(self)
+        return False
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_exception(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class SpanExporter:
+    """span导出器基类"""
+
+    def export(self, span: Span):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class BatchSpanExporter(SpanExporter):
+    """
+    批量导出器基类
+
+    span先进入内存队列，由后台线程按批次交给 _send 导出，不阻塞请求处理；
+    队列已满时丢弃新的span
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 256,
+        flush_interval: float = 5.0,
+        max_queue_size: int = 10000,
+        shutdown_timeout: float = 10.0,
+        thread_name: str = "span-exporter"
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(target=self._worker, name=thread_name, daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                span = False
+            if span is None:
+                self._send(batch)
+                return
+            if span:
+                batch.append(span)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._send(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _send(self, spans: List[Span]):
+        """在后台线程中导出一批span"""
+        raise NotImplementedError
+
+    def shutdown(self):
+        """导出剩余的span并停止后台线程"""
+        self._queue.put(None)
+        self._thread.join(timeout=self.shutdown_timeout)
+
+
+class FileSpanExporter(BatchSpanExporter):
+    """每个span一行JSON，由后台线程批量追加写入本地文件"""
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 1.0, **kwargs: Any):
+        self.path = path or os.getenv(
+            "TRACING_FILE",
+            os.path.join(tempfile.gettempdir(), "biography_traces.jsonl")
+        )
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(flush_interval=flush_interval, thread_name="file-span-exporter", **kwargs)
+
+    def _send(self, spans: List[Span]):
+        if not spans:
+            return
+        lines = "".join(
+            json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans
+        )
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            self.dropped += len(spans)
+            logger.warning(f"span写入文件失败，丢弃 {len(spans)} 个span: {e}")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPHttpSpanExporter(BatchSpanExporter):
+    """以OTLP/HTTP JSON格式批量发送到采集端（{endpoint}/v1/traces）"""
+
+    def __init__(
+        self,
+        endpoint: Optional[str] = None,
+        service_name: str = "biography-agent",
+        batch_size: int = 256,
+        flush_interval: float = 5.0,
+        max_queue_size: int = 10000,
+        timeout: float = 10.0
+    ):
+        endpoint = endpoint or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+        super().__init__(
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            max_queue_size=max_queue_size,
+            shutdown_timeout=timeout,
+            thread_name="otlp-exporter"
+        )
+
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": self.service_name}}
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "biography-agent"},
+                    "spans": [{
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_id or "",
+                        "name": span.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [
+                            {"key": key, "value": _otlp_value(value)}
+                            for key, value in span.attributes.items()
+                        ],
+                        "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+                    } for span in spans]
+                }]
+            }]
+        }
+
+    def _send(self, spans: List[Span]):
+        if not spans:
+            return
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(self._payload(spans), ensure_ascii=False, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except Exception as e:
+            self.dropped += len(spans)
+            logger.warning(f"OTLP导出失败，丢弃 {len(spans)} 个span: {e}")
+
+
+class Tracer:
+    """创建span的入口，exporter为None时为空操作模式"""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def new_trace_id(self) -> Optional[str]:
+        """生成新的trace ID，未启用时返回None"""
+        return _new_id(128) if self.enabled else None
+
+    def span(self, name: str, trace_id: Optional[str] = None, **attributes: Any):
+        """
+        创建span（用作上下文管理器）
+
+        默认挂在当前span下；传入 trace_id 且与当前span不同时作为该trace的根span
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None and trace_id in (None, parent.trace_id):
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+        return Span(self, name, trace_id or _new_id(128), None, attributes)
+
+    def _export(self, span: Span):
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.warning(f"span导出失败 {span.name}: {e}")
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def create_tracer(exporter: Optional[str] = None) -> Tracer:
+    """
+    按配置创建tracer
+
+    Args:
+        exporter: none / file / otlp，默认读取环境变量 TRACING_EXPORTER（默认none）
+    """
+    exporter = (exporter or os.getenv("TRACING_EXPORTER", "none")).lower()
+    if exporter == "file":
+        return Tracer(FileSpanExporter())
+    if exporter == "otlp":
+        return Tracer(OTLPHttpSpanExporter(service_name=os.getenv("OTEL_SERVICE_NAME", "biography-agent")))
+    if exporter not in ("", "none"):
+        logger.warning(f"未知的追踪导出方式 {exporter}，已关闭追踪")
+    return Tracer()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """进程级共享的tracer，首次使用时按环境变量创建"""
+    global _tracer
+    if _tracer is None:
+        _tracer = create_tracer()
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    """替换进程级共享的tracer"""
+    global _tracer
+    _tracer = tracer
+
+
+def current_span():
+    """当前上下文中的span，没有时返回空操作span"""
+    return _current_span.get() or NOOP_SPAN
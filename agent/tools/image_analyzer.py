@@ -7,10 +7,10 @@ import os
 import asyncio
 from typing import Dict, Any, List
 from PIL import Image, ExifTags
-import cv2
-import numpy as np
 
+from . import image_jobs, face_detector
 from ..services.ai_service import AIService
+from ..services.image_executor import get_image_executor
 from ..core.models import ImageAnalysisResult
 
 
@@ -20,28 +20,70 @@ class ImageAnalyzer:
     def __init__(self, ai_service: AIService):
         self.ai_service = ai_service
     
-    async def analyze_image(self, image_path: str) -> ImageAnalysisResult:
+    async def analyze_image(
+        self,
+        image_path: str,
+        include_basic_info: bool = True
+    ) -> ImageAnalysisResult:
         """
         全面分析图片内容
         
         Args:
             image_path: 图片文件路径
+            include_basic_info: 是否合并EXIF基础信息（调用方单独提取时可关闭）
             
         Returns:
             ImageAnalysisResult: 分析结果
         """
-        # 基础信息提取
-        basic_info = self._extract_basic_info(image_path)
-        
         # AI分析
         ai_result = await self.ai_service.analyze_image_for_biography(image_path)
         
-        # 合并结果
-        ai_result.timestamp = basic_info.get("timestamp")
-        ai_result.location = basic_info.get("location")
+        # 合并基础信息
+        if include_basic_info:
+            basic_info = await asyncio.to_thread(self._extract_basic_info, image_path)
+            self.apply_basic_info(ai_result, basic_info)
         
         return ai_result
     
+    async def analyze_images_batch(
+        self,
+        image_paths: List[str],
+        batch_size: int = 4,
+        include_basic_info: bool = True
+    ) -> List[ImageAnalysisResult]:
+        """
+        批量分析图片（多张图片合并为一次AI请求）
+        
+        Args:
+            image_paths: 图片文件路径列表
+            batch_size: 每次请求最多包含的图片数
+            include_basic_info: 是否合并EXIF基础信息
+            
+        Returns:
+            List[ImageAnalysisResult]: 与输入顺序一致的分析结果
+        """
+        ai_results = await self.ai_service.analyze_images_batch(image_paths, batch_size)
+        
+        if include_basic_info:
+            basic_infos = await self.extract_basic_info(image_paths)
+            for image_path, ai_result in zip(image_paths, ai_results):
+                self.apply_basic_info(ai_result, basic_infos[image_path])
+        
+        return ai_results
+    
+    async def extract_basic_info(self, image_paths: List[str]) -> Dict[str, Dict[str, Any]]:
+        """并发提取多张图片的基础信息（EXIF等），不依赖AI服务"""
+        infos = await asyncio.gather(*(
+            asyncio.to_thread(self._extract_basic_info, image_path) for image_path in image_paths
+        ))
+        return dict(zip(image_paths, infos))
+    
+    @staticmethod
+    def apply_basic_info(result: ImageAnalysisResult, basic_info: Dict[str, Any]):
+        """把基础信息中的时间和位置合并到分析结果"""
+        result.timestamp = basic_info.get("timestamp")
+        result.location = basic_info.get("location")
+    
     def _extract_basic_info(self, image_path: str) -> Dict[str, Any]:
         """提取图片基础信息（EXIF数据等）"""
         info = {}
@@ -118,26 +160,7 @@ class ImageAnalyzer:
     def detect_faces(self, image_path: str) -> List[Dict[str, Any]]:
         """检测图片中的人脸"""
         try:
-            # 加载OpenCV人脸检测器
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            
-            # 读取图片
-            img = cv2.imread(image_path)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # 检测人脸
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-            
-            face_info = []
-            for i, (x, y, w, h) in enumerate(faces):
-                face_info.append({
-                    "face_id": i,
-                    "position": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)},
-                    "confidence": 0.8  # 简化的置信度
-                })
-            
-            return face_info
-            
+            return face_detector.detect_faces(image_path)
         except Exception as e:
             print(f"人脸检测失败: {e}")
             return []
@@ -145,33 +168,55 @@ class ImageAnalyzer:
     def get_image_colors(self, image_path: str, num_colors: int = 5) -> List[str]:
         """提取图片主要颜色"""
         try:
-            with Image.open(image_path) as img:
-                # 转换为RGB模式
-                img = img.convert('RGB')
-                
-                # 缩小图片以提高处理速度
-                img.thumbnail((150, 150))
-                
-                # 转换为numpy数组
-                img_array = np.array(img)
-                pixels = img_array.reshape(-1, 3)
-                
-                # 使用KMeans聚类找出主要颜色
-                from sklearn.cluster import KMeans
-                
-                kmeans = KMeans(n_clusters=num_colors, random_state=42)
-                kmeans.fit(pixels)
-                
-                colors = []
-                for color in kmeans.cluster_centers_:
-                    # 转换为十六进制颜色码
-                    hex_color = '#{:02x}{:02x}{:02x}'.format(
-                        int(color[0]), int(color[1]), int(color[2])
-                    )
-                    colors.append(hex_color)
-                
-                return colors
-                
+            return image_jobs.dominant_colors(image_path, num_colors)
+        except Exception as e:
+            print(f"颜色提取失败: {e}")
+            return []
+    
+    async def detect_faces_async(self, image_path: str) -> List[Dict[str, Any]]:
+        """在图片处理进程池中检测人脸，不阻塞事件循环（已有保存的检测结果时直接返回）"""
+        cached = face_detector.load_faces(image_path)
+        if cached is not None:
+            return cached
+        try:
+            return await get_image_executor().run(face_detector.detect_faces, image_path)
+        except Exception as e:
+            print(f"人脸检测失败: {e}")
+            return []
+    
+    async def detect_faces_batch_async(self, image_paths: List[str]) -> List[List[Dict[str, Any]]]:
+        """
+        批量检测人脸：已保存结果的图片直接复用，其余图片按进程数分组，
+        每组作为一个任务在同一进程中复用分类器依次检测
+        
+        Returns:
+            List[List[Dict[str, Any]]]: 与输入顺序一致的人脸列表
+        """
+        results = [face_detector.load_faces(image_path) for image_path in image_paths]
+        pending = [i for i, faces in enumerate(results) if faces is None]
+        if not pending:
+            return results
+        
+        executor = get_image_executor()
+        group_count = max(1, min(executor.max_workers, len(pending)))
+        groups = [pending[start::group_count] for start in range(group_count)]
+        group_results = await executor.map(
+            face_detector.detect_faces_batch,
+            [[image_paths[i] for i in group] for group in groups]
+        )
+        
+        for group, faces_list in zip(groups, group_results):
+            if isinstance(faces_list, Exception):
+                print(f"人脸检测失败: {faces_list}")
+                faces_list = [[] for _ in group]
+            for i, faces in zip(group, faces_list):
+                results[i] = faces
+        return results
+    
+    async def get_image_colors_async(self, image_path: str, num_colors: int = 5) -> List[str]:
+        """在图片处理进程池中提取主要颜色，不阻塞事件循环"""
+        try:
+            return await get_image_executor().run(image_jobs.dominant_colors, image_path, num_colors)
         except Exception as e:
             print(f"颜色提取失败: {e}")
             return []
@@ -209,11 +254,13 @@ class ImageAnalyzer:
         # AI分析
         ai_analysis = await self.analyze_image(image_path)
         
-        # 技术分析
-        basic_info = self._extract_basic_info(image_path)
-        faces = self.detect_faces(image_path)
-        colors = self.get_image_colors(image_path)
-        composition = self.analyze_composition(image_path)
+        # 技术分析（人脸检测和颜色聚类在进程池中并发执行）
+        basic_info, faces, colors, composition = await asyncio.gather(
+            asyncio.to_thread(self._extract_basic_info, image_path),
+            self.detect_faces_async(image_path),
+            self.get_image_colors_async(image_path),
+            asyncio.to_thread(self.analyze_composition, image_path)
+        )
         
         return {
             "ai_analysis": ai_analysis,
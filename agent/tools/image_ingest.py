@@ -0,0 +1,236 @@
+"""
+图片入库处理
+上传完成后把每张图片只解码一次、按EXIF方向摆正，生成一组命名的衍生图：
+AI分析用JPEG、打印分辨率版本、缩略图和封面裁剪图。
+衍生图保存在原图旁边的 {原图名}.derivatives/ 目录，下游（AI分析、PDF排版等）
+通过 find_derivative 按原图路径取用，没有衍生图时回退到原图。
+安装了OpenCV时同时检测人脸（结果保存为 faces.json），封面以人脸为中心裁剪。
+"""
+
+import os
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .lightweight_image_processor import decode_for_size, oriented_size
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+# AI分析使用的图片尺寸
+AI_DERIVATIVE_SIZE = (1024, 1024)
+
+
+@dataclass(frozen=True)
+class DerivativeSpec:
+    """衍生图规格"""
+    name: str
+    max_size: Tuple[int, int]  # 等比缩放后的最大尺寸
+    quality: int = 85  # JPEG质量
+    aspect_ratio: Optional[float] = None  # 设置时先按宽高比居中裁剪
+
+
+# 按尺寸从大到小排列：较小的衍生图从上一级结果继续缩小，避免重复缩放原图
+DERIVATIVE_SPECS: Tuple[DerivativeSpec, ...] = (
+    DerivativeSpec("print", (2400, 2400), quality=92),  # PDF中最大5英寸，约300dpi
+    DerivativeSpec("cover", (1600, 1200), quality=90, aspect_ratio=4 / 3),
+    DerivativeSpec("ai", AI_DERIVATIVE_SIZE, quality=85),
+    DerivativeSpec("thumbnail", (300, 300), quality=80),
+)
+
+
+@dataclass
+class ImageDerivatives:
+    """一张图片的衍生图集合"""
+    source: str
+    width: int  # 摆正后的原图尺寸
+    height: int
+    variants: Dict[str, str] = field(default_factory=dict)  # 衍生图名 -> 文件路径
+    sha256: Optional[str] = None
+
+    def path(self, name: str) -> str:
+        """指定衍生图的路径，不存在时返回原图"""
+        return self.variants.get(name, self.source)
+
+
+def derivatives_dir(source_path: str) -> str:
+    """原图对应的衍生图目录"""
+    return f"{os.path.splitext(source_path)[0]}.derivatives"
+
+
+def find_derivative(source_path: str, name: str) -> Optional[str]:
+    """按原图路径查找已生成的衍生图"""
+    path = os.path.join(derivatives_dir(source_path), f"{name}.jpg")
+    return path if os.path.exists(path) else None
+
+
+def find_derivative_for_size(source_path: str, max_size: Tuple[int, int]) -> Optional[str]:
+    """
+    能覆盖指定最大尺寸的最小衍生图（不含裁剪图）
+
+    衍生图本身是等比缩放结果，再缩放到 max_size 与直接缩放原图得到的尺寸一致
+    """
+    candidates = sorted(
+        (spec for spec in DERIVATIVE_SPECS if spec.aspect_ratio is None),
+        key=lambda spec: spec.max_size[0] * spec.max_size[1]
+    )
+    for spec in candidates:
+        if spec.max_size[0] >= max_size[0] and spec.max_size[1] >= max_size[1]:
+            path = find_derivative(source_path, spec.name)
+            if path:
+                return path
+    return None
+
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """转换为RGB，透明区域填充白色背景"""
+    if image.mode == "RGB":
+        return image
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert("RGB")
+
+
+def _center_crop(
+    image: Image.Image,
+    aspect_ratio: float,
+    focus: Optional[Tuple[float, float]] = None
+) -> Image.Image:
+    """按宽高比裁剪，裁剪框以 focus（默认为图像中心）为中心并限制在图像范围内"""
+    width, height = image.size
+    focus_x, focus_y = focus or (width / 2, height / 2)
+    if width / height > aspect_ratio:
+        new_width = round(height * aspect_ratio)
+        left = min(max(0, round(focus_x - new_width / 2)), width - new_width)
+        return image.crop((left, 0, left + new_width, height))
+    new_height = round(width / aspect_ratio)
+    top = min(max(0, round(focus_y - new_height / 2)), height - new_height)
+    return image.crop((0, top, width, top + new_height))
+
+
+def _faces_center(faces: List[Dict[str, Any]], scale: float) -> Optional[Tuple[float, float]]:
+    """所有人脸框外接矩形的中心（按 scale 换算到解码后的图像坐标）"""
+    if not faces:
+        return None
+    left = min(face["position"]["x"] for face in faces)
+    top = min(face["position"]["y"] for face in faces)
+    right = max(face["position"]["x"] + face["position"]["width"] for face in faces)
+    bottom = max(face["position"]["y"] + face["position"]["height"] for face in faces)
+    return (left + right) / 2 * scale, (top + bottom) / 2 * scale
+
+
+class ImageIngestor:
+    """上传图片的一次性解码和衍生图生成"""
+
+    def __init__(self, specs: Tuple[DerivativeSpec, ...] = DERIVATIVE_SPECS, detect_faces: bool = True):
+        self.specs = specs
+        self.detect_faces = detect_faces
+
+    def _detect_faces(self, source_path: str, image: Image.Image,
+                      source_size: Tuple[int, int]) -> Optional[List[Dict[str, Any]]]:
+        """在已解码的图像上检测人脸并保存结果；未安装OpenCV或检测失败时返回None"""
+        if not self.detect_faces:
+            return None
+        try:
+            # 人脸检测依赖OpenCV（可选依赖），按需导入
+            from .face_detector import detect_faces_in_image, save_faces
+            faces = detect_faces_in_image(image, source_size)
+        except ImportError:
+            return None
+        except Exception as e:
+            logger.warning(f"人脸检测失败 {source_path}: {e}")
+            return None
+        save_faces(source_path, faces, source_size)
+        return faces
+
+    def load(self, source_path: str) -> Optional[ImageDerivatives]:
+        """读取已生成的衍生图，清单缺失或有衍生图文件丢失时返回None"""
+        directory = derivatives_dir(source_path)
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        variants = {
+            name: os.path.join(directory, filename)
+            for name, filename in manifest.get("variants", {}).items()
+        }
+        if not all(os.path.exists(path) for path in variants.values()):
+            return None
+        return ImageDerivatives(
+            source=source_path,
+            width=manifest.get("width", 0),
+            height=manifest.get("height", 0),
+            variants=variants,
+            sha256=manifest.get("sha256")
+        )
+
+    def ingest(self, source_path: str, sha256: Optional[str] = None) -> ImageDerivatives:
+        """
+        解码原图并生成全部衍生图（已生成过且内容摘要一致时直接复用）
+
+        Args:
+            source_path: 原图路径
+            sha256: 上传时计算的内容摘要，记录在清单中
+
+        Returns:
+            ImageDerivatives: 衍生图集合
+        """
+        existing = self.load(source_path)
+        if existing is not None and (sha256 is None or existing.sha256 == sha256):
+            return existing
+
+        directory = derivatives_dir(source_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # 只按最大的衍生图尺寸解码（大尺寸JPEG在DCT域直接缩小）
+        decode_size = (
+            max(spec.max_size[0] for spec in self.specs),
+            max(spec.max_size[1] for spec in self.specs)
+        )
+        with Image.open(source_path) as opened:
+            width, height = oriented_size(opened)
+            image = _to_rgb(decode_for_size(opened, decode_size))
+
+        # 人脸框按原图坐标保存，裁剪封面时以人脸为中心
+        faces = self._detect_faces(source_path, image, (width, height))
+        focus = _faces_center(faces, image.width / width)
+
+        variants: Dict[str, str] = {}
+        current = image
+        for spec in self.specs:
+            if spec.aspect_ratio:
+                # 裁剪图从摆正后的原图裁剪，不影响后续衍生图
+                variant = _center_crop(image, spec.aspect_ratio, focus)
+                variant.thumbnail(spec.max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            else:
+                current = current.copy() if current is image else current
+                current.thumbnail(spec.max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+                variant = current
+            path = os.path.join(directory, f"{spec.name}.jpg")
+            tmp_path = f"{path}.tmp"
+            variant.save(tmp_path, "JPEG", quality=spec.quality, optimize=True)
+            os.replace(tmp_path, path)
+            variants[spec.name] = path
+
+        manifest = {
+            "sha256": sha256,
+            "width": width,
+            "height": height,
+            "variants": {name: os.path.basename(path) for name, path in variants.items()}
+        }
+        tmp_path = os.path.join(directory, f"{MANIFEST_NAME}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+
+        logger.info(f"🖼️ 已生成衍生图 {os.path.basename(source_path)}: {', '.join(variants)}")
+        return ImageDerivatives(source_path, width, height, variants, sha256)
@@ -0,0 +1,57 @@
+"""
+图片处理任务
+供 ImageExecutor 在子进程中执行的模块级函数：参数和返回值都可以pickle，
+图片以文件路径或共享内存句柄（SharedPixels）传入。同步调用时也可以直接使用。
+"""
+
+from typing import List
+
+from PIL import Image, ImageEnhance
+
+from .image_ingest import find_derivative
+from ..services.image_executor import SharedPixels
+
+
+def dominant_colors(image_path: str, num_colors: int = 5) -> List[str]:
+    """用KMeans聚类提取图片主要颜色（十六进制颜色码）"""
+    import numpy as np
+    from sklearn.cluster import KMeans
+
+    # 有缩略图衍生图时直接使用，不解码原图
+    with Image.open(find_derivative(image_path, "thumbnail") or image_path) as img:
+        # 转换为RGB模式
+        img = img.convert('RGB')
+
+        # 缩小图片以提高处理速度
+        img.thumbnail((150, 150))
+
+        # 转换为numpy数组
+        pixels = np.array(img).reshape(-1, 3)
+
+    kmeans = KMeans(n_clusters=num_colors, random_state=42)
+    kmeans.fit(pixels)
+
+    return [
+        '#{:02x}{:02x}{:02x}'.format(int(color[0]), int(color[1]), int(color[2]))
+        for color in kmeans.cluster_centers_
+    ]
+
+
+def enhance_shared_image(
+    pixels: SharedPixels,
+    brightness: float = 1.0,
+    contrast: float = 1.0,
+    saturation: float = 1.0,
+    sharpness: float = 1.0
+):
+    """调整亮度、对比度、饱和度和锐度，结果就地写回共享内存"""
+    image = pixels.read()
+    for enhancer, factor in (
+        (ImageEnhance.Brightness, brightness),
+        (ImageEnhance.Contrast, contrast),
+        (ImageEnhance.Color, saturation),
+        (ImageEnhance.Sharpness, sharpness),
+    ):
+        if factor != 1.0:
+            image = enhancer(image).enhance(factor)
+    pixels.write(image)
@@ -10,6 +10,7 @@ from PIL import Image, ImageDraw, ImageFont
 import textwrap
 
 from ..core.models import LayoutElement, BiographySection, ImageAnalysisResult
+from .face_detector import load_face_record
 
 
 class LayoutEngine:
@@ -309,9 +310,25 @@ class LayoutEngine:
         if not image_analyses:
             return None
         
-        # 简单的封面选择逻辑：选择第一张图片
-        # 实际实现中可以基于图片质量、内容等因素选择
-        return image_analyses[0].file_path
+        # 优先选择人脸占画面比例最大的图片（复用上传时保存的人脸检测结果），
+        # 都没有人脸或没有检测结果时选择第一张图片
+        best_path, best_score = image_analyses[0].file_path, 0.0
+        for analysis in image_analyses:
+            score = self._face_area_ratio(analysis.file_path)
+            if score > best_score:
+                best_path, best_score = analysis.file_path, score
+        return best_path
+    
+    @staticmethod
+    def _face_area_ratio(image_path: str) -> float:
+        """人脸框面积之和占整张图片的比例，没有检测结果时为0"""
+        record = load_face_record(image_path)
+        if not record or not record.get("width") or not record.get("height"):
+            return 0.0
+        face_area = sum(
+            face["position"]["width"] * face["position"]["height"] for face in record["faces"]
+        )
+        return face_area / (record["width"] * record["height"])
     
     async def create_simple_layout(
         self,
@@ -8,12 +8,63 @@
 import os
 import io
 import base64
+import asyncio
 from typing import List, Tuple, Optional, Union
 from PIL import Image, ImageOps, ImageFilter, ImageEnhance
 import logging
 
 logger = logging.getLogger(__name__)
 
+# EXIF方向标签；取值5-8表示需要转置，展示尺寸与存储尺寸宽高互换
+EXIF_ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# 支持在DCT域按比例缩小解码（Image.draft）的格式，PNG、HEIC等仍完整解码
+DRAFT_FORMATS = {'JPEG', 'MPO'}
+
+
+def oriented_size(image: Image.Image) -> Tuple[int, int]:
+    """按EXIF方向摆正后的图像尺寸（只读文件头，不解码像素）"""
+    width, height = image.size
+    try:
+        if image.getexif().get(EXIF_ORIENTATION_TAG, 1) in TRANSPOSED_ORIENTATIONS:
+            return height, width
+    except Exception:
+        pass
+    return width, height
+
+
+def decode_for_size(image: Image.Image, max_size: Tuple[int, int],
+                    reducing_gap: float = 1.0, mode: Optional[str] = None) -> Image.Image:
+    """
+    按目标尺寸解码刚打开、尚未加载像素的图像，并按EXIF方向摆正
+    
+    JPEG使用 draft 直接以1/2、1/4、1/8比例解码（DCT域缩放本身带平滑），解码尺寸不小于目标尺寸的
+    reducing_gap 倍，再由调用方LANCZOS缩放到目标尺寸；其它格式完整解码。
+    返回的图像已与文件脱离，可在关闭文件后使用。
+    
+    Args:
+        image: Image.open 得到的图像
+        max_size: 摆正后的最大尺寸 (width, height)
+        reducing_gap: 解码尺寸相对目标尺寸的最小倍数
+        mode: 需要的色彩模式（如'L'灰度），JPEG解码时直接输出该模式
+    """
+    if image.format in DRAFT_FORMATS:
+        width, height = image.size
+        box = max_size
+        if oriented_size(image) != (width, height):
+            box = (max_size[1], max_size[0])
+        scale = min(box[0] / width, box[1] / height, 1.0)
+        image.draft(mode, (int(width * scale * reducing_gap), int(height * scale * reducing_gap)))
+    
+    oriented = ImageOps.exif_transpose(image)
+    if oriented is image:
+        oriented = image.copy()
+    if mode and oriented.mode != mode:
+        oriented = oriented.convert(mode)
+    return oriented
+
+
 class LightweightImageProcessor:
     """轻量级图像处理器"""
     
@@ -31,6 +82,24 @@ class LightweightImageProcessor:
             logger.error(f"加载图像失败 {image_path}: {e}")
             return None
     
+    def load_image_for_size(self, image_path: str, max_size: Tuple[int, int] = None,
+                            mode: Optional[str] = None) -> Optional[Image.Image]:
+        """
+        以接近目标尺寸的比例解码图像，摆正方向后缩放到 max_size 以内
+        
+        用于只需要缩小图的场景（AI分析、缩略图、压缩），大幅减少大尺寸JPEG照片的解码开销
+        """
+        if max_size is None:
+            max_size = self.max_image_size
+        try:
+            with Image.open(image_path) as img:
+                image = decode_for_size(img, max_size, mode=mode)
+            image.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            return image
+        except Exception as e:
+            logger.error(f"加载图像失败 {image_path}: {e}")
+            return None
+    
     def load_image_from_bytes(self, image_bytes: bytes) -> Optional[Image.Image]:
         """从字节数据加载图像"""
         try:
@@ -135,6 +204,26 @@ class LightweightImageProcessor:
             logger.error(f"图像增强失败: {e}")
             return image
     
+    async def enhance_image_async(self, image: Image.Image,
+                                  brightness: float = 1.0,
+                                  contrast: float = 1.0,
+                                  saturation: float = 1.0,
+                                  sharpness: float = 1.0) -> Image.Image:
+        """在图片处理进程池中增强图像，像素通过共享内存传递"""
+        # 延迟导入：本模块也会作为独立模块被脚本直接导入
+        from ..services.image_executor import get_image_executor, share_image
+        from .image_jobs import enhance_shared_image
+        
+        try:
+            with share_image(image) as pixels:
+                await get_image_executor().run(
+                    enhance_shared_image, pixels, brightness, contrast, saturation, sharpness
+                )
+                return pixels.read()
+        except Exception as e:
+            logger.error(f"图像增强失败: {e}")
+            return image
+    
     def apply_filter(self, image: Image.Image, filter_type: str = "none") -> Image.Image:
         """应用滤镜效果"""
         try:
@@ -178,18 +267,12 @@ class LightweightImageProcessor:
         返回base64编码的图像数据
         """
         try:
-            # 加载图像
-            image = self.load_image(image_path)
+            # 按分析尺寸解码、摆正方向并缩小（AI分析不需要太大的图片）
+            analysis_size = (1024, 1024)
+            image = self.load_image_for_size(image_path, analysis_size)
             if image is None:
                 return None
             
-            # 自动调整方向
-            image = self.auto_orient(image)
-            
-            # 调整大小（AI分析不需要太大的图片）
-            analysis_size = (1024, 1024)
-            image = self.resize_image(image, analysis_size)
-            
             # 轻微增强图像质量
             image = self.enhance_image(image, 
                                      brightness=1.1,
@@ -203,6 +286,14 @@ class LightweightImageProcessor:
             logger.error(f"处理图像用于分析失败 {image_path}: {e}")
             return None
     
+    def _batch_output_path(self, image_path: str, output_dir: str = None) -> str:
+        """批量处理的输出路径"""
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            base_name = os.path.splitext(os.path.basename(image_path))[0]
+            return os.path.join(output_dir, f"{base_name}_processed.jpg")
+        return image_path.replace('.', '_processed.')
+    
     def batch_process_images(self, image_paths: List[str], 
                            output_dir: str = None,
                            max_size: Tuple[int, int] = None,
@@ -212,28 +303,12 @@ class LightweightImageProcessor:
         
         for i, image_path in enumerate(image_paths):
             try:
-                # 加载图像
-                image = self.load_image(image_path)
-                if image is None:
-                    continue
-                
-                # 处理图像
-                image = self.auto_orient(image)
-                image = self.resize_image(image, max_size)
-                
-                # 生成输出路径
-                if output_dir:
-                    os.makedirs(output_dir, exist_ok=True)
-                    base_name = os.path.splitext(os.path.basename(image_path))[0]
-                    output_path = os.path.join(output_dir, f"{base_name}_processed.jpg")
-                else:
-                    output_path = image_path.replace('.', '_processed.')
-                
-                # 压缩并保存
-                compressed_bytes = self.compress_image(image, quality)
-                with open(output_path, 'wb') as f:
-                    f.write(compressed_bytes)
-                
+                output_path = compress_image_file(
+                    image_path,
+                    self._batch_output_path(image_path, output_dir),
+                    quality or self.compression_quality,
+                    max_size or self.max_image_size
+                )
                 processed_paths.append(output_path)
                 logger.info(f"已处理图像 {i+1}/{len(image_paths)}: {output_path}")
                 
@@ -243,6 +318,34 @@ class LightweightImageProcessor:
         
         return processed_paths
     
+    async def batch_process_images_async(self, image_paths: List[str],
+                                         output_dir: str = None,
+                                         max_size: Tuple[int, int] = None,
+                                         quality: int = None) -> List[str]:
+        """批量处理图像，每张图片作为一个任务分发到图片处理进程池并发执行"""
+        from ..services.image_executor import get_image_executor
+        
+        executor = get_image_executor()
+        results = await asyncio.gather(*(
+            executor.run(
+                compress_image_file,
+                image_path,
+                self._batch_output_path(image_path, output_dir),
+                quality or self.compression_quality,
+                max_size or self.max_image_size
+            )
+            for image_path in image_paths
+        ), return_exceptions=True)
+        
+        processed_paths = []
+        for image_path, result in zip(image_paths, results):
+            if isinstance(result, Exception):
+                logger.error(f"处理图像失败 {image_path}: {result}")
+            else:
+                processed_paths.append(result)
+        logger.info(f"已处理图像 {len(processed_paths)}/{len(image_paths)}")
+        return processed_paths
+    
     def get_image_info(self, image_path: str) -> Optional[dict]:
         """获取图像信息"""
         try:
@@ -275,16 +378,15 @@ def compress_image_file(image_path: str, output_path: str = None,
     """
     processor = LightweightImageProcessor()
     
-    # 加载图像
-    image = processor.load_image(image_path)
+    # 加载图像（指定尺寸时按目标尺寸解码）
+    if max_size:
+        image = processor.load_image_for_size(image_path, max_size)
+    else:
+        image = processor.load_image(image_path)
+        image = processor.auto_orient(image) if image is not None else None
     if image is None:
         raise ValueError(f"无法加载图像: {image_path}")
     
-    # 处理图像
-    image = processor.auto_orient(image)
-    if max_size:
-        image = processor.resize_image(image, max_size)
-    
     # 生成输出路径
     if output_path is None:
         base, ext = os.path.splitext(image_path)
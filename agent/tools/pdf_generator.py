@@ -18,6 +18,8 @@ from reportlab.pdfgen import canvas
 from PIL import Image as PILImage
 
 from ..core.models import PDFTemplate, LayoutElement
+from ..services.tracing import get_tracer
+from .image_ingest import find_derivative
 
 
 class PDFGenerator:
@@ -107,7 +109,15 @@ class PDFGenerator:
             story.extend(self._create_content_pages(layout_result, template))
             
             # 构建PDF
-            doc.build(story)
+            with get_tracer().span(
+                "pdf.build",
+                **{
+                    "pdf.template": template_name,
+                    "pdf.chapters": len(layout_result.get("chapters") or []),
+                    "pdf.flowables": len(story)
+                }
+            ):
+                doc.build(story)
             
             return pdf_path
             
@@ -152,7 +162,7 @@ class PDFGenerator:
         if cover_image and os.path.exists(cover_image):
             try:
                 # 调整图片大小
-                img = self._resize_image_for_pdf(cover_image, max_width=4*inch, max_height=3*inch)
+                img = self._resize_image_for_pdf(cover_image, max_width=4*inch, max_height=3*inch, variant="cover")
                 elements.append(Spacer(1, 0.5*inch))
                 elements.append(img)
             except Exception as e:
@@ -295,8 +305,15 @@ class PDFGenerator:
         
         return elements
     
-    def _resize_image_for_pdf(self, image_path: str, max_width: float, max_height: float) -> Image:
-        """调整图片大小适合PDF"""
+    def _resize_image_for_pdf(
+        self,
+        image_path: str,
+        max_width: float,
+        max_height: float,
+        variant: str = "print"
+    ) -> Image:
+        """调整图片大小适合PDF（有上传时生成的衍生图时嵌入衍生图，不嵌入原图）"""
+        image_path = find_derivative(image_path, variant) or image_path
         try:
             # 使用PIL获取图片尺寸
             with PILImage.open(image_path) as pil_img:
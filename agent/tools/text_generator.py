@@ -3,8 +3,8 @@
 使用AI服务生成高质量的个人传记内容
 """
 
-from typing import List, Dict, Any
-from ..services.ai_service import AIService
+from typing import List, Dict, Any, Optional
+from ..services.ai_service import AIService, ChunkCallback
 from ..core.models import ImageAnalysisResult, BiographySection
 
 
@@ -17,7 +17,8 @@ class TextGenerator:
     async def generate_biography(
         self, 
         image_analyses: List[ImageAnalysisResult],
-        user_requirements: str
+        user_requirements: str,
+        on_chunk: Optional[ChunkCallback] = None
     ) -> str:
         """
         生成完整的个人传记
@@ -25,13 +26,15 @@ class TextGenerator:
         Args:
             image_analyses: 图片分析结果列表
             user_requirements: 用户特殊要求
+            on_chunk: 流式输出回调，传入时逐段返回草稿
             
         Returns:
             str: 生成的传记内容
         """
         return await self.ai_service.generate_biography_content(
             image_analyses, 
-            user_requirements
+            user_requirements,
+            on_chunk=on_chunk
         )
     
     async def generate_structured_biography(
@@ -2,18 +2,23 @@
 Vercel Serverless 函数 - 传记创建 (独立版本)
 """
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import httpx
 import os
+import sys
 import uuid
 import base64
 from datetime import datetime
 from typing import List, Dict, Any
 import asyncio
+import contextlib
 import tempfile
+import shutil
 import io
-from PIL import Image
+import time
+from PIL import Image, ImageOps
 import json
+import aiofiles
 
 app = FastAPI()
 
@@ -30,58 +35,57 @@ def validate_api_configuration():
         return False, "DOUBAO_API_KEY 无效或过短"
     return True, "API配置正常"
 
-# 任务存储 (使用内存存储，减少IO)
-tasks = {}
+# 限流配置（所有AI调用共享）
+AI_REQUESTS_PER_MINUTE = float(os.getenv("AI_REQUESTS_PER_MINUTE", "60"))
+AI_TOKENS_PER_MINUTE = float(os.getenv("AI_TOKENS_PER_MINUTE", "120000"))
+AI_MAX_RETRIES = 4
+TASK_DEADLINE_SECONDS = 55  # 与Vercel函数的maxDuration(60s)保持余量
 
-# 文件系统持久化存储
-TASKS_FILE = "/tmp/biography_tasks.json"
+# 任务存储、调度器和限流器与 agent/services 共用同一份实现（vercel.json 中通过 includeFiles 打包）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from agent.services.task_store import create_task_store
+from agent.services.job_scheduler import JobScheduler, SchedulerConfig, QueueFullError
+from agent.services.rate_limiter import (
+    AdaptiveRateLimiter, RateLimiterConfig, DeadlineExceededError, parse_retry_after
+)
+from agent.services.metrics import REGISTRY, CONTENT_TYPE_LATEST, RATE_LIMITED, RETRIES, LIMITER_QUEUE_DEPTH
 
-def save_tasks():
-    """将任务数据保存到文件"""
-    try:
-        # 将任务数据转换为可序列化的格式
-        serializable_tasks = {}
-        for task_id, task_data in tasks.items():
-            serializable_task = {}
-            for key, value in task_data.items():
-                if isinstance(value, (str, int, float, bool, list, dict)) or value is None:
-                    serializable_task[key] = value
-                else:
-                    # 跳过不可序列化的对象
-                    continue
-            serializable_tasks[task_id] = serializable_task
-        
-        # 保存到文件
-        with open(TASKS_FILE, 'w') as f:
-            json.dump(serializable_tasks, f)
-        print(f"任务数据已保存到文件: {TASKS_FILE}, 共{len(serializable_tasks)}个任务")
-        return True
-    except Exception as e:
-        print(f"保存任务数据失败: {str(e)}")
-        return False
+task_store = create_task_store()
 
-def load_tasks():
-    """从文件加载任务数据"""
-    global tasks
-    try:
-        if os.path.exists(TASKS_FILE):
-            with open(TASKS_FILE, 'r') as f:
-                loaded_tasks = json.load(f)
-            tasks.update(loaded_tasks)
-            print(f"从文件加载了{len(loaded_tasks)}个任务: {TASKS_FILE}")
-            return True
-        else:
-            print(f"任务数据文件不存在: {TASKS_FILE}")
-            return False
-    except Exception as e:
-        print(f"加载任务数据失败: {str(e)}")
-        return False
+# 排队位置写入任务存储，状态查询函数（api/biography/status.py）从存储中读取；
+# 写入在线程中按顺序进行，连续的变化只写入最新的位置
+_pending_queue_positions: Dict[str, int] = {}
+_queue_position_writer = None
+
+def _write_queue_positions(positions: Dict[str, int]):
+    for task_id, position in positions.items():
+        task_store.update(task_id, queue_position=position)
+
+async def _flush_queue_positions():
+    while _pending_queue_positions:
+        positions = dict(_pending_queue_positions)
+        _pending_queue_positions.clear()
+        try:
+            await asyncio.to_thread(_write_queue_positions, positions)
+        except Exception as e:
+            print(f"⚠️ 排队位置写入失败: {e}")
+
+def publish_queue_positions(positions: Dict[str, int]):
+    """调度器排队位置变化时的回调"""
+    global _queue_position_writer
+    _pending_queue_positions.update(positions)
+    if _queue_position_writer is None or _queue_position_writer.done():
+        _queue_position_writer = asyncio.ensure_future(_flush_queue_positions())
 
-# 尝试加载任务数据
-load_tasks()
+# 任务调度：限制同时执行的传记流程数，超出的任务排队，队列满时返回503
+job_scheduler = JobScheduler(SchedulerConfig(
+    max_workers=int(os.getenv("MAX_CONCURRENT_JOBS", "2")),
+    max_queue_size=int(os.getenv("MAX_QUEUED_JOBS", "10")),
+    initial_job_seconds=TASK_DEADLINE_SECONDS
+), on_positions_changed=publish_queue_positions)
 
 # 添加测试任务
-tasks["test-id"] = {
+task_store.put("test-id", {
     "status": "completed",
     "progress": 100,
     "message": "传记生成完成",
@@ -91,34 +95,44 @@ tasks["test-id"] = {
     "result": {
         "content": "这是一个测试传记内容...",
     }
-}
-save_tasks()
+})
 
 # 内联图片处理函数
-def process_image_for_ai_inline(image_bytes: bytes) -> str:
+def ingest_image_for_ai_inline(image_path: str) -> str:
     """
-    内联的图片处理函数，转换为base64
+    上传时把图片解码一次、按EXIF方向摆正并缩放为AI分析用JPEG，替换原图；
+    无法解码时返回None
     """
     try:
-        # 加载图片
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # 转换为RGB格式
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 调整大小以减少数据量
-        max_size = (1024, 1024)
-        image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # 转换为base64
-        buffer = io.BytesIO()
-        image.save(buffer, format='JPEG', quality=85)
-        buffer.seek(0)
+        with Image.open(image_path) as opened:
+            # 调整大小以减少数据量：先缩放再摆正方向，JPEG会在DCT域按接近目标的比例直接解码
+            # （thumbnail内部的draft），PNG、HEIC等格式仍完整解码；目标框为正方形，与方向无关
+            max_size = (1024, 1024)
+            opened.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            image = ImageOps.exif_transpose(opened)
+            
+            # 转换为RGB格式
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
         
-        image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        return image_base64
+        ai_path = f"{os.path.splitext(image_path)[0]}.ai.jpg"
+        image.save(ai_path, format='JPEG', quality=85)
+        if ai_path != image_path:
+            os.remove(image_path)
+        return ai_path
         
+    except Exception as e:
+        print(f"图片处理失败: {e}")
+        os.remove(image_path)
+        return None
+
+def process_image_for_ai_inline(image_path: str) -> str:
+    """
+    内联的图片处理函数，把上传时生成的AI分析JPEG转换为base64
+    """
+    try:
+        with open(image_path, "rb") as f:
+            return base64.b64encode(f.read()).decode('utf-8')
     except Exception as e:
         print(f"图片处理失败: {e}")
         return ""
@@ -239,6 +253,14 @@ def format_content_to_html(content: str) -> str:
     
     return '\n'.join(formatted_paragraphs)
 
+rate_limiter = AdaptiveRateLimiter(RateLimiterConfig(
+    requests_per_minute=AI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=AI_TOKENS_PER_MINUTE,
+    max_retries=AI_MAX_RETRIES
+))
+LIMITER_QUEUE_DEPTH.set_function(lambda: rate_limiter.queue_depth)
+
+
 class OptimizedAIService:
     """内存优化的AI服务"""
     
@@ -252,7 +274,36 @@ class OptimizedAIService:
         if not is_valid:
             print(f"⚠️ API配置警告: {message}")
     
-    async def analyze_image(self, image_base64: str, prompt: str) -> str:
+    async def _post_with_rate_limit(self, headers: dict, data: dict, timeout: float,
+                                    estimated_tokens: int, deadline: float = None) -> httpx.Response:
+        """经过共享限流器发送请求，429时按Retry-After或指数退避重试"""
+        attempt = 0
+        while True:
+            await rate_limiter.acquire(estimated_tokens, deadline)
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                response = await client.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=headers,
+                    json=data
+                )
+            
+            if response.status_code != 429:
+                if response.status_code == 200:
+                    rate_limiter.on_success()
+                return response
+            
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            RATE_LIMITED.inc(model=data["model"])
+            rate_limiter.on_rate_limited(retry_after)
+            if attempt >= rate_limiter.config.max_retries:
+                return response
+            
+            await rate_limiter.sleep_before_retry(attempt, retry_after, deadline)
+            RETRIES.inc(model=data["model"])
+            attempt += 1
+            print(f"🚦 API限流，第{attempt}次重试")
+    
+    async def analyze_image(self, image_base64: str, prompt: str, deadline: float = None) -> str:
         """分析图片内容 - 优化版本"""
         # 检查API密钥
         if not self.api_key:
@@ -286,34 +337,35 @@ class OptimizedAIService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=data
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
-                elif response.status_code == 401:
-                    return "API密钥无效，请检查DOUBAO_API_KEY配置"
-                elif response.status_code == 429:
-                    return "API调用频率限制，请稍后重试"
-                else:
-                    error_details = ""
-                    try:
-                        error_data = response.json()
-                        error_details = f": {error_data.get('error', {}).get('message', '')}"
-                    except:
-                        pass
-                    return f"图片分析失败，HTTP {response.status_code}{error_details}"
+            # 图片约1000 token，加上提示词和输出上限
+            response = await self._post_with_rate_limit(
+                headers, data, self.timeout, 1000 + len(prompt) // 2 + 2000, deadline
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                return result["choices"][0]["message"]["content"]
+            elif response.status_code == 401:
+                return "API密钥无效，请检查DOUBAO_API_KEY配置"
+            elif response.status_code == 429:
+                return "API调用频率限制，请稍后重试"
+            else:
+                error_details = ""
+                try:
+                    error_data = response.json()
+                    error_details = f": {error_data.get('error', {}).get('message', '')}"
+                except:
+                    pass
+                return f"图片分析失败，HTTP {response.status_code}{error_details}"
+        except DeadlineExceededError:
+            return "图片分析排队超时，API调用频率受限，请稍后重试"
         except httpx.TimeoutException:
             return "图片分析超时，请检查网络连接"
         except Exception as e:
             return f"图片分析出现错误: {str(e)[:100]}..."
     
-    async def generate_biography(self, image_analyses: List[str], user_requirements: str, language: str = "zh-CN") -> str:
+    async def generate_biography(self, image_analyses: List[str], user_requirements: str, language: str = "zh-CN",
+                                 deadline: float = None) -> str:
         """生成传记内容 - 优化版本"""
         # 检查API密钥
         if not self.api_key:
@@ -358,28 +410,27 @@ Write a 1000-word English biography including: introduction, growth, achievement
         }
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=data
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
-                elif response.status_code == 401:
-                    return "❌ API密钥无效\n\n请检查DOUBAO_API_KEY环境变量是否正确配置。"
-                elif response.status_code == 429:
-                    return "❌ API调用频率限制\n\n请稍后重试，或检查API配额是否充足。"
-                else:
-                    error_details = ""
-                    try:
-                        error_data = response.json()
-                        error_details = f": {error_data.get('error', {}).get('message', '')}"
-                    except:
-                        pass
-                    return f"❌ 传记生成失败\n\nHTTP {response.status_code}{error_details}\n\n请检查API配置和网络连接。"
+            response = await self._post_with_rate_limit(
+                headers, data, 60.0, len(prompt) // 2 + 3000, deadline
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                return result["choices"][0]["message"]["content"]
+            elif response.status_code == 401:
+                return "❌ API密钥无效\n\n请检查DOUBAO_API_KEY环境变量是否正确配置。"
+            elif response.status_code == 429:
+                return "❌ API调用频率限制\n\n请稍后重试，或检查API配额是否充足。"
+            else:
+                error_details = ""
+                try:
+                    error_data = response.json()
+                    error_details = f": {error_data.get('error', {}).get('message', '')}"
+                except:
+                    pass
+                return f"❌ 传记生成失败\n\nHTTP {response.status_code}{error_details}\n\n请检查API配置和网络连接。"
+        except DeadlineExceededError:
+            return "❌ API调用频率限制\n\n排队等待超过任务时限，请稍后重试。"
         except httpx.TimeoutException:
             return "❌ 传记生成超时\n\n请检查网络连接，或稍后重试。"
         except Exception as e:
@@ -387,28 +438,59 @@ Write a 1000-word English biography including: introduction, growth, achievement
 
 ai_service = OptimizedAIService()
 
-async def process_biography_task_optimized(task_id: str, image_files: List[bytes], user_requirements: str, language: str):
-    """内存优化的传记生成任务处理"""
+# 上传文件按固定大小分块写入临时目录，任务只持有文件路径
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+async def spool_upload(file: UploadFile, directory: str, max_bytes: int = MAX_IMAGE_BYTES) -> str:
+    """
+    流式保存上传文件，超过大小限制时删除已写入的部分并返回None
+    """
+    path = os.path.join(directory, f"{uuid.uuid4().hex}{os.path.splitext(file.filename or '')[1]}")
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    return path
+                size += len(chunk)
+                if size > max_bytes:
+                    break
+                await buffer.write(chunk)
+    except BaseException:
+        # 打开文件之前就失败时文件并不存在
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        raise
+    os.remove(path)
+    return None
+
+async def process_biography_task_optimized(task_id: str, image_files: List[str], user_requirements: str, language: str,
+                                           upload_dir: str = None):
+    """内存优化的传记生成任务处理，结束后删除上传文件所在的临时目录"""
+    deadline = time.monotonic() + TASK_DEADLINE_SECONDS
     try:
-        tasks[task_id]["status"] = "processing"
-        tasks[task_id]["progress"] = 10
-        save_tasks()  # 保存任务状态
+        # 任务存储可能是Redis REST接口（网络请求），读写都在线程中执行，不阻塞事件循环
+        await asyncio.to_thread(task_store.update, task_id, status="processing", progress=10)
         
         # 图片分析 - 使用内联处理
         image_analyses = []
         if image_files:
-            for i, image_data in enumerate(image_files):
+            for i, image_path in enumerate(image_files):
                 try:
-                    tasks[task_id]["progress"] = 20 + (i * 40 // len(image_files))
-                    save_tasks()  # 保存任务进度
+                    await asyncio.to_thread(
+                        task_store.update, task_id, progress=20 + (i * 40 // len(image_files))
+                    )
                     
-                    # 使用内联图像处理器
-                    image_base64 = process_image_for_ai_inline(image_data)
+                    # 上传时已生成AI分析用JPEG，这里只读取并编码
+                    image_base64 = await asyncio.to_thread(process_image_for_ai_inline, image_path)
                     
                     if image_base64:
                         analysis = await ai_service.analyze_image(
                             image_base64,
-                            "请简要描述这张图片的内容，包括人物、场景、活动等关键信息。"
+                            "请简要描述这张图片的内容，包括人物、场景、活动等关键信息。",
+                            deadline
                         )
                         image_analyses.append(analysis)
                     else:
@@ -418,35 +500,37 @@ async def process_biography_task_optimized(task_id: str, image_files: List[bytes
                     image_analyses.append(f"图片{i+1}处理出错")
                     continue
         
-        tasks[task_id]["progress"] = 70
-        save_tasks()  # 保存任务进度
+        await asyncio.to_thread(task_store.update, task_id, progress=70)
         
         # 生成传记内容
         if not image_analyses:
             image_analyses = ["用户未上传图片或图片处理失败"]
         
         biography_content = await ai_service.generate_biography(
-            image_analyses, user_requirements, language
+            image_analyses, user_requirements, language, deadline
         )
         
-        tasks[task_id]["progress"] = 90
-        save_tasks()  # 保存任务进度
+        await asyncio.to_thread(task_store.update, task_id, progress=90)
         
         # 生成HTML内容 - 使用内联函数
         html_content = generate_html_content(biography_content, "个人传记")
         
         # 更新任务状态
-        tasks[task_id]["status"] = "completed"
-        tasks[task_id]["progress"] = 100
-        tasks[task_id]["content"] = html_content
-        tasks[task_id]["filename"] = f"biography_{task_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-        tasks[task_id]["completed_at"] = datetime.now().isoformat()
-        save_tasks()  # 保存完成的任务
+        await asyncio.to_thread(
+            task_store.update,
+            task_id,
+            status="completed",
+            progress=100,
+            content=html_content,
+            filename=f"biography_{task_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html",
+            completed_at=datetime.now().isoformat()
+        )
         
     except Exception as e:
-        tasks[task_id]["status"] = "failed"
-        tasks[task_id]["error"] = str(e)[:200]  # 限制错误信息长度
-        save_tasks()  # 保存失败的任务
+        await asyncio.to_thread(task_store.update, task_id, status="failed", error=str(e)[:200])  # 限制错误信息长度
+    finally:
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
 
 @app.post("/")
 @app.post("/api/biography/create")
@@ -454,59 +538,81 @@ async def create_biography_optimized(
     user_requirements: str = Form(None),
     template_style: str = Form("classic"), 
     language: str = Form("zh-CN"),
+    user_id: str = Form(None),
     files: List[UploadFile] = File(default=[])
 ):
     """创建传记 - 内存优化版本"""
+    user_id = user_id or "anonymous"
     try:
+        # 队列已满时在读取上传文件之前就拒绝
+        job_scheduler.check_admission(user_id)
+        
         # 生成任务ID
         task_id = str(uuid.uuid4())[:8]
         
         # 初始化任务状态
-        tasks[task_id] = {
+        await asyncio.to_thread(task_store.put, task_id, {
             "status": "submitted",
             "progress": 0,
             "created_at": datetime.now().isoformat(),
+            "queued_at": datetime.now().isoformat(),
             "user_requirements": user_requirements or "请根据图片内容撰写个人传记",
             "language": language,
             "style": template_style
-        }
-        save_tasks()  # 保存新创建的任务
+        })
         
-        # 处理上传的文件
+        # 处理上传的文件：流式写入临时目录，任务执行时逐张读取
+        upload_dir = tempfile.mkdtemp(prefix=f"biography_{task_id}_")
         image_files = []
         if files:
             for file in files[:5]:  # 限制最多5张图片
                 if file.content_type and file.content_type.startswith('image/'):
                     try:
-                        content = await file.read()
-                        # 限制文件大小（5MB）
-                        if len(content) <= 5 * 1024 * 1024:
-                            image_files.append(content)
+                        # 限制文件大小（5MB），超过或无法解码的图片跳过
+                        image_path = await spool_upload(file, upload_dir)
+                        if image_path:
+                            image_path = await asyncio.to_thread(ingest_image_for_ai_inline, image_path)
+                        if image_path:
+                            image_files.append(image_path)
                     except Exception:
                         continue
         
-        # 启动后台任务
-        asyncio.create_task(process_biography_task_optimized(
-            task_id, image_files, user_requirements or "请根据图片内容撰写个人传记", language
-        ))
+        # 交给调度器排队执行
+        requirements = user_requirements or "请根据图片内容撰写个人传记"
+        try:
+            queue_position = job_scheduler.submit(
+                task_id,
+                user_id,
+                lambda: process_biography_task_optimized(task_id, image_files, requirements, language, upload_dir)
+            )
+        except QueueFullError:
+            await asyncio.to_thread(task_store.delete, task_id)
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            raise
         
         return JSONResponse({
             "task_id": task_id,
             "status": "submitted",
-            "message": "传记生成任务已提交"
+            "message": "传记生成任务已提交",
+            "queue_position": queue_position
         })
         
+    except QueueFullError as e:
+        return JSONResponse(
+            {"detail": str(e), "retry_after": e.retry_after},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建任务失败: {str(e)}")
 
 @app.get("/status/{task_id}")
 async def get_task_status_optimized(task_id: str):
     """查询任务状态 - 优化版本"""
-    if task_id not in tasks:
+    task = await asyncio.to_thread(task_store.get, task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = tasks[task_id]
-    
     response = {
         "task_id": task_id,
         "status": task["status"],
@@ -514,6 +620,11 @@ async def get_task_status_optimized(task_id: str):
         "created_at": task["created_at"]
     }
     
+    # 排队中的任务返回排队位置（执行中为0）
+    queue_position = job_scheduler.position(task_id)
+    if queue_position is not None:
+        response["queue_position"] = queue_position
+    
     if task["status"] == "completed":
         response["download_url"] = f"/download/{task_id}"
         response["completed_at"] = task.get("completed_at")
@@ -525,18 +636,16 @@ async def get_task_status_optimized(task_id: str):
 @app.get("/download/{task_id}")
 async def download_biography_optimized(task_id: str):
     """下载传记 - 优化版本"""
-    if task_id not in tasks:
+    task = await asyncio.to_thread(task_store.get, task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    task = tasks[task_id]
-    
     if task["status"] != "completed":
         raise HTTPException(status_code=400, detail="任务未完成")
     
     content = task.get("content", "")
     filename = task.get("filename", f"biography_{task_id}.html")
     
-    from fastapi.responses import Response
     return Response(
         content=content,
         media_type="text/html",
@@ -555,11 +664,19 @@ async def debug_configuration():
         "base_url": DOUBAO_BASE_URL,
         "validation_status": message,
         "is_valid": is_valid,
+        "rate_limiter": rate_limiter.stats(),
+        "scheduler": job_scheduler.stats(),
+        "metrics": REGISTRY.snapshot(),
         "timestamp": datetime.now().isoformat()
     }
     
     return JSONResponse(config_status)
 
+@app.get("/metrics")
+async def metrics():
+    """本函数实例的Prometheus指标（限流器排队数、429和重试次数等）"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
 # 对于Vercel Python Runtime，直接暴露 FastAPI `app` 对象即可，不需要额外的 handler 变量
 
 # Vercel Serverless Handler
@@ -659,7 +776,7 @@ class handler(BaseHTTPRequestHandler):
                     image_count = 1  # 假设至少有一张图片
             
             # 创建任务
-            tasks[task_id] = {
+            task_store.put(task_id, {
                 "status": "submitted",
                 "progress": 0,
                 "message": "传记生成任务已提交，请使用task_id查询进度",
@@ -668,9 +785,7 @@ class handler(BaseHTTPRequestHandler):
                 "language": language,
                 "template_style": template_style,
                 "user_requirements": user_requirements
-            }
-            
-            save_tasks()
+            })
             print(f"💾 任务已保存: {task_id}")
             
             # 构造响应数据（确保字段名匹配iOS期望）
@@ -725,9 +840,11 @@ class handler(BaseHTTPRequestHandler):
                     "doubao_key_length": len(DOUBAO_API_KEY) if DOUBAO_API_KEY else 0
                 },
                 "task_storage": {
-                    "total_tasks": len(tasks),
-                    "task_ids": list(tasks.keys())
+                    "total_tasks": task_store.count(),
+                    "task_ids": [task["task_id"] for task in task_store.list(limit=50)]
                 },
+                "rate_limiter": rate_limiter.stats(),
+                "scheduler": job_scheduler.stats(),
                 "environment": {
                     "python_version": "3.x",
                     "platform": "vercel"
@@ -3,8 +3,16 @@
 """
 from http.server import BaseHTTPRequestHandler
 import json
+import os
+import sys
 from urllib.parse import urlparse, parse_qs
 
+# 与create_optimized.py共享同一个任务存储
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from agent.services.task_store import create_task_store
+
+task_store = create_task_store()
+
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         """下载传记文件"""
@@ -22,6 +30,17 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
                 return
             
+            # 已完成的任务直接返回生成的HTML
+            task = task_store.get(task_id)
+            if task is not None and task.get("status") == "completed" and task.get("content"):
+                filename = task.get("filename", f"biography_{task_id}.html")
+                self.send_response(200)
+                self.send_header('Content-type', 'text/html; charset=utf-8')
+                self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+                self.end_headers()
+                self.wfile.write(task["content"].encode('utf-8'))
+                return
+            
             # 模拟传记内容
             if task_id == "test-id":
                 self.send_response(200)
@@ -6,36 +6,21 @@ import json
 from urllib.parse import parse_qs
 import os
 import sys
-import importlib.util
+import asyncio
 
-# 尝试从create_optimized.py导入tasks字典
-try:
-    # 获取当前文件目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # 构建create_optimized.py的路径
-    create_optimized_path = os.path.join(current_dir, 'create_optimized.py')
-    
-    # 如果文件存在，尝试导入
-    if os.path.exists(create_optimized_path):
-        # 动态导入模块
-        spec = importlib.util.spec_from_file_location("create_optimized", create_optimized_path)
-        create_optimized = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(create_optimized)
-        
-        # 获取tasks字典
-        tasks = getattr(create_optimized, 'tasks', {})
-        print(f"✅ 成功从create_optimized.py导入tasks字典，包含{len(tasks)}个任务")
-    else:
-        print(f"❌ 无法找到create_optimized.py文件: {create_optimized_path}")
-        tasks = {}
-except Exception as e:
-    print(f"❌ 导入create_optimized.py时出错: {str(e)}")
-    # 如果导入失败，使用空字典
-    tasks = {}
+# 与create_optimized.py共享同一个任务存储，直接按task_id索引查询，无需导入其模块
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from agent.services.task_store import create_task_store, task_version
+
+task_store = create_task_store()
+
+# 长轮询单次最长等待时间（秒），需小于vercel.json中该函数的maxDuration
+LONG_POLL_MAX_SECONDS = 25
+
+# 固定的演示任务（任务存储中不存在时使用），方便调试
+DEMO_TASKS = {}
 
-# 添加测试任务，方便调试
-tasks["test-id"] = {
+DEMO_TASKS["test-id"] = {
     "status": "completed",
     "progress": 100,
     "message": "传记生成完成",
@@ -48,7 +33,7 @@ tasks["test-id"] = {
 }
 
 # 添加iOS应用正在查询的测试任务ID
-tasks["test-task-f43f7806"] = {
+DEMO_TASKS["test-task-f43f7806"] = {
     "status": "completed",
     "progress": 100,
     "message": "传记生成完成",
@@ -62,7 +47,7 @@ tasks["test-task-f43f7806"] = {
 }
 
 # 添加当前轮询的任务ID
-tasks["test-task-aa5da9b3"] = {
+DEMO_TASKS["test-task-aa5da9b3"] = {
     "status": "completed",
     "progress": 100,
     "message": "传记生成完成",
@@ -76,7 +61,7 @@ tasks["test-task-aa5da9b3"] = {
 }
 
 # 添加最新轮询的任务ID
-tasks["test-task-653727fa"] = {
+DEMO_TASKS["test-task-653727fa"] = {
     "status": "completed",
     "progress": 100,
     "message": "传记生成完成",
@@ -115,6 +100,13 @@ class handler(BaseHTTPRequestHandler):
             
             print(f"🎯 提取的任务ID: {task_id}")
             
+            # 长轮询参数：wait为最长等待秒数，version为客户端上次收到的状态指纹
+            try:
+                wait = min(float(query_params.get('wait', ['0'])[0]), LONG_POLL_MAX_SECONDS)
+            except ValueError:
+                wait = 0
+            version = query_params.get('version', [None])[0]
+            
             if not task_id:
                 self.send_response(400)
                 self.send_header('Content-type', 'application/json')
@@ -127,11 +119,9 @@ class handler(BaseHTTPRequestHandler):
                 print(f"❌ 无法提取任务ID，路径: {self.path}")
                 return
             
-            # 打印当前任务存储状态
-            print(f"📂 当前任务存储中的任务: {list(tasks.keys())}")
-            
             # 从任务存储中查找任务
-            if task_id not in tasks:
+            task = task_store.get(task_id) or DEMO_TASKS.get(task_id)
+            if task is None:
                 # 如果任务不存在，尝试模拟一些测试数据
                 if task_id == "test-id":
                     self.send_response(200)
@@ -161,7 +151,12 @@ class handler(BaseHTTPRequestHandler):
                     print(f"❌ 任务不存在: {task_id}")
                     return
             
-            task = tasks[task_id]
+            # 长轮询：等待状态变化或超时（其他实例写入的变化通过轮询数据库发现）
+            if wait > 0 and task_id not in DEMO_TASKS and task.get("status") not in ("completed", "failed"):
+                task = asyncio.run(
+                    task_store.wait_for_change(task_id, version or task_version(task), wait)
+                ) or task
+            
             print(f"✅ 找到任务: {task_id}, 状态: {task.get('status', 'unknown')}")
             
             # 构造响应，确保格式匹配iOS应用期望
@@ -171,12 +166,21 @@ class handler(BaseHTTPRequestHandler):
                 "progress": float(task.get("progress", 0)),  # 确保是浮点数
                 "created_at": task.get("created_at"),
                 "image_count": task.get("image_count", 0),
-                "language": task.get("language", "zh-CN")
+                "language": task.get("language", "zh-CN"),
+                "version": task_version(task)
             }
             
             # 根据状态添加不同信息
             if task["status"] == "submitted":
-                response_data["message"] = "任务已提交，等待处理"
+                # 排队位置由创建函数的调度器写入任务存储（从1开始，0表示即将开始执行）
+                queue_position = task.get("queue_position")
+                if queue_position is not None:
+                    response_data["queue_position"] = queue_position
+                    response_data["queued_at"] = task.get("queued_at")
+                if queue_position:
+                    response_data["message"] = f"任务排队中，当前第{queue_position}位"
+                else:
+                    response_data["message"] = "任务已提交，等待处理"
             elif task["status"] == "processing":
                 response_data["message"] = f"正在处理中... ({task.get('progress', 0)}%)"
             elif task["status"] == "completed":
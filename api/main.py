@@ -3,18 +3,26 @@
 """
 
 import os
+import json
 import asyncio
+from datetime import datetime
 from typing import List, Dict, Any, Optional
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 import yaml
 
 from ..core.agent_orchestrator import AgentOrchestrator
 from ..core.models import BiographyRequest, BiographyResponse, AIModelConfig
 from ..services.ai_service import AIService
-from ..services.file_service import FileService
+from ..services.file_service import FileService, UploadTooLargeError
+from ..services.task_store import create_task_store
+from ..services.job_scheduler import QueueFullError
+from ..services.job_queue import SQLiteJobQueue
+from ..services.tracing import get_tracer
+from ..services.image_executor import get_image_executor
+from ..services.metrics import REGISTRY, CONTENT_TYPE_LATEST
 
 
 # API数据模型
@@ -33,13 +41,31 @@ class ModelConfigRequest(BaseModel):
     max_tokens: int = 2000
 
 
+class BiographyResumeRequest(BaseModel):
+    from_stage: Optional[str] = None  # analysis/text/qr/layout/pdf，为空时只执行未完成的阶段
+    template_style: Optional[str] = None
+
+
+class BiographyRerenderRequest(BaseModel):
+    template_style: str
+
+
 class TaskStatusResponse(BaseModel):
     task_id: str
     status: str
     progress: float
     message: str
     pdf_url: Optional[str] = None
+    preview_content: Optional[str] = None
     error_message: Optional[str] = None
+    version: Optional[str] = None  # 状态指纹，长轮询时回传
+    queue_position: Optional[int] = None  # 排队位置（从1开始），执行中为0
+    stage_timings: Optional[Dict[str, float]] = None  # 流程阶段耗时（秒）
+    trace_id: Optional[str] = None  # 链路追踪ID（启用追踪时返回）
+
+
+# 长轮询单次最长等待时间（秒）
+LONG_POLL_MAX_SECONDS = 30
 
 
 # 创建FastAPI应用
@@ -61,7 +87,14 @@ app.add_middleware(
 # 全局服务实例
 ai_service = AIService()
 file_service = FileService()
-agent_orchestrator = AgentOrchestrator(ai_service, file_service)
+# JOB_EXECUTION_MODE=queue 时任务写入本地持久化队列，由 agent.core.job_worker 工作进程执行
+job_queue = SQLiteJobQueue() if os.getenv("JOB_EXECUTION_MODE", "inline") == "queue" else None
+agent_orchestrator = AgentOrchestrator(
+    ai_service,
+    file_service,
+    task_store=create_task_store(),
+    job_queue=job_queue
+)
 
 
 # 依赖注入
@@ -89,9 +122,29 @@ async def startup_event():
         # 自动配置默认的AI模型
         await setup_default_models(config_data)
     
+    # 定期淘汰过期任务及其文件
+    agent_orchestrator.start_sweeper()
+    
     print("个人传记撰写Agent API服务已启动")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放资源"""
+    await agent_orchestrator.stop_sweeper()
+    
+    # 关闭AI服务的共享HTTP连接池
+    await ai_service.close()
+    
+    # 发送剩余的追踪数据
+    get_tracer().shutdown()
+    
+    # 停止图片处理进程池
+    get_image_executor().shutdown()
+    
+    print("个人传记撰写Agent API服务已关闭")
+
+
 async def setup_default_models(config_data: Dict[str, Any]):
     """设置默认AI模型"""
     try:
@@ -151,49 +204,103 @@ async def create_biography(
     Returns:
         任务ID和状态信息
     """
+    user_id = "user_001"  # 实际应用中从认证获取
+    
     try:
-        # 保存上传的文件
-        file_paths = []
-        for file in files:
-            if file.content_type.startswith('image/'):
-                file_path = await file_service.save_uploaded_file(file)
-                file_paths.append(file_path)
-        
-        if not file_paths:
-            raise HTTPException(status_code=400, detail="至少需要上传一张图片")
-        
-        # 创建传记请求
-        biography_request = BiographyRequest(
-            user_id="user_001",  # 实际应用中从认证获取
-            image_files=file_paths,
-            user_requirements=request.user_requirements,
-            template_style=request.template_style,
-            language=request.language
-        )
+        # 队列已满时在保存上传文件之前就拒绝
+        orchestrator.check_admission(user_id)
         
-        # 提交任务
-        task_id = await orchestrator.create_biography(biography_request)
+        # 保存上传的文件（流式分块写入磁盘），任务提交成功前出现任何错误都删除已保存的文件
+        uploads = []
+        try:
+            for file in files:
+                if file.content_type.startswith('image/'):
+                    uploads.append(await file_service.save_upload(file))
+            file_paths = [stored.path for stored in uploads]
+            
+            # 一次性生成下游复用的衍生图，多张图片在进程池中并发处理
+            await asyncio.gather(*(
+                file_service.create_derivatives(stored.path, stored.sha256) for stored in uploads
+            ))
+            
+            if not file_paths:
+                raise HTTPException(status_code=400, detail="至少需要上传一张图片")
+            
+            # 创建传记请求
+            biography_request = BiographyRequest(
+                user_id=user_id,
+                image_files=file_paths,
+                user_requirements=request.user_requirements,
+                template_style=request.template_style,
+                language=request.language
+            )
+            
+            # 提交任务
+            task_id = await orchestrator.create_biography(biography_request)
+        except BaseException:
+            for stored in uploads:
+                file_service.delete_file(stored.path)
+            raise
         
         return {
             "task_id": task_id,
             "status": "submitted",
-            "message": "传记生成任务已提交，请使用task_id查询进度"
+            "message": "传记生成任务已提交，请使用task_id查询进度",
+            "queue_position": orchestrator.get_queue_position(task_id)
         }
         
+    except QueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e), "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创建传记失败: {str(e)}")
 
 
+def build_status_response(task) -> TaskStatusResponse:
+    """将任务转换为状态响应"""
+    response = TaskStatusResponse(
+        task_id=task.task_id,
+        status=task.status.value,
+        progress=task.progress,
+        message=task.message,
+        preview_content=task.draft_content or None,
+        error_message=task.error,
+        version=task.version,
+        queue_position=agent_orchestrator.get_queue_position(task.task_id),
+        stage_timings=task.stage_timings or None,
+        trace_id=task.trace_id
+    )
+    
+    # 如果任务完成，添加PDF下载链接
+    if task.status.value == "completed" and task.result:
+        pdf_path = task.result.get("pdf_path")
+        if pdf_path:
+            response.pdf_url = f"/api/biography/download/{task.task_id}"
+    
+    return response
+
+
 @app.get("/api/biography/status/{task_id}")
 async def get_task_status(
     task_id: str,
+    wait: float = 0,
+    version: Optional[str] = None,
     orchestrator: AgentOrchestrator = Depends(get_agent_orchestrator)
 ):
     """
     查询任务状态
     
+    wait 大于0时为长轮询：状态相对 version（默认为当前状态）发生变化或等待超时后才返回
+    
     Args:
         task_id: 任务ID
+        wait: 最长等待秒数（不超过 LONG_POLL_MAX_SECONDS）
+        version: 客户端上次收到的状态指纹
         
     Returns:
         任务状态信息
@@ -204,21 +311,14 @@ async def get_task_status(
         if not task:
             raise HTTPException(status_code=404, detail="任务不存在")
         
-        response = TaskStatusResponse(
-            task_id=task.task_id,
-            status=task.status.value,
-            progress=task.progress,
-            message=task.message,
-            error_message=task.error
-        )
-        
-        # 如果任务完成，添加PDF下载链接
-        if task.status.value == "completed" and task.result:
-            pdf_path = task.result.get("pdf_path")
-            if pdf_path:
-                response.pdf_url = f"/api/biography/download/{task_id}"
+        if wait > 0 and task.status.value not in ("completed", "failed"):
+            task = await orchestrator.wait_for_task_change(
+                task_id, version or task.version, min(wait, LONG_POLL_MAX_SECONDS)
+            )
+            if not task:
+                raise HTTPException(status_code=404, detail="任务不存在")
         
-        return response
+        return build_status_response(task)
         
     except HTTPException:
         raise
@@ -226,6 +326,152 @@ async def get_task_status(
         raise HTTPException(status_code=500, detail=f"查询任务状态失败: {str(e)}")
 
 
+@app.get("/api/biography/status/{task_id}/events")
+async def stream_task_status(
+    task_id: str,
+    orchestrator: AgentOrchestrator = Depends(get_agent_orchestrator)
+):
+    """
+    以SSE方式推送任务状态
+    
+    状态、进度或消息变化时推送 status 事件（内容同状态查询接口），任务结束后关闭连接
+    
+    Args:
+        task_id: 任务ID
+        
+    Returns:
+        text/event-stream 响应
+    """
+    task = orchestrator.get_task_status(task_id)
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    async def event_stream():
+        current = task
+        while True:
+            data = json.dumps(build_status_response(current).dict(), ensure_ascii=False)
+            yield f"event: status\ndata: {data}\n\n"
+            if current.status.value in ("completed", "failed"):
+                return
+            
+            version = current.version
+            while current.version == version:
+                current = await orchestrator.wait_for_task_change(task_id, version, timeout=15)
+                if not current:
+                    data = json.dumps({"type": "failed", "error": "任务不存在"}, ensure_ascii=False)
+                    yield f"event: failed\ndata: {data}\n\n"
+                    return
+                if current.version == version:
+                    # 保持连接，防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/biography/stream/{task_id}")
+async def stream_biography_draft(
+    task_id: str,
+    orchestrator: AgentOrchestrator = Depends(get_agent_orchestrator)
+):
+    """
+    以SSE方式推送传记草稿
+    
+    事件类型: draft（已生成的草稿）、chunk（增量文本）、reset（草稿作废重新生成）、
+    completed、failed
+    
+    Args:
+        task_id: 任务ID
+        
+    Returns:
+        text/event-stream 响应
+    """
+    task = orchestrator.get_task_status(task_id)
+    
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    def format_event(event: Dict[str, Any]) -> str:
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    async def store_event_stream():
+        # 队列模式下任务在Worker进程中执行，本进程收不到草稿事件，
+        # 改为等待任务存储中的草稿变化，按差异推送
+        latest = task
+        sent = latest.draft_content
+        if sent:
+            yield format_event({"type": "draft", "text": sent})
+        
+        while latest.status.value not in ("completed", "failed"):
+            changed = await orchestrator.wait_for_draft_change(task_id, latest.draft_version, timeout=15)
+            if changed is None:
+                yield format_event({"type": "failed", "error": "任务不存在"})
+                return
+            if changed.draft_version == latest.draft_version:
+                # 保持连接，防止代理断开空闲连接
+                yield ": keep-alive\n\n"
+                continue
+            
+            latest = changed
+            draft = latest.draft_content
+            # 完成后草稿只保留预览，不再比较
+            if latest.status.value in ("completed", "failed") or draft == sent:
+                continue
+            if draft.startswith(sent):
+                yield format_event({"type": "chunk", "text": draft[len(sent):]})
+            else:
+                # 草稿不是在已推送内容上追加（主备切换后重新生成），让客户端丢弃旧草稿
+                yield format_event({"type": "reset"})
+                yield format_event({"type": "chunk", "text": draft})
+            sent = draft
+        
+        yield format_event({"type": latest.status.value, "error": latest.error})
+    
+    async def event_stream():
+        if orchestrator.job_queue is not None:
+            async for message in store_event_stream():
+                yield message
+            return
+        
+        queue = orchestrator.subscribe_draft(task_id)
+        try:
+            if task.draft_content:
+                yield format_event({"type": "draft", "text": task.draft_content})
+            
+            if task.status.value in ("completed", "failed"):
+                yield format_event({"type": task.status.value, "error": task.error})
+                return
+            
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # 任务在其他进程执行时收不到草稿事件，通过任务存储判断是否已结束
+                    latest = orchestrator.get_task_status(task_id)
+                    if latest and latest.status.value in ("completed", "failed"):
+                        yield format_event({"type": latest.status.value, "error": latest.error})
+                        break
+                    # 保持连接，防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                yield format_event(event)
+                if event["type"] in ("completed", "failed"):
+                    break
+        finally:
+            orchestrator.unsubscribe_draft(task_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/biography/download/{task_id}")
 async def download_biography(
     task_id: str,
@@ -269,6 +515,79 @@ async def download_biography(
         raise HTTPException(status_code=500, detail=f"下载PDF失败: {str(e)}")
 
 
+async def requeue_biography(task_id: str, resume) -> TaskStatusResponse:
+    """执行恢复/重新排版调用，统一转换错误响应"""
+    try:
+        task = await resume
+        if not task:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        return build_status_response(task)
+        
+    except QueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e), "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"重新执行任务失败: {str(e)}")
+
+
+@app.post("/api/biography/{task_id}/resume")
+async def resume_biography(
+    task_id: str,
+    request: BiographyResumeRequest = BiographyResumeRequest(),
+    orchestrator: AgentOrchestrator = Depends(get_agent_orchestrator)
+):
+    """
+    恢复失败的任务或重新生成已完成的任务
+    
+    已有检查点的阶段（图片分析、文本、二维码、排版、PDF）直接复用，
+    从第一个未完成的阶段（或 from_stage 指定的阶段）开始执行
+    
+    Args:
+        task_id: 任务ID
+        request: 起始阶段和可选的新模板
+        
+    Returns:
+        重新排队后的任务状态
+    """
+    return await requeue_biography(
+        task_id,
+        orchestrator.resume_biography(
+            task_id,
+            from_stage=request.from_stage,
+            template_style=request.template_style
+        )
+    )
+
+
+@app.post("/api/biography/{task_id}/rerender")
+async def rerender_biography(
+    task_id: str,
+    request: BiographyRerenderRequest,
+    orchestrator: AgentOrchestrator = Depends(get_agent_orchestrator)
+):
+    """
+    用另一个模板重新排版并生成PDF，复用已生成的传记文本
+    
+    Args:
+        task_id: 任务ID
+        request: 新的模板样式
+        
+    Returns:
+        重新排队后的任务状态
+    """
+    return await requeue_biography(
+        task_id,
+        orchestrator.rerender_biography(task_id, request.template_style)
+    )
+
+
 @app.post("/api/models/configure")
 async def configure_ai_model(
     config: ModelConfigRequest,
@@ -344,7 +663,29 @@ async def health_check():
     return {
         "status": "healthy",
         "ai_service": len(ai_service.get_available_providers()) > 0,
-        "current_model": ai_service.get_current_provider_info()
+        "current_model": ai_service.get_current_provider_info(),
+        "scheduler": agent_orchestrator.scheduler.stats(),
+        "job_queue": job_queue.stats() if job_queue else None
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus指标（阶段耗时、上游调用耗时、执行中任务数、排队深度、缓存命中、故障转移、429和token消耗）"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """统计信息（与 /metrics 使用同一个指标注册表）"""
+    metrics = REGISTRY.snapshot()
+    return {
+        "tasks_stored": agent_orchestrator.task_store.count(),
+        "tasks_finished": metrics.get("biography_tasks", {}),
+        "in_flight": int(metrics.get("biography_tasks_in_flight", {}).get("all", 0)),
+        "queued": int(metrics.get("biography_queue_depth", {}).get("all", 0)),
+        "metrics": metrics,
+        "last_updated": datetime.now().isoformat()
     }
 
 
@@ -1,40 +1,96 @@
 """
 统计信息API
+从共享任务存储实时计算任务统计；JSON摘要和Prometheus指标（?format=prometheus）来自同一个指标注册表。
+Vercel函数之间不共享进程内存，create_optimized 记录的阶段耗时、上游调用等指标在本函数中不可见，
+因此这里只导出能从任务存储计算出来的指标
 """
 from http.server import BaseHTTPRequestHandler
 import json
+import os
+import sys
 from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
+# 任务存储和指标与 agent/services 共用同一份实现（vercel.json 中通过 includeFiles 打包）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from agent.services.task_store import create_task_store
+from agent.services.metrics import MetricsRegistry, CONTENT_TYPE_LATEST
+
+task_store = create_task_store()
+
+# 独立的注册表：只包含下面从任务存储计算的指标，不导出本函数中不会写入的空序列
+REGISTRY = MetricsRegistry()
+
+# create_optimized 写入的任务状态
+TASK_STATUSES = ("submitted", "processing", "completed", "failed")
+
+
+def average_processing_seconds(limit: int = 200) -> float:
+    """最近完成的任务从提交到完成的平均耗时"""
+    durations = []
+    for task in task_store.list(status="completed", limit=limit):
+        try:
+            started_at = datetime.fromisoformat(task["created_at"])
+            completed_at = datetime.fromisoformat(task["completed_at"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        durations.append((completed_at - started_at).total_seconds())
+    return sum(durations) / len(durations) if durations else 0.0
+
+
+TASKS_STORED = REGISTRY.gauge("biography_tasks_stored", "任务存储中各状态的任务数", ("status",))
+TASKS_STORED.set_function(lambda: {(status,): task_store.count(status) for status in TASK_STATUSES})
+TASKS_IN_FLIGHT = REGISTRY.gauge("biography_tasks_in_flight", "正在执行的传记任务数")
+QUEUE_DEPTH = REGISTRY.gauge("biography_queue_depth", "排队等待执行的传记任务数")
+TASKS_IN_FLIGHT.set_function(lambda: task_store.count("processing"))
+QUEUE_DEPTH.set_function(lambda: task_store.count("submitted"))
+AVG_PROCESSING = REGISTRY.gauge(
+    "biography_recent_task_duration_seconds_avg", "最近完成的任务从提交到完成的平均耗时"
+)
+AVG_PROCESSING.set_function(average_processing_seconds)
+
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         """获取统计信息"""
+        query = parse_qs(urlparse(self.path).query)
+        if query.get("format", [""])[0] == "prometheus":
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', CONTENT_TYPE_LATEST)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        
-        # 模拟统计数据
+
+        metrics = REGISTRY.snapshot()
+        stored = metrics.get("biography_tasks_stored", {})
+        avg_seconds = metrics.get("biography_recent_task_duration_seconds_avg", {}).get("all", 0.0)
         stats = {
-            "total_users": 1234,
-            "active_users_30d": 456,
-            "recent_users_7d": 89,
-            "total_notes": 5678,
-            "total_business_cards": 234,
-            "total_biographies": 89,
-            "successful_generations": 67,
-            "avg_processing_time": "45s",
+            "total_biographies": int(sum(stored.values())),
+            "successful_generations": int(stored.get("completed", 0)),
+            "failed_generations": int(stored.get("failed", 0)),
+            "in_flight": int(metrics.get("biography_tasks_in_flight", {}).get("all", 0)),
+            "queued": int(metrics.get("biography_queue_depth", {}).get("all", 0)),
+            "avg_processing_time": f"{avg_seconds:.0f}s",
+            "metrics": metrics,
             "last_updated": datetime.now().isoformat(),
             "platform": "Vercel",
             "status": "healthy",
             "version": "2.0-optimized"
         }
-        
+
         self.wfile.write(json.dumps(stats, ensure_ascii=False).encode('utf-8'))
-    
+
     def do_OPTIONS(self):
         """处理CORS预检请求"""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers() 
\ No newline at end of file
+        self.end_headers()
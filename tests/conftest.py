@@ -0,0 +1,10 @@
+"""
+测试公共配置：把仓库根目录加入导入路径，以 agent.services.* / agent.tools.* 导入被测模块
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
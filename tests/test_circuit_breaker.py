@@ -0,0 +1,85 @@
+"""熔断器：按错误率熔断、冷却后半开探测、探测成功恢复或失败重新熔断"""
+
+from agent.services.circuit_breaker import CircuitBreaker, CircuitBreakerConfig, CircuitState
+
+
+def make_breaker(**overrides) -> CircuitBreaker:
+    config = CircuitBreakerConfig(min_calls=3, failure_rate_threshold=0.5, open_seconds=0.0,
+                                  half_open_max_calls=1, half_open_success_threshold=2)
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return CircuitBreaker("test", config)
+
+
+def test_stays_closed_below_min_calls():
+    breaker = make_breaker()
+    breaker.record_failure(0.1)
+    breaker.record_failure(0.1)
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_when_failure_rate_reached():
+    breaker = make_breaker(open_seconds=60.0)
+    breaker.record_success(0.1)
+    breaker.record_failure(0.1)
+    breaker.record_failure(0.1)
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+
+def test_opens_on_slow_calls():
+    breaker = make_breaker(open_seconds=60.0, slow_call_seconds=1.0, slow_call_rate_threshold=0.8)
+    for _ in range(3):
+        breaker.record_success(2.0)
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_half_open_limits_probes_and_closes_after_successes():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(0.1)
+    assert breaker.state == CircuitState.OPEN
+
+    # 冷却结束后只放行一个探测请求
+    assert breaker.allow_request()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert not breaker.allow_request()
+
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_half_open_failure_reopens():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(0.1)
+    assert breaker.allow_request()
+    breaker.record_failure(0.1)
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_cancelled_probe_releases_slot_without_counting():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure(0.1)
+    assert breaker.allow_request()
+    breaker.record_cancelled()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_snapshot_reports_window_stats():
+    breaker = make_breaker(min_calls=10)
+    breaker.record_success(1.0)
+    breaker.record_success(3.0)
+    breaker.record_failure(0.5)
+    snapshot = breaker.snapshot()
+    assert snapshot["state"] == "closed"
+    assert snapshot["window_calls"] == 3
+    assert snapshot["failure_rate"] == round(1 / 3, 3)
+    assert breaker.success_count() == 2
+    assert breaker.latency_percentile(95) == 3.0
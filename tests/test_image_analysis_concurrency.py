@@ -0,0 +1,127 @@
+"""编排器的并发图片分析：结果保持输入顺序、单张失败隔离、单任务与全局并发上限、进度回调"""
+
+import asyncio
+
+import pytest
+
+orchestrator_module = pytest.importorskip("agent.core.agent_orchestrator")
+from agent.core.models import ImageAnalysisResult  # noqa: E402
+from agent.services.task_store import InMemoryTaskStore  # noqa: E402
+
+
+class FakeImageAnalyzer:
+    """记录同时进行的分析数；文件名包含 fail 的图片分析失败，delays 控制各图片的耗时"""
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.active = 0
+        self.peak = 0
+        self.batches = []
+
+    async def _analyze(self, path):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delays.get(path, 0.01))
+            if "fail" in path:
+                raise RuntimeError(f"analysis failed: {path}")
+            return ImageAnalysisResult(
+                file_path=path, description=f"描述 {path}", key_elements=[], people=[],
+                objects=[], scene={}, emotions=[]
+            )
+        finally:
+            self.active -= 1
+
+    async def analyze_image(self, path, include_basic_info=True):
+        return await self._analyze(path)
+
+    async def analyze_images_batch(self, paths, batch_size, include_basic_info=True):
+        self.batches.append(list(paths))
+        return [await self._analyze(path) for path in paths]
+
+
+def make_orchestrator(analyzer, per_task=3, global_limit=8, batch_size=1):
+    orchestrator = orchestrator_module.AgentOrchestrator(
+        ai_service=None,
+        file_service=None,
+        max_concurrent_analyses_per_task=per_task,
+        max_concurrent_analyses=global_limit,
+        analysis_batch_size=batch_size,
+        task_store=InMemoryTaskStore()
+    )
+    orchestrator.image_analyzer = analyzer
+    return orchestrator
+
+
+def test_results_keep_input_order():
+    # 先提交的图片耗时更长，结果仍按输入顺序返回
+    paths = [f"img{i}.jpg" for i in range(5)]
+    analyzer = FakeImageAnalyzer({path: 0.05 - i * 0.01 for i, path in enumerate(paths)})
+    orchestrator = make_orchestrator(analyzer, per_task=5)
+
+    results = asyncio.run(orchestrator._analyze_images(paths))
+    assert [result.file_path for result in results] == paths
+
+
+def test_failed_image_is_skipped_without_affecting_others():
+    paths = ["a.jpg", "fail.jpg", "b.jpg"]
+    orchestrator = make_orchestrator(FakeImageAnalyzer())
+
+    results = asyncio.run(orchestrator._analyze_images(paths))
+    assert [result.file_path for result in results] == ["a.jpg", "b.jpg"]
+
+
+def test_all_failures_raise():
+    orchestrator = make_orchestrator(FakeImageAnalyzer())
+    with pytest.raises(Exception, match="所有图片分析均失败"):
+        asyncio.run(orchestrator._analyze_images(["fail1.jpg", "fail2.jpg"]))
+
+
+def test_empty_input_returns_empty_list():
+    orchestrator = make_orchestrator(FakeImageAnalyzer())
+    assert asyncio.run(orchestrator._analyze_images([])) == []
+
+
+def test_per_task_limit():
+    analyzer = FakeImageAnalyzer()
+    orchestrator = make_orchestrator(analyzer, per_task=2, global_limit=8)
+
+    asyncio.run(orchestrator._analyze_images([f"img{i}.jpg" for i in range(6)]))
+    assert analyzer.peak == 2
+
+
+def test_global_limit_shared_between_tasks():
+    analyzer = FakeImageAnalyzer()
+    orchestrator = make_orchestrator(analyzer, per_task=3, global_limit=4)
+
+    async def scenario():
+        await asyncio.gather(*(
+            orchestrator._analyze_images([f"task{task}_img{i}.jpg" for i in range(3)])
+            for task in range(3)
+        ))
+
+    asyncio.run(scenario())
+    assert analyzer.peak == 4
+
+
+def test_progress_ticks_once_per_image_including_failures():
+    ticks = []
+    orchestrator = make_orchestrator(FakeImageAnalyzer())
+
+    asyncio.run(orchestrator._analyze_images(
+        ["a.jpg", "fail.jpg", "b.jpg"], lambda completed, total: ticks.append((completed, total))
+    ))
+    assert ticks == [(1, 3), (2, 3), (3, 3)]
+
+
+def test_batches_group_images_and_progress_by_batch():
+    ticks = []
+    analyzer = FakeImageAnalyzer()
+    orchestrator = make_orchestrator(analyzer, batch_size=2)
+
+    results = asyncio.run(orchestrator._analyze_images(
+        ["a.jpg", "b.jpg", "c.jpg"], lambda completed, total: ticks.append(completed)
+    ))
+    assert [result.file_path for result in results] == ["a.jpg", "b.jpg", "c.jpg"]
+    assert analyzer.batches == [["a.jpg", "b.jpg"]]
+    assert sorted(ticks) == [1, 3]
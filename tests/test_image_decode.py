@@ -0,0 +1,66 @@
+"""按目标尺寸解码：JPEG在DCT域缩小、EXIF方向摆正、解码结果与文件脱离"""
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+from agent.tools.lightweight_image_processor import (  # noqa: E402
+    EXIF_ORIENTATION_TAG,
+    decode_for_size,
+    oriented_size,
+)
+
+
+def save_jpeg(path, size, orientation=None):
+    image = Image.new("RGB", size, (200, 120, 40))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[EXIF_ORIENTATION_TAG] = orientation
+    image.save(path, "JPEG", quality=80, exif=exif.tobytes())
+    return str(path)
+
+
+def test_large_jpeg_decoded_at_reduced_scale(tmp_path):
+    path = save_jpeg(tmp_path / "photo.jpg", (4000, 3000))
+    with Image.open(path) as image:
+        decoded = decode_for_size(image, (2000, 2000))
+    assert decoded.size == (2000, 1500)
+
+
+def test_draft_never_decodes_below_target(tmp_path):
+    path = save_jpeg(tmp_path / "photo.jpg", (4000, 3000))
+    with Image.open(path) as image:
+        decoded = decode_for_size(image, (1024, 1024))
+    # 1/2比例（2000x1500）仍覆盖目标尺寸，1/4比例（1000x750）不够
+    assert decoded.size == (2000, 1500)
+
+
+def test_reducing_gap_keeps_larger_decode(tmp_path):
+    path = save_jpeg(tmp_path / "photo.jpg", (4000, 3000))
+    with Image.open(path) as image:
+        decoded = decode_for_size(image, (800, 800), reducing_gap=2.0)
+    assert decoded.size == (2000, 1500)
+
+
+def test_exif_rotation_applied_and_box_swapped(tmp_path):
+    path = save_jpeg(tmp_path / "rotated.jpg", (4000, 3000), orientation=6)
+    with Image.open(path) as image:
+        assert oriented_size(image) == (3000, 4000)
+        decoded = decode_for_size(image, (1500, 2000))
+    assert decoded.size == (1500, 2000)
+
+
+def test_grayscale_mode_and_detached_from_file(tmp_path):
+    path = save_jpeg(tmp_path / "photo.jpg", (1600, 1200))
+    with Image.open(path) as image:
+        decoded = decode_for_size(image, (400, 400), mode="L")
+    assert decoded.mode == "L"
+    assert decoded.size == (400, 300)
+    assert decoded.getpixel((0, 0)) > 0
+
+
+def test_non_jpeg_decoded_in_full(tmp_path):
+    path = str(tmp_path / "photo.png")
+    Image.new("RGB", (800, 600)).save(path)
+    with Image.open(path) as image:
+        decoded = decode_for_size(image, (200, 200))
+    assert decoded.size == (800, 600)
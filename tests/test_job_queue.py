@@ -0,0 +1,95 @@
+"""持久化任务队列：优先级领取、租约续期与过期接管、失败重试；队列模式下经任务存储推送草稿"""
+
+import asyncio
+import time
+
+import pytest
+
+from agent.services.job_queue import SQLiteJobQueue
+from agent.services.task_store import InMemoryTaskStore, draft_version, task_version
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(path=str(tmp_path / "jobs.db"), max_attempts=2)
+
+
+def test_claim_by_priority_then_enqueue_order(queue):
+    queue.enqueue("low", "u1", {"n": 1})
+    queue.enqueue("high", "u2", {"n": 2}, priority=5)
+    queue.enqueue("low2", "u1", {"n": 3})
+
+    assert queue.position("high") == 1
+    assert queue.position("low2") == 3
+    assert queue.count_for_user("u1") == 2
+
+    job = queue.claim("w1", lease_seconds=30)
+    assert job == {"job_id": "high", "user_id": "u2", "payload": {"n": 2}, "attempts": 1}
+    assert queue.position("high") == 0
+    assert queue.claim("w1", 30)["job_id"] == "low"
+    assert queue.claim("w1", 30)["job_id"] == "low2"
+    assert queue.claim("w1", 30) is None
+
+
+def test_active_lease_is_not_reclaimed(queue):
+    queue.enqueue("job", "u1", {})
+    assert queue.claim("w1", lease_seconds=30)["job_id"] == "job"
+    assert queue.claim("w2", lease_seconds=30) is None
+    assert queue.heartbeat("job", "w1", 30)
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.enqueue("job", "u1", {})
+    queue.claim("w1", lease_seconds=0.05)
+    time.sleep(0.1)
+
+    job = queue.claim("w2", lease_seconds=30)
+    assert job["job_id"] == "job"
+    assert job["attempts"] == 2
+    # 原工作进程已失去租约：续租失败，完成和失败都不影响新的持有者
+    assert not queue.heartbeat("job", "w1", 30)
+    queue.complete("job", "w1")
+    assert queue.stats()["running"] == 1
+    assert queue.heartbeat("job", "w2", 30)
+
+
+def test_complete_removes_job(queue):
+    queue.enqueue("job", "u1", {})
+    queue.claim("w1", 30)
+    queue.complete("job", "w1")
+    assert queue.position("job") is None
+    assert queue.stats() == {"queued": 0, "running": 0, "failed": 0}
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    queue.enqueue("job", "u1", {})
+    queue.claim("w1", 30)
+    queue.fail("job", "w1", "boom")
+    assert queue.count("queued") == 1
+
+    queue.claim("w1", 30)
+    queue.fail("job", "w1", "boom")
+    assert queue.count("failed") == 1
+    assert queue.position("job") is None
+    assert queue.claim("w1", 30) is None
+
+
+def test_draft_update_wakes_draft_waiter_only():
+    store = InMemoryTaskStore()
+    task = {"task_id": "t", "status": "processing", "progress": 50.0, "message": "生成中", "draft_content": "第一段"}
+    store.put("t", task)
+
+    async def scenario():
+        async def write_draft():
+            await asyncio.sleep(0.05)
+            store.put("t", {**task, "draft_content": "第一段第二段"})
+
+        writer = asyncio.create_task(write_draft())
+        changed = await store.wait_for_change("t", draft_version(task), 2, fingerprint=draft_version)
+        await writer
+        unchanged = await store.wait_for_change("t", task_version(task), 0.1)
+        return changed, unchanged
+
+    changed, unchanged = asyncio.run(scenario())
+    assert changed["draft_content"] == "第一段第二段"
+    assert task_version(unchanged) == task_version(task)
@@ -0,0 +1,89 @@
+"""任务调度器：并发上限、同优先级按用户轮转、排队位置和位置变化回调"""
+
+import asyncio
+
+import pytest
+
+from agent.services.job_scheduler import JobScheduler, QueueFullError, SchedulerConfig
+
+
+def test_positions_follow_round_robin_and_callback_reports_changes():
+    async def scenario():
+        updates = []
+        scheduler = JobScheduler(SchedulerConfig(max_workers=1), on_positions_changed=updates.append)
+        release = asyncio.Event()
+
+        async def job():
+            await release.wait()
+
+        for job_id, user_id in (("a1", "alice"), ("a2", "alice"), ("a3", "alice"), ("b1", "bob")):
+            scheduler.submit(job_id, user_id, job)
+        positions = {job_id: scheduler.position(job_id) for job_id in ("a1", "a2", "a3", "b1")}
+
+        release.set()
+        while scheduler.stats()["completed"] < 4:
+            await asyncio.sleep(0.01)
+        return positions, updates
+
+    positions, updates = asyncio.run(scenario())
+    # alice 的第三个任务排在 bob 之后
+    assert positions == {"a1": 0, "a2": 1, "b1": 2, "a3": 3}
+    assert updates[0] == {"a1": 0}
+    assert updates[3] == {"a2": 1, "b1": 2, "a3": 3}
+    # 每次出队后剩余任务前移，刚开始执行的任务位置为0
+    assert updates[4] == {"b1": 1, "a3": 2, "a2": 0}
+    assert updates[5] == {"a3": 1, "b1": 0}
+    assert updates[6] == {"a3": 0}
+
+
+def test_cancel_reports_new_positions():
+    async def scenario():
+        updates = []
+        scheduler = JobScheduler(SchedulerConfig(max_workers=1), on_positions_changed=updates.append)
+        release = asyncio.Event()
+
+        async def job():
+            await release.wait()
+
+        for job_id in ("a", "b", "c"):
+            scheduler.submit(job_id, job_id, job)
+        assert scheduler.cancel("b")
+        release.set()
+        return updates[-1]
+
+    assert asyncio.run(scenario()) == {"c": 1}
+
+
+def test_callback_errors_do_not_break_scheduling():
+    async def scenario():
+        def failing(positions):
+            raise RuntimeError("store unavailable")
+
+        scheduler = JobScheduler(SchedulerConfig(max_workers=1), on_positions_changed=failing)
+        done = asyncio.Event()
+
+        async def job():
+            done.set()
+
+        assert scheduler.submit("a", "alice", job) == 0
+        await asyncio.wait_for(done.wait(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_queue_full_rejected():
+    async def scenario():
+        scheduler = JobScheduler(SchedulerConfig(max_workers=1, max_queue_size=1))
+        release = asyncio.Event()
+
+        async def job():
+            await release.wait()
+
+        scheduler.submit("a", "alice", job)
+        scheduler.submit("b", "bob", job)
+        with pytest.raises(QueueFullError) as error:
+            scheduler.submit("c", "carol", job)
+        release.set()
+        return error.value.retry_after
+
+    assert asyncio.run(scenario()) >= 1
@@ -0,0 +1,116 @@
+"""流程编排：依赖顺序、并发执行、循环依赖检测、失败时取消其他阶段"""
+
+import asyncio
+
+import pytest
+
+from agent.core.pipeline import Pipeline, Stage
+
+
+def recording_stage(name, log, inputs=(), delay=0.0, result=None):
+    async def run(pipeline_run, **values):
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+        return result if result is not None else {"stage": name, "inputs": values}
+    return Stage(name, run, inputs=tuple(inputs))
+
+
+def test_topological_order_respects_dependencies():
+    log = []
+    pipeline = Pipeline([
+        recording_stage("text", log, inputs=("analysis", "qr")),
+        recording_stage("analysis", log, inputs=("photos",)),
+        recording_stage("qr", log),
+    ])
+    order = pipeline.order
+    assert order.index("analysis") < order.index("text")
+    assert order.index("qr") < order.index("text")
+    assert pipeline.external_inputs == {"photos"}
+    assert pipeline.downstream("analysis") == ["analysis", "text"]
+
+
+def test_cycle_and_duplicate_stages_rejected():
+    with pytest.raises(ValueError):
+        Pipeline([recording_stage("a", [], inputs=("b",)), recording_stage("b", [], inputs=("a",))])
+    with pytest.raises(ValueError):
+        Pipeline([recording_stage("a", []), recording_stage("a", [])])
+
+
+def test_missing_external_input_rejected():
+    pipeline = Pipeline([recording_stage("analysis", [], inputs=("photos",))])
+    with pytest.raises(ValueError):
+        pipeline.start({})
+
+
+def test_stages_run_after_inputs_and_independent_stages_overlap():
+    log = []
+    pipeline = Pipeline([
+        recording_stage("analysis", log, inputs=("photos",), delay=0.02, result="analysis"),
+        recording_stage("qr", log, delay=0.02, result="qr"),
+        recording_stage("text", log, inputs=("analysis", "qr"), result="text"),
+    ])
+    run = pipeline.start({"photos": ["a.jpg"]})
+    values = asyncio.run(run.execute())
+
+    assert values["text"] == "text"
+    assert run.progress == 1.0
+    # 互不依赖的阶段同时开始，下游在所有输入完成后才开始
+    assert set(log[:2]) == {("start", "analysis"), ("start", "qr")}
+    assert log.index(("start", "text")) > log.index(("end", "analysis"))
+    assert log.index(("start", "text")) > log.index(("end", "qr"))
+
+
+def test_stage_receives_upstream_outputs():
+    async def combine(pipeline_run, analysis, photos):
+        return f"{analysis}:{len(photos)}"
+
+    async def analyse(pipeline_run, photos):
+        return "ok"
+
+    pipeline = Pipeline([
+        Stage("text", combine, inputs=("analysis", "photos")),
+        Stage("analysis", analyse, inputs=("photos",)),
+    ])
+    values = asyncio.run(pipeline.start({"photos": [1, 2]}).execute())
+    assert values["text"] == "ok:2"
+
+
+def test_failure_cancels_running_stages_and_skips_downstream():
+    log = []
+    cancelled = []
+
+    async def slow(pipeline_run):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def failing(pipeline_run):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("analysis failed")
+
+    pipeline = Pipeline([
+        Stage("slow", slow),
+        Stage("failing", failing),
+        recording_stage("text", log, inputs=("slow", "failing")),
+    ])
+    with pytest.raises(RuntimeError, match="analysis failed"):
+        asyncio.run(pipeline.start({}).execute())
+    assert cancelled == ["slow"]
+    assert log == []
+
+
+def test_progress_reports_reach_callback():
+    updates = []
+
+    async def work(pipeline_run):
+        pipeline_run.report_progress("work", 0.5, "处理中")
+        return "done"
+
+    pipeline = Pipeline([Stage("work", work, message="工作"), Stage("idle", work, weight=1.0)])
+    run = pipeline.start({}, on_update=lambda current: updates.append(current.progress))
+    asyncio.run(run.execute())
+    assert updates[-1] == 1.0
+    assert run.timings.keys() == {"work", "idle"}
@@ -0,0 +1,127 @@
+"""自适应限流器：令牌桶配额、截止时间、429降速与恢复、退避时间"""
+
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from agent.services.rate_limiter import (
+    AdaptiveRateLimiter,
+    DeadlineExceededError,
+    RateLimiterConfig,
+    current_deadline,
+    parse_retry_after,
+    task_deadline,
+)
+
+
+def make_limiter(**overrides) -> AdaptiveRateLimiter:
+    config = RateLimiterConfig(requests_per_minute=600.0, tokens_per_minute=60000.0, burst_seconds=1.0)
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return AdaptiveRateLimiter(config)
+
+
+def test_acquire_within_burst_does_not_wait():
+    async def scenario():
+        limiter = make_limiter()
+        started = time.monotonic()
+        for _ in range(10):
+            await limiter.acquire(tokens=100)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.1
+
+
+def test_acquire_waits_for_refill_when_bucket_empty():
+    async def scenario():
+        # 容量为10个请求，每0.1秒补充1个
+        limiter = make_limiter()
+        for _ in range(10):
+            await limiter.acquire()
+        started = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.05
+
+
+def test_acquire_fails_fast_when_wait_exceeds_deadline():
+    async def scenario():
+        limiter = make_limiter(requests_per_minute=6.0)
+        await limiter.acquire()
+        with pytest.raises(DeadlineExceededError):
+            await limiter.acquire(deadline=time.monotonic() + 0.5)
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["deadline_exceeded_count"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_rate_limited_halves_rate_and_success_recovers():
+    limiter = make_limiter()
+    limiter.on_rate_limited()
+    assert limiter.stats()["requests_per_minute"] == 300.0
+    assert limiter.stats()["rate_limited_count"] == 1
+
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.stats()["requests_per_minute"] == 600.0
+
+
+def test_rate_never_drops_below_floor():
+    limiter = make_limiter(min_rate_fraction=0.1)
+    for _ in range(20):
+        limiter.on_rate_limited()
+    assert limiter.stats()["requests_per_minute"] == 60.0
+
+
+def test_retry_after_blocks_new_requests():
+    limiter = make_limiter()
+    limiter.on_rate_limited(retry_after=5.0)
+    assert limiter.stats()["blocked_seconds"] > 4.0
+
+    async def scenario():
+        with pytest.raises(DeadlineExceededError):
+            await limiter.acquire(deadline=time.monotonic() + 1.0)
+
+    asyncio.run(scenario())
+
+
+def test_backoff_delay():
+    limiter = make_limiter(backoff_base_seconds=1.0, backoff_max_seconds=8.0)
+    assert limiter.backoff_delay(3, retry_after=2.5) == 2.5
+    for attempt in range(10):
+        assert 0.0 <= limiter.backoff_delay(attempt) <= min(8.0, 2 ** attempt)
+
+
+def test_task_deadline_context():
+    assert current_deadline() is None
+    with task_deadline(10):
+        assert current_deadline() > time.monotonic()
+    assert current_deadline() is None
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    # HTTP日期形式：已过去的时间不再等待，未来的时间换算为秒数
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert 8.0 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10.0
+
+
+def test_sleep_before_retry_uses_explicit_deadline():
+    limiter = make_limiter()
+
+    async def scenario():
+        with pytest.raises(DeadlineExceededError):
+            await limiter.sleep_before_retry(0, retry_after=5.0, deadline=time.monotonic() + 1.0)
+        await limiter.sleep_before_retry(0, retry_after=0.0, deadline=time.monotonic() + 1.0)
+
+    asyncio.run(scenario())
+    assert limiter.stats()["retry_count"] == 1
+    assert limiter.stats()["deadline_exceeded_count"] == 1
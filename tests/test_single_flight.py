@@ -0,0 +1,172 @@
+"""请求合并：相同键共享上游调用，等待者全部离开时取消上游，流式增量分发给每个等待者"""
+
+import asyncio
+
+import pytest
+
+from agent.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", upstream) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert results == ["result"] * 5
+    assert flight.stats() == {"in_flight": 0, "started": 1, "shared": 4, "cancelled": 0}
+
+
+def test_different_keys_are_not_merged():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def upstream(value):
+            await asyncio.sleep(0)
+            return value
+
+        results = await asyncio.gather(
+            flight.do("a", lambda: upstream("a")),
+            flight.do("b", lambda: upstream("b"))
+        )
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert results == ["a", "b"]
+    assert flight.started == 2
+
+
+def test_errors_propagate_to_every_waiter():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(
+            *(flight.do("key", upstream) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelling_one_waiter_keeps_upstream_running():
+    async def scenario():
+        flight = SingleFlight()
+        upstream_cancelled = False
+
+        async def upstream():
+            nonlocal upstream_cancelled
+            try:
+                await asyncio.sleep(0.05)
+                return "result"
+            except asyncio.CancelledError:
+                upstream_cancelled = True
+                raise
+
+        first = asyncio.ensure_future(flight.do("key", upstream))
+        second = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        return result, upstream_cancelled, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("result", False, True)
+
+
+def test_upstream_cancelled_when_last_waiter_leaves():
+    async def scenario():
+        flight = SingleFlight()
+        upstream_cancelled = asyncio.Event()
+
+        async def upstream():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                upstream_cancelled.set()
+                raise
+
+        waiter = asyncio.ensure_future(flight.do("key", upstream))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.wait_for(upstream_cancelled.wait(), 1)
+        return flight.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["cancelled"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_stream_chunks_fan_out_and_late_joiner_gets_draft():
+    async def scenario():
+        flight = SingleFlight()
+        first_joined = asyncio.Event()
+        second_joined = asyncio.Event()
+
+        async def upstream(on_chunk):
+            draft = ""
+            for chunk in ("你好", "，", "世界"):
+                draft += chunk
+                await on_chunk(chunk, draft)
+                if chunk == "你好":
+                    first_joined.set()
+                    await second_joined.wait()
+            return draft
+
+        received = {"first": [], "second": []}
+
+        first = asyncio.ensure_future(flight.do_stream(
+            "key", upstream, lambda chunk, draft: received["first"].append(chunk)
+        ))
+        await first_joined.wait()
+        second = asyncio.ensure_future(flight.do_stream(
+            "key", upstream, lambda chunk, draft: received["second"].append(chunk)
+        ))
+        await asyncio.sleep(0)
+        second_joined.set()
+        return await asyncio.gather(first, second), received, flight.started
+
+    results, received, started = asyncio.run(scenario())
+    assert results == ["你好，世界", "你好，世界"]
+    assert started == 1
+    assert received["first"] == ["你好", "，", "世界"]
+    # 中途加入的等待者先收到已生成的全部文本，之后只收到增量
+    assert received["second"] == ["你好，", "世界"]
+
+
+def test_stream_callback_error_does_not_break_other_waiters():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def upstream(on_chunk):
+            await asyncio.sleep(0)
+            await on_chunk("a", "a")
+            await on_chunk("b", "ab")
+            return "ab"
+
+        def failing(chunk, draft):
+            raise RuntimeError("client gone")
+
+        received = []
+        return await asyncio.gather(
+            flight.do_stream("key", upstream, failing),
+            flight.do_stream("key", upstream, lambda chunk, draft: received.append(chunk))
+        ), received
+
+    results, received = asyncio.run(scenario())
+    assert results == ["ab", "ab"]
+    assert received == ["a", "b"]
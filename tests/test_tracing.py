@@ -0,0 +1,47 @@
+"""链路追踪：文件导出器在后台线程批量写入，嵌套span共享trace"""
+
+import json
+import time
+
+from agent.services.tracing import FileSpanExporter, Tracer
+
+
+def test_file_exporter_writes_spans_in_background(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = FileSpanExporter(path=str(path), flush_interval=60)
+    tracer = Tracer(exporter)
+
+    with tracer.span("task", trace_id=tracer.new_trace_id(), stage="all") as root:
+        with tracer.span("analyze") as child:
+            child.set_attribute("images", 3)
+
+    # 导出只入队，写文件由后台线程在批次满、到期或关闭时完成
+    assert not path.exists()
+    tracer.shutdown()
+
+    spans = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [span["name"] for span in spans] == ["analyze", "task"]
+    assert spans[0]["trace_id"] == spans[1]["trace_id"] == root.trace_id
+    assert spans[0]["parent_id"] == root.span_id
+    assert spans[0]["attributes"] == {"images": 3}
+    assert exporter.dropped == 0
+
+
+def test_file_exporter_flushes_full_batches(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = FileSpanExporter(path=str(path), batch_size=2, flush_interval=60)
+    tracer = Tracer(exporter)
+
+    for i in range(2):
+        with tracer.span(f"span{i}", trace_id=tracer.new_trace_id()):
+            pass
+    # 批次已满，不等 flush_interval 到期就写入
+    def written():
+        return path.read_text(encoding="utf-8").splitlines() if path.exists() else []
+
+    deadline = time.monotonic() + 2
+    while len(written()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(written()) == 2
+    tracer.shutdown()